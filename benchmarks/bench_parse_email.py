@@ -0,0 +1,173 @@
+"""Benchmark the parsing of GACOS emails.
+
+A synthetic corpus of GACOS-style messages (plain text, HTML and multipart
+with both) is generated, and the messages are parsed with
+:func:`gacos.parse_email.parse_gacos_info` and
+:func:`gacos.parse_email.parse_gacos_info_fast`. The throughput of both
+parsers is reported in messages per second, and their results are checked to
+be the same.
+
+Usage::
+
+    python benchmarks/bench_parse_email.py -n 5000
+    python benchmarks/bench_parse_email.py -n 200 --write corpus_dir
+
+With ``--write``, the corpus is also saved as ``.eml`` files, which can be
+read by ``GACOSEmail.from_archive(corpus_dir)``.
+"""
+
+import argparse
+import email
+import random
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime
+from pathlib import Path
+
+import pandas as pd
+
+from gacos.parse_email import (
+    get_content,
+    iter_content,
+    parse_gacos_info,
+    parse_gacos_info_fast,
+)
+
+SENDER = "GACOS <gacos2017@foxmail.com>"
+
+HEADER = """Dear GACOS user,
+
+Thank you for using the Generic Atmospheric Correction Online Service for
+InSAR (GACOS). Your request has been processed and the results are ready.
+Please download your data from the following link within 7 days:
+
+({url})
+
+Request details
+---------------
+MinLat = {south}
+MaxLat = {north}
+MinLon = {west}
+MaxLon = {east}
+Time: {time}
+Dates requested:
+"""
+
+FOOTER = """
+If you use GACOS in your research, please cite the following papers:
+Yu, C., Li, Z., Penna, N. T., & Crippa, P. (2018). Generic atmospheric
+correction model for Interferometric Synthetic Aperture Radar observations.
+Journal of Geophysical Research: Solid Earth, 123(10), 9202-9222.
+
+Best regards,
+GACOS Team
+"""
+
+
+def make_body(rng: random.Random, n: int) -> str:
+    south = rng.randint(-60, 50)
+    west = rng.randint(-180, 170)
+    start = pd.Timestamp("2015-01-01") + pd.Timedelta(days=rng.randint(0, 3000))
+    dates = pd.date_range(start, periods=rng.randint(1, 20), freq="12D")
+    return (
+        HEADER.format(
+            url=f"http://www.gacos.net/result/{n:08d}.tar.gz",
+            south=south,
+            north=south + rng.randint(1, 5),
+            west=west,
+            east=west + rng.randint(1, 5),
+            time=round(rng.uniform(0, 24), 2),
+        )
+        + "\n".join(dates.strftime("%Y%m%d"))
+        + "\n"
+        + FOOTER
+    )
+
+
+def to_html(body: str) -> str:
+    return "<html><body><pre>\n" + body + "</pre></body></html>\n"
+
+
+def make_corpus(n_messages: int, seed: int = 0) -> list:
+    """Generate `n_messages` raw GACOS-style messages, in turn plain text,
+    HTML and multipart/alternative with both."""
+    rng = random.Random(seed)
+    messages = []
+    for n in range(n_messages):
+        body = make_body(rng, n)
+        kind = n % 3
+        if kind == 0:
+            msg = MIMEText(body, "plain", "utf-8")
+        elif kind == 1:
+            msg = MIMEText(to_html(body), "html", "utf-8")
+        else:
+            msg = MIMEMultipart("alternative")
+            msg.attach(MIMEText(body, "plain", "utf-8"))
+            msg.attach(MIMEText(to_html(body), "html", "utf-8"))
+        msg["From"] = SENDER
+        msg["Subject"] = "GACOS data"
+        msg["Date"] = format_datetime(
+            pd.Timestamp("2024-01-01", tz="UTC") + pd.Timedelta(hours=n)
+        )
+        messages.append(msg.as_string())
+    return messages
+
+
+def normalize(info):
+    """Drop duplicated dates so that both parsers can be compared."""
+    if info is None:
+        return None
+    return (*info[:6], list(dict.fromkeys(info[6])))
+
+
+def bench(name: str, func, messages: list, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(m) for m in messages]
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<40}{len(messages) / best:>12,.0f} msg/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--n-messages", type=int, default=3000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write", type=Path, help="save the corpus as .eml files")
+    args = parser.parse_args()
+
+    raws = make_corpus(args.n_messages, args.seed)
+    if args.write is not None:
+        args.write.mkdir(parents=True, exist_ok=True)
+        for n, raw in enumerate(raws):
+            (args.write / f"{n:08d}.eml").write_text(raw)
+
+    messages = [email.message_from_string(raw) for raw in raws]
+    bodies = [get_content(m) for m in messages]
+    print(f"{args.n_messages} messages, best of {args.repeat}")
+
+    print("body parsing:")
+    old = bench("  parse_gacos_info", parse_gacos_info, bodies, args.repeat)
+    new = bench("  parse_gacos_info_fast", parse_gacos_info_fast, bodies, args.repeat)
+    assert list(map(normalize, old)) == new, "parsers disagree"
+
+    print("end to end (MIME parsing, decoding and body parsing):")
+    bench(
+        "  parse_gacos_info",
+        lambda raw: parse_gacos_info(get_content(email.message_from_string(raw))),
+        raws,
+        args.repeat,
+    )
+    bench(
+        "  parse_gacos_info_fast",
+        lambda raw: parse_gacos_info_fast(iter_content(email.message_from_string(raw))),
+        raws,
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,3 +2,13 @@ from .datasets import LiCSARDataset, SarDataset, HyP3Dataset
 from .parse_email import GACOSEmail
 from .submit import Submitter
 from .download import Downloader
+from .catalog import UrlCatalog
+from .watch import GACOSWatcher
+from .rate import AdaptiveRateLimiter
+from .ledger import SubmissionLedger
+from .retry import RetryQueue
+from .plan import PatchPlanner
+from .merge import MergedDataset, merge_datasets
+from .cube import ZTDCube
+from .correct import ZTDCorrector
+from .sample import PointSampler
@@ -0,0 +1,221 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+catalog_suffixes = (".sqlite", ".sqlite3", ".db")
+
+
+def is_catalog_file(file: Union[Path, str]) -> bool:
+    """Whether a url file is a :class:`UrlCatalog` database, judged by its
+    suffix (one of ".sqlite", ".sqlite3" and ".db")."""
+    return Path(file).suffix.lower() in catalog_suffixes
+
+
+class UrlCatalog:
+    """A catalog of GACOS urls stored in a SQLite database.
+
+    The catalog has two tables: ``archives`` with one row per GACOS file (url,
+    south, north, west, east, time), and ``archive_dates`` with one row per
+    (url, date). Both are indexed on the columns used to filter urls (date,
+    time and bounding box), so that queries do not need to load the whole
+    catalog. Urls are unique: appending a url that is already in the catalog
+    is ignored.
+    """
+
+    columns = ["url", "south", "north", "west", "east", "time"]
+
+    def __init__(self, catalog_file: Union[Path, str]) -> None:
+        """Initialize UrlCatalog class
+
+        Parameters
+        ----------
+        catalog_file : Union[Path, str]
+            The path of the catalog database. It is created if not exists.
+        """
+        self.catalog_file = Path(catalog_file)
+        self._init_db()
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(catalog_file={self.catalog_file})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM archives").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.catalog_file, timeout=60)
+
+    def _init_db(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS archives (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT UNIQUE,
+                    south REAL,
+                    north REAL,
+                    west REAL,
+                    east REAL,
+                    time REAL
+                );
+                CREATE TABLE IF NOT EXISTS archive_dates (
+                    archive_id INTEGER REFERENCES archives (id),
+                    date TEXT,
+                    PRIMARY KEY (archive_id, date)
+                );
+                CREATE INDEX IF NOT EXISTS idx_archives_time ON archives (time);
+                CREATE INDEX IF NOT EXISTS idx_archives_bbox
+                    ON archives (west, east, south, north);
+                CREATE INDEX IF NOT EXISTS idx_archive_dates_date
+                    ON archive_dates (date);
+                """)
+
+    def append(self, gacos: Iterable[tuple]) -> int:
+        """Append GACOS urls to the catalog.
+
+        Parameters
+        ----------
+        gacos : Iterable[tuple]
+            The GACOS information returned by :func:`parse_gacos_info`, i.e.
+            tuples of (url, south, north, west, east, time, date_list).
+
+        Returns
+        -------
+        n : int
+            The number of urls added. Urls already in the catalog are ignored.
+        """
+        n = 0
+        with closing(self._connect()) as conn, conn:
+            for url, south, north, west, east, _time, date_list in gacos:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO archives "
+                    "(url, south, north, west, east, time) VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, south, north, west, east, _time),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                conn.executemany(
+                    "INSERT OR IGNORE INTO archive_dates VALUES (?, ?)",
+                    [(cursor.lastrowid, d) for d in date_list],
+                )
+                n += 1
+        return n
+
+    def _where(
+        self,
+        conn: sqlite3.Connection,
+        bounds: Optional[tuple[float, float, float, float]] = None,
+        times: Optional[Union[float, Sequence[float]]] = None,
+        dates: Optional[Sequence[str]] = None,
+        time_tolerance: float = 1 / 60 * 10,
+    ) -> tuple[str, list]:
+        """Build the WHERE clause on ``archives`` for the filters. Dates are
+        stored in a temporary table of `conn`."""
+        clauses, params = [], []
+        if bounds is not None:
+            west, south, east, north = bounds
+            clauses.append("west <= ? AND east >= ? AND south <= ? AND north >= ?")
+            params += [east, west, north, south]
+        if times is not None:
+            times = np.atleast_1d(np.asarray(times, dtype=float)).tolist()
+            clauses.append(
+                "(" + " OR ".join(["time BETWEEN ? AND ?"] * len(times)) + ")"
+            )
+            for t in times:
+                params += [t - time_tolerance, t + time_tolerance]
+        if dates is not None:
+            conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS query_dates (date TEXT PRIMARY KEY)"
+            )
+            conn.execute("DELETE FROM query_dates")
+            conn.executemany(
+                "INSERT OR IGNORE INTO query_dates VALUES (?)",
+                [(str(d),) for d in dates],
+            )
+            clauses.append(
+                "id IN (SELECT archive_id FROM archive_dates "
+                "JOIN query_dates USING (date))"
+            )
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def query(
+        self,
+        bounds: Optional[tuple[float, float, float, float]] = None,
+        times: Optional[Union[float, Sequence[float]]] = None,
+        dates: Optional[Sequence[str]] = None,
+        chunksize: Optional[int] = None,
+    ) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """Query urls from the catalog.
+
+        Parameters
+        ----------
+        bounds : Optional[tuple[float, float, float, float]], optional
+            Only return urls that intersect with bounds (W, S, E, N). Default
+            is None.
+        times : Optional[Union[float, Sequence[float]]], optional
+            Only return urls that acquisition time is within 10 minutes of
+            one of `times`. Default is None.
+        dates : Optional[Sequence[str]], optional
+            Only return urls that contain at least one of `dates` (YYYYMMDD).
+            Default is None.
+        chunksize : Optional[int], optional
+            If given, return an iterator of DataFrames with at most `chunksize`
+            rows instead of a single DataFrame. Default is None.
+
+        Returns
+        -------
+        df_urls : pd.DataFrame or Iterator[pd.DataFrame]
+            The urls with columns of url, south, north, west, east, time and
+            date, where date is the list of dates of each url.
+        """
+        if chunksize is None:
+            with closing(self._connect()) as conn:
+                where, params = self._where(conn, bounds, times, dates)
+                df_urls = pd.read_sql_query(
+                    f"SELECT * FROM archives{where} ORDER BY id", conn, params=params
+                )
+                return self._attach_dates(conn, df_urls)
+        return self._query_chunks(bounds, times, dates, chunksize)
+
+    def _query_chunks(self, bounds, times, dates, chunksize):
+        with closing(self._connect()) as conn:
+            where, params = self._where(conn, bounds, times, dates)
+            for df_urls in pd.read_sql_query(
+                f"SELECT * FROM archives{where} ORDER BY id",
+                conn,
+                params=params,
+                chunksize=chunksize,
+            ):
+                yield self._attach_dates(conn, df_urls)
+
+    def _attach_dates(
+        self, conn: sqlite3.Connection, df_urls: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Add the date list of each url to `df_urls` and drop the id column."""
+        ids = df_urls["id"].astype(int).tolist()
+        dates = {i: [] for i in ids}
+        for start in range(0, len(ids), 900):
+            chunk = ids[start : start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            for archive_id, date in conn.execute(
+                "SELECT archive_id, date FROM archive_dates "
+                f"WHERE archive_id IN ({placeholders}) ORDER BY archive_id, date",
+                chunk,
+            ):
+                dates[archive_id].append(date)
+        df_urls["date"] = [dates[i] for i in ids]
+        return df_urls.drop(columns="id")
+
+    def read(
+        self, chunksize: Optional[int] = None
+    ) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """Read all urls from the catalog. See :meth:`query` for details."""
+        return self.query(chunksize=chunksize)
@@ -0,0 +1,385 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import rasterio
+from rasterio.warp import Resampling, reproject
+from rasterio.windows import Window
+from tqdm.auto import tqdm
+
+from .cube import ZTDCube
+from .datasets import HyP3Dataset, LiCSARDataset
+from .index import ProductIndex
+
+
+def _resample_raster(
+    files: Sequence[Union[Path, str]],
+    transform: rasterio.Affine,
+    crs,
+    shape: tuple[int, int],
+) -> np.ndarray:
+    """Resample (and mosaic) the first band of rasters to a grid with bilinear
+    interpolation. Where rasters overlap, the first one wins. Pixels not
+    covered are NaN."""
+    arr = np.full(shape, np.nan, dtype="float32")
+    tmp = np.empty_like(arr)
+    for file in files:
+        with rasterio.open(file) as src:
+            tmp.fill(np.nan)
+            reproject(
+                rasterio.band(src, 1),
+                tmp,
+                src_nodata=src.nodata,
+                dst_transform=transform,
+                dst_crs=crs,
+                dst_nodata=np.nan,
+                resampling=Resampling.bilinear,
+            )
+        fill = np.isnan(arr)
+        arr[fill] = tmp[fill]
+    return arr
+
+
+class GridCache:
+    """A least recently used cache of arrays, bounded by the total number of
+    bytes of the arrays instead of their number."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """Initialize GridCache class
+
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum total size of the cached arrays in bytes. The most
+            recently added array is always kept, even if it is larger.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._arrays = OrderedDict()
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(arrays={len(self)}, "
+            f"nbytes={self.nbytes}, max_bytes={self.max_bytes}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        return len(self._arrays)
+
+    def __contains__(self, key) -> bool:
+        return key in self._arrays
+
+    def get(self, key) -> Optional[np.ndarray]:
+        """Return the cached array of a key, or None if it is not cached."""
+        arr = self._arrays.get(key)
+        if arr is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._arrays.move_to_end(key)
+        return arr
+
+    def put(self, key, arr: np.ndarray) -> None:
+        """Cache an array, evicting the least recently used arrays to stay
+        within :attr:`max_bytes`."""
+        if key in self._arrays:
+            self.nbytes -= self._arrays.pop(key).nbytes
+        self._arrays[key] = arr
+        self.nbytes += arr.nbytes
+        while self.nbytes > self.max_bytes and len(self._arrays) > 1:
+            _, evicted = self._arrays.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+
+class ZTDCorrector:
+    """Compute the tropospheric delay difference of interferograms from
+    GACOS ZTD.
+
+    For each pair (date1, date2), the correction is the difference of the ZTD
+    of date2 and date1, resampled to the grid of the interferograms and
+    projected to the line of sight (LOS) by dividing by the up component of
+    the LOS unit vector (the cosine of the incidence angle).
+
+    Pairs are processed in blocks in chronological order. The ZTD
+    grids of the dates are resampled once and kept in a :class:`GridCache`
+    bounded by `cache_size`, so a date shared by many pairs is not read again
+    while it stays in the cache. A block has at most `block_size` pairs, and
+    no more dates than the grids that fit in the cache, so the grids of a
+    block are the most recent entries of the cache. Within a block, the
+    corrections of all pairs are computed at once for a strip of `tile_size`
+    rows, and written to disk strip by strip. The memory used is therefore
+    bounded by `cache_size` plus the strips of one block (and at least two
+    grids, if `cache_size` is smaller).
+    """
+
+    #: the size of the internal tiles of the output GeoTIFFs
+    tiff_block_size = 256
+
+    def __init__(
+        self,
+        source: Union[ZTDCube, ProductIndex],
+        pairs: Union[np.ndarray, Sequence[tuple[str, str]]],
+        transform: rasterio.Affine,
+        crs,
+        shape: tuple[int, int],
+        los_up: Optional[Union[float, np.ndarray, Path, str]] = None,
+        wavelength: Optional[float] = None,
+        cache_size: int = 2**30,
+        block_size: int = 32,
+        tile_size: Optional[int] = None,
+    ) -> None:
+        """Initialize ZTDCorrector class
+
+        Parameters
+        ----------
+        source : Union[ZTDCube, ProductIndex]
+            The ZTD of dates: a :class:`ZTDCube`, or the
+            :class:`ProductIndex` of the downloaded GACOS products.
+        pairs : Union[np.ndarray, Sequence[tuple[str, str]]]
+            The pairs of dates (YYYYMMDD) of the interferograms.
+        transform : rasterio.Affine
+            The affine transform of the grid of the interferograms.
+        crs : Any
+            The coordinate reference system of the grid of the interferograms.
+        shape : tuple[int, int]
+            The shape (height, width) of the grid of the interferograms.
+        los_up : Optional[Union[float, np.ndarray, Path, str]], optional
+            The up component of the LOS unit vector: a number, an array of
+            `shape`, or a raster that is resampled to the grid (e.g. the
+            ``*.geo.U.tif`` of LiCSAR). If None, the zenith delay difference is
+            computed. Default is None.
+        wavelength : Optional[float], optional
+            The radar wavelength in meters. If given, the corrections are
+            converted from meters to radians of phase (``4 * pi / wavelength``
+            times the delay). Default is None, which means meters.
+        cache_size : int, optional
+            The maximum size in bytes of the cached ZTD grids. Default is 1 GiB.
+        block_size : int, optional
+            The maximum number of pairs computed together. Blocks are smaller
+            if the grids of their dates do not fit in `cache_size`. Default is
+            32.
+        tile_size : Optional[int], optional
+            The number of rows of the strips written to disk, rounded up to a
+            multiple of :attr:`tiff_block_size`, so that each internal tile of
+            the output is written once. If None, :attr:`tiff_block_size` is
+            used. Default is None.
+        """
+        self.source = source
+        pairs = np.asarray(pairs, dtype=str).reshape(-1, 2)
+        self.pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self.transform = transform
+        self.crs = crs
+        self.shape = tuple(shape)
+        self.block_size = block_size
+        if tile_size is None:
+            tile_size = self.tiff_block_size
+        self.tile_size = -(-tile_size // self.tiff_block_size) * self.tiff_block_size
+        self.cache = GridCache(cache_size)
+
+        self.scale = 1.0 if wavelength is None else 4 * np.pi / wavelength
+        if isinstance(los_up, (str, Path)):
+            los_up = _resample_raster([los_up], transform, crs, self.shape)
+        if los_up is not None:
+            los_up = np.asarray(los_up, dtype="float32")
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.scale = np.where(los_up > 0, self.scale / los_up, np.nan)
+        self.scale = np.broadcast_to(np.asarray(self.scale, "float32"), self.shape)
+
+        self._products = None
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(pairs={len(self.pairs)}, "
+            f"shape={self.shape}, cache={self.cache})"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @classmethod
+    def from_dataset(
+        cls,
+        dataset: Union[LiCSARDataset, HyP3Dataset],
+        source: Optional[Union[ZTDCube, ProductIndex]] = None,
+        **kwargs,
+    ) -> "ZTDCorrector":
+        """Create a corrector for the interferograms of a LiCSAR or HyP3
+        dataset. The grid is the one of the first interferogram, and the LOS
+        is read from the ``*.geo.U.tif`` of LiCSAR or the ``*lv_theta.tif``
+        of HyP3 if they exist.
+
+        Parameters
+        ----------
+        dataset : Union[LiCSARDataset, HyP3Dataset]
+            The dataset of the interferograms.
+        source : Optional[Union[ZTDCube, ProductIndex]], optional
+            The ZTD of dates. If None, the :attr:`SarDataset.index` of the
+            dataset is used, which requires its gacos_dir. Default is None.
+        **kwargs
+            Other parameters of :class:`ZTDCorrector`.
+        """
+        if source is None:
+            source = dataset.index
+        if source is None:
+            raise ValueError("source is required if the dataset has no gacos_dir.")
+        unw_files = dataset._unw_files()
+        if len(unw_files) == 0:
+            raise FileNotFoundError(f"No interferograms found in {dataset.home_dir}")
+        with rasterio.open(unw_files[0]) as src:
+            transform, crs, shape = src.transform, src.crs, src.shape
+
+        if "los_up" not in kwargs:
+            if isinstance(dataset, LiCSARDataset):
+                kwargs["los_up"] = dataset._los_up_file()
+            else:
+                # the elevation angle of the look vector, in radians
+                files = sorted(dataset.home_dir.rglob("*lv_theta.tif"))
+                if files:
+                    theta = _resample_raster(files[:1], transform, crs, shape)
+                    kwargs["los_up"] = np.sin(theta)
+        return cls(source, dataset.pairs, transform, crs, shape, **kwargs)
+
+    def _products_of(self, date: str) -> list[str]:
+        if self._products is None:
+            self.source.refresh()
+            df = self.source.query(np.unique(self.pairs))
+            self._products = df.groupby("date")["path"].apply(list).to_dict()
+        return self._products.get(date, [])
+
+    def _resample(self, date: str) -> np.ndarray:
+        """Resample the ZTD of a date to the grid of the interferograms."""
+        if isinstance(self.source, ZTDCube):
+            if date not in self.source:
+                return np.full(self.shape, np.nan, dtype="float32")
+            arr = np.full(self.shape, np.nan, dtype="float32")
+            reproject(
+                np.asarray(self.source[date], dtype="float32"),
+                arr,
+                src_transform=self.source.transform,
+                src_crs=self.source.crs,
+                src_nodata=np.nan,
+                dst_transform=self.transform,
+                dst_crs=self.crs,
+                dst_nodata=np.nan,
+                resampling=Resampling.bilinear,
+            )
+            return arr
+        return _resample_raster(
+            self._products_of(date), self.transform, self.crs, self.shape
+        )
+
+    def ztd(self, date: str) -> np.ndarray:
+        """The ZTD of a date on the grid of the interferograms, from the cache
+        if possible."""
+        arr = self.cache.get(date)
+        if arr is None:
+            arr = self._resample(date)
+            self.cache.put(date, arr)
+        return arr
+
+    def correction(self, date1: str, date2: str) -> np.ndarray:
+        """Compute the correction of one pair in memory."""
+        return (self.ztd(date2) - self.ztd(date1)) * self.scale
+
+    @property
+    def max_block_dates(self) -> int:
+        """The maximum number of dates of a block, so that the ZTD grids of a
+        block fit in the cache. At least the two dates of a pair."""
+        grid_bytes = int(np.prod(self.shape)) * np.dtype("float32").itemsize
+        return max(2, self.cache.max_bytes // grid_bytes)
+
+    def _blocks(self, todo: list[int]):
+        """Split the pairs to compute into consecutive blocks of at most
+        `block_size` pairs and :attr:`max_block_dates` dates."""
+        block, dates = [], set()
+        for i in todo:
+            new_dates = dates | set(self.pairs[i])
+            if block and (
+                len(block) >= self.block_size or len(new_dates) > self.max_block_dates
+            ):
+                yield block
+                block, new_dates = [], set(self.pairs[i])
+            block.append(i)
+            dates = new_dates
+        if block:
+            yield block
+
+    def run(
+        self,
+        output_dir: Union[Path, str],
+        suffix: str = ".ztd_diff.tif",
+        overwrite: bool = False,
+    ) -> list[Path]:
+        """Compute the corrections of all pairs and write them to GeoTIFFs
+        named ``{date1}_{date2}{suffix}``.
+
+        Parameters
+        ----------
+        output_dir : Union[Path, str]
+            The directory to save the corrections to.
+        suffix : str, optional
+            The suffix of the output files. Default is ".ztd_diff.tif".
+        overwrite : bool, optional
+            Whether to compute again the pairs whose output exists. Default is
+            False.
+
+        Returns
+        -------
+        files : list[Path]
+            The output files of all pairs.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        files = [output_dir / f"{d1}_{d2}{suffix}" for d1, d2 in self.pairs]
+        todo = [i for i, f in enumerate(files) if overwrite or not f.exists()]
+        if len(todo) < len(files):
+            tqdm.write(f"Skip {len(files) - len(todo)} pairs computed before.")
+
+        height, width = self.shape
+        profile = {
+            "driver": "GTiff",
+            "height": height,
+            "width": width,
+            "count": 1,
+            "dtype": "float32",
+            "crs": self.crs,
+            "transform": self.transform,
+            "nodata": np.nan,
+            "compress": "deflate",
+        }
+        tiff_block = self.tiff_block_size
+        if height >= tiff_block and width >= tiff_block:
+            profile.update(tiled=True, blockxsize=tiff_block, blockysize=tiff_block)
+
+        with tqdm(total=len(todo), unit="pair", desc="Correcting") as pbar:
+            for block in self._blocks(todo):
+                pairs = self.pairs[block]
+                dates, idx = np.unique(pairs, return_inverse=True)
+                idx = idx.reshape(-1, 2)
+                grids = [self.ztd(d) for d in dates]
+                # write to temporary files, so interrupted pairs are computed
+                # again in the next run
+                tmp_files = [files[i].with_suffix(".tmp") for i in block]
+                dsts = [rasterio.open(f, "w", **profile) for f in tmp_files]
+                try:
+                    for row in range(0, height, self.tile_size):
+                        rows = slice(row, min(row + self.tile_size, height))
+                        stack = np.stack([g[rows] for g in grids])
+                        diff = (stack[idx[:, 1]] - stack[idx[:, 0]]) * self.scale[rows]
+                        window = Window(0, row, width, rows.stop - row)
+                        for dst, arr in zip(dsts, diff):
+                            dst.write(arr, 1, window=window)
+                finally:
+                    for dst in dsts:
+                        dst.close()
+                for i, tmp_file in zip(block, tmp_files):
+                    tmp_file.replace(files[i])
+                pbar.update(len(block))
+        return files
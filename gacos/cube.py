@@ -0,0 +1,372 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import Resampling, reproject
+from rasterio.windows import Window
+from tqdm.auto import tqdm
+
+from .index import ProductIndex
+
+
+class ZTDCube:
+    """A time-series cube of GACOS ZTD resampled to a common grid, stored as
+    chunks of memory-mapped ``.npy`` files.
+
+    The cube is a directory with one ``chunk_XXXX.npy`` file per `chunk_size`
+    dates, each of shape (chunk_size, height, width), and a ``cube.json`` file
+    recording the grid (bounds, resolution, shape) and the date index, i.e.
+    the chunk and slot of each date. Dates are appended to the last chunk, so
+    ingesting new dates never rewrites the dates already in the cube. The date
+    index is only updated after the data of the new dates are flushed, so an
+    interrupted ingestion leaves the cube consistent.
+
+    Reading the whole stack, or a window of it, is one read per chunk instead
+    of one file open per date.
+
+    .. note::
+        Only one process should ingest into a cube at a time.
+    """
+
+    meta_name = "cube.json"
+
+    def __init__(
+        self,
+        cube_dir: Union[Path, str],
+        bounds: Optional[tuple[float, float, float, float]] = None,
+        res: Optional[float] = None,
+        chunk_size: int = 64,
+        dtype: str = "float32",
+    ) -> None:
+        """Initialize ZTDCube class
+
+        Parameters
+        ----------
+        cube_dir : Union[Path, str]
+            The directory of the cube. An existing cube in this directory is
+            opened, otherwise a new cube is created.
+        bounds : Optional[tuple[float, float, float, float]], optional
+            The bounds (W, S, E, N) of the grid in degrees. Required to create
+            a cube. For an existing cube, it must match the bounds of the cube
+            if given. Default is None.
+        res : Optional[float], optional
+            The resolution of the grid in degrees. If None, the resolution of
+            the first ingested product is used. Ignored for an existing cube.
+            Default is None.
+        chunk_size : int, optional
+            The number of dates in one chunk file. Ignored for an existing
+            cube. Default is 64.
+        dtype : str, optional
+            The data type of the cube. Ignored for an existing cube. Default is
+            "float32".
+        """
+        self.cube_dir = Path(cube_dir)
+        self.meta_file = self.cube_dir / self.meta_name
+        if self.meta_file.exists():
+            with open(self.meta_file) as f:
+                self._meta = json.load(f)
+            if bounds is not None and not np.allclose(
+                [float(bounds[i]) for i in range(4)], self._meta["bounds"]
+            ):
+                raise ValueError(
+                    f"bounds {tuple(bounds)} do not match the bounds "
+                    f"{tuple(self._meta['bounds'])} of the cube in {self.cube_dir}"
+                )
+        else:
+            if bounds is None:
+                raise ValueError("bounds is required to create a cube.")
+            if chunk_size < 1:
+                raise ValueError("chunk_size must be at least 1.")
+            self._meta = {
+                "bounds": [float(bounds[i]) for i in range(4)],
+                "res": None if res is None else float(res),
+                "shape": None,
+                "chunk_size": int(chunk_size),
+                "dtype": str(np.dtype(dtype)),
+                "dates": [],
+            }
+        size = self._meta["chunk_size"]
+        # the chunk and slot of each date
+        self._slots = {d: divmod(i, size) for i, d in enumerate(self._meta["dates"])}
+        self._chunks = {}
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(cube_dir={self.cube_dir}, "
+            f"shape={self.shape}, dates={len(self.dates)})"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        return len(self._meta["dates"])
+
+    def __contains__(self, date: str) -> bool:
+        return str(date) in self._slots
+
+    def __getitem__(self, date: str) -> np.ndarray:
+        """The ZTD grid of a date, as a read-only memory map."""
+        if date not in self:
+            raise KeyError(date)
+        chunk, slot = self._slots[str(date)]
+        return self._chunk(chunk)[slot]
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        """The bounds (W, S, E, N) of the grid."""
+        return tuple(self._meta["bounds"])
+
+    @property
+    def res(self) -> Optional[float]:
+        """The resolution of the grid in degrees, or None if nothing has been
+        ingested yet."""
+        return self._meta["res"]
+
+    @property
+    def shape(self) -> Optional[tuple[int, int]]:
+        """The shape (height, width) of the grid, or None if nothing has been
+        ingested yet."""
+        shape = self._meta["shape"]
+        return None if shape is None else tuple(shape)
+
+    @property
+    def transform(self) -> Optional[rasterio.Affine]:
+        """The affine transform of the grid (EPSG:4326)."""
+        if self.res is None:
+            return None
+        west, _, _, north = self.bounds
+        return from_origin(west, north, self.res, self.res)
+
+    @property
+    def crs(self) -> str:
+        """The coordinate reference system of the grid."""
+        return "EPSG:4326"
+
+    @property
+    def dates(self) -> np.ndarray:
+        """The dates (YYYYMMDD) in the cube, sorted."""
+        return np.sort(np.array(self._meta["dates"], dtype=str))
+
+    def iter_chunks(
+        self, dates: Sequence[str]
+    ) -> Iterator[tuple[np.ndarray, np.memmap, np.ndarray]]:
+        """Group dates by the chunk that stores them, so that the dates of a
+        chunk can be read together.
+
+        Parameters
+        ----------
+        dates : Sequence[str]
+            The dates (YYYYMMDD). Dates not in the cube are skipped.
+
+        Yields
+        ------
+        idx : np.ndarray
+            The positions in `dates` of the dates stored in the chunk.
+        chunk : np.memmap
+            The chunk as a read-only memory map of shape (chunk_size, height,
+            width).
+        slots : np.ndarray
+            The slots of the dates in the chunk, i.e. ``chunk[slots]`` are the
+            grids of the dates at `idx`.
+        """
+        positions = np.array(
+            [self._slots.get(str(d), (-1, -1)) for d in dates], dtype=int
+        ).reshape(-1, 2)
+        for chunk in np.unique(positions[positions[:, 0] >= 0, 0]):
+            idx = np.where(positions[:, 0] == chunk)[0]
+            yield idx, self._chunk(int(chunk)), positions[idx, 1]
+
+    def _chunk_file(self, chunk: int) -> Path:
+        return self.cube_dir / f"chunk_{chunk:04d}.npy"
+
+    def _chunk(self, chunk: int, mode: str = "r") -> np.memmap:
+        key = (chunk, mode)
+        if key not in self._chunks:
+            file = self._chunk_file(chunk)
+            if mode == "r+" and not file.exists():
+                self._chunks[key] = np.lib.format.open_memmap(
+                    file,
+                    mode="w+",
+                    dtype=self._meta["dtype"],
+                    shape=(self._meta["chunk_size"], *self.shape),
+                )
+            else:
+                self._chunks[key] = np.load(file, mmap_mode=mode)
+        return self._chunks[key]
+
+    def _init_grid(self, product: Union[Path, str]) -> None:
+        """Set the resolution (if unknown) and shape of the grid."""
+        if self.res is None:
+            with rasterio.open(product) as src:
+                self._meta["res"] = float(abs(src.res[0]))
+        west, south, east, north = self.bounds
+        self._meta["shape"] = [
+            max(1, int(round((north - south) / self.res))),
+            max(1, int(round((east - west) / self.res))),
+        ]
+
+    def _save_meta(self) -> None:
+        tmp_file = self.meta_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def resample(self, products: Sequence[Union[Path, str]]) -> np.ndarray:
+        """Resample (and mosaic) the products of a date to the grid of the
+        cube with bilinear interpolation. Pixels not covered are NaN.
+
+        Parameters
+        ----------
+        products : Sequence[Union[Path, str]]
+            The products of the date. Where they overlap, the first product
+            wins.
+
+        Returns
+        -------
+        arr : np.ndarray
+            The resampled ZTD of shape (height, width).
+        """
+        if self.shape is None:
+            self._init_grid(products[0])
+        arr = np.full(self.shape, np.nan, dtype="float32")
+        tmp = np.empty_like(arr)
+        for product in products:
+            with rasterio.open(product) as src:
+                tmp.fill(np.nan)
+                reproject(
+                    rasterio.band(src, 1),
+                    tmp,
+                    src_nodata=src.nodata,
+                    dst_transform=self.transform,
+                    dst_crs=self.crs,
+                    dst_nodata=np.nan,
+                    resampling=Resampling.bilinear,
+                )
+            fill = np.isnan(arr)
+            arr[fill] = tmp[fill]
+        return arr
+
+    def ingest(self, products: Union[dict, pd.Series]) -> list[str]:
+        """Append the dates that are not in the cube yet.
+
+        Parameters
+        ----------
+        products : Union[dict, pd.Series]
+            The paths of the products of each date (YYYYMMDD), e.g. the
+            products column of :meth:`ProductIndex.coverage`.
+
+        Returns
+        -------
+        dates : list[str]
+            The dates ingested.
+        """
+        products = {
+            str(d): list(p) for d, p in dict(products).items() if str(d) not in self
+        }
+        products = {d: p for d, p in products.items() if len(p) > 0}
+        if len(products) == 0:
+            return []
+        self.cube_dir.mkdir(parents=True, exist_ok=True)
+
+        ingested = []
+        chunks = set()
+        size = self._meta["chunk_size"]
+        try:
+            for date in tqdm(sorted(products), unit="date", desc="Ingesting ZTD"):
+                arr = self.resample(products[date])
+                chunk, slot = divmod(len(self._meta["dates"]) + len(ingested), size)
+                self._chunk(chunk, "r+")[slot] = arr
+                chunks.add(chunk)
+                ingested.append(date)
+        finally:
+            # publish the dates only after their data are on disk
+            for chunk in chunks:
+                self._chunk(chunk, "r+").flush()
+            for date in ingested:
+                self._slots[date] = divmod(len(self._meta["dates"]), size)
+                self._meta["dates"].append(date)
+            self._save_meta()
+        return ingested
+
+    def ingest_index(
+        self,
+        index: ProductIndex,
+        dates: Optional[Iterable[str]] = None,
+        min_coverage: float = 1 - 1e-9,
+    ) -> list[str]:
+        """Append the dates of indexed products that cover the bounds of the
+        cube and are not in the cube yet. The index is refreshed first.
+
+        Parameters
+        ----------
+        index : ProductIndex
+            The index of the downloaded products.
+        dates : Optional[Iterable[str]], optional
+            Only ingest these dates (YYYYMMDD). If None, all indexed dates are
+            considered. Default is None.
+        min_coverage : float, optional
+            The minimum fraction of the bounds the products of a date must
+            cover to be ingested. Default is 1 (fully covered).
+
+        Returns
+        -------
+        dates : list[str]
+            The dates ingested.
+        """
+        index.refresh()
+        if dates is None:
+            dates = index.dates
+        dates = [str(d) for d in dates if str(d) not in self]
+        if len(dates) == 0:
+            return []
+        df_coverage = index.coverage(self.bounds, dates)
+        df_coverage = df_coverage[df_coverage["coverage"] >= min_coverage]
+        return self.ingest(df_coverage["products"])
+
+    def read(
+        self,
+        dates: Optional[Iterable[str]] = None,
+        window: Optional[Window] = None,
+    ) -> np.ndarray:
+        """Read the ZTD of dates.
+
+        Parameters
+        ----------
+        dates : Optional[Iterable[str]], optional
+            The dates (YYYYMMDD) to read, in the order of the output. If None,
+            all dates in :attr:`dates` are read. Default is None.
+        window : Optional[Window], optional
+            The window of the grid to read. If None, the whole grid is read.
+            Default is None.
+
+        Returns
+        -------
+        arr : np.ndarray
+            The ZTD of shape (n_dates, height, width).
+        """
+        if dates is None:
+            dates = self.dates
+        dates = [str(d) for d in dates]
+        missing = [d for d in dates if d not in self]
+        if missing:
+            raise KeyError(f"dates not in the cube: {missing}")
+        if window is None:
+            rows, cols = slice(None), slice(None)
+        else:
+            rows, cols = window.toslices()
+
+        height = len(range(*rows.indices(self.shape[0])))
+        width = len(range(*cols.indices(self.shape[1])))
+        out = np.empty((len(dates), height, width), dtype=self._meta["dtype"])
+        for idx, chunk, slots in self.iter_chunks(dates):
+            # read the contiguous span of slots once, then pick the dates
+            start, stop = slots.min(), slots.max() + 1
+            block = chunk[start:stop, rows, cols]
+            out[idx] = block[slots - start]
+        return out
@@ -1,15 +1,31 @@
+import fnmatch
+import hashlib
+import json
+import os
 import warnings
 from pathlib import Path
 from typing import Literal, Optional, Union
 
 import numpy as np
 import pandas as pd
+import rasterio
 from faninsar.datasets import HyP3, LiCSAR
+from rasterio.merge import merge
+from rasterio.warp import transform_bounds
+
+from .cube import ZTDCube
+from .index import ProductIndex, state_file
+from .ledger import SubmissionLedger, match_time_tolerance
+from .plan import PatchPlanner, SubmissionPlan
 
 warnings.filterwarnings("ignore")
 
 
 class SarDataset:
+    # the default tolerance in minutes of merging acquisition times into one
+    # request time, see :meth:`plan_patches`
+    time_tolerance: float = 0
+
     def __init__(
         self,
         bounds: tuple[float, float, float, float],
@@ -26,7 +42,9 @@ class SarDataset:
             The datetime index of the dataset.
         gacos_dir : Optional[Union[Path, str]], optional
             The directory used to save gacos data. Used to check if the data is
-            already downloaded and avoid resubmitting. Default is None.
+            already downloaded and avoid resubmitting. The
+            :class:`SubmissionLedger` of submitted dates is also kept in the
+            ``.gacos`` state directory under it. Default is None.
         """
         self.bounds = bounds
         self._date_times = date_times
@@ -35,8 +53,14 @@ class SarDataset:
 
         if gacos_dir is not None:
             self._dates_remain = self._get_dates_remain(gacos_dir)
+            self.ledger = SubmissionLedger(
+                state_file(gacos_dir, SubmissionLedger.ledger_name)
+            )
         else:
             self._dates_remain = self.dates
+            self.ledger = None
+            self.index = None
+            self._coverage = None
 
         hour = date_times.hour
         minute = np.round((date_times.second / 60) + date_times.minute).astype(int)
@@ -59,6 +83,10 @@ class SarDataset:
 
     def _get_dates_remain(self, gacos_dir: Union[Path, str]):
         """Get the dates that are not downloaded yet.
+
+        A date is downloaded if the products of the date in `gacos_dir` cover
+        the bounds of the dataset, whichever area they were requested for.
+
         Parameters
         ----------
         gacos_dir : Union[Path, str]
@@ -70,13 +98,11 @@ class SarDataset:
         dates_remain : np.ndarray
             The dates that are not downloaded yet.
         """
-        gacos_files = list(Path(gacos_dir).rglob("*.ztd.tif"))
-        gacos_dates = []
-        for i in gacos_files:
-            stem = i.stem.split(".")[0]
-            if len(stem) == 8:
-                gacos_dates.append(stem)
-        dates_remain = np.setdiff1d(self.dates, gacos_dates)
+        self.index = ProductIndex(gacos_dir)
+        self.index.refresh()
+        self._coverage = self.index.coverage(self.bounds, np.unique(self.dates))
+        covered = self._coverage.index[self._coverage["coverage"] >= 1 - 1e-9]
+        dates_remain = np.setdiff1d(self.dates, covered)
         return dates_remain
 
     def _get_times_remain(self):
@@ -106,24 +132,165 @@ class SarDataset:
         dates_remain is the same as dates."""
         return self._dates_remain
 
+    @property
+    def coverage(self) -> Optional[pd.DataFrame]:
+        """The coverage of the dataset bounds by the products in gacos_dir,
+        indexed by date, with columns of coverage (the covered fraction from 0
+        to 1) and products (the paths of the products intersecting with the
+        bounds). Dates with a coverage between 0 and 1 are partially covered,
+        and are in :attr:`dates_remain`. None if gacos_dir is None."""
+        return self._coverage
+
+    def crop_products(
+        self,
+        output_dir: Union[Path, str],
+        suffix: str = ".ztd.tif",
+    ) -> list[Path]:
+        """Crop (and mosaic if needed) the products in gacos_dir that cover the
+        dataset bounds, so that products of larger areas are reused instead of
+        requested again.
+
+        Parameters
+        ----------
+        output_dir : Union[Path, str]
+            The directory to save the cropped products to.
+        suffix : str, optional
+            The suffix of the cropped products. Default is ".ztd.tif".
+
+        Returns
+        -------
+        files : list[Path]
+            The cropped products.
+        """
+        if self._coverage is None:
+            raise ValueError("gacos_dir is required to crop products.")
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        bounds = tuple(float(self.bounds[i]) for i in range(4))
+        files = []
+        df_covered = self._coverage[self._coverage["coverage"] >= 1 - 1e-9]
+        for date, products in df_covered["products"].items():
+            sources = [rasterio.open(p) for p in products]
+            try:
+                arr, transform = merge(sources, bounds=bounds)
+                profile = sources[0].profile.copy()
+            finally:
+                for src in sources:
+                    src.close()
+            profile.update(
+                driver="GTiff",
+                height=arr.shape[1],
+                width=arr.shape[2],
+                transform=transform,
+            )
+            file = output_dir / f"{date}{suffix}"
+            with rasterio.open(file, "w", **profile) as dst:
+                dst.write(arr)
+            files.append(file)
+        return files
+
+    def build_cube(
+        self,
+        cube_dir: Optional[Union[Path, str]] = None,
+        res: Optional[float] = None,
+        chunk_size: int = 64,
+    ) -> ZTDCube:
+        """Ingest the products in gacos_dir into a :class:`ZTDCube` on the
+        grid of the dataset bounds. Only the dates fully covered by the
+        products and not in the cube yet are ingested, so the cube can be
+        updated after each download.
+
+        Parameters
+        ----------
+        cube_dir : Optional[Union[Path, str]], optional
+            The directory of the cube. If None, ``ztd_cube`` under gacos_dir
+            is used. Default is None.
+        res : Optional[float], optional
+            The resolution of the grid in degrees of a new cube. If None, the
+            resolution of the products is used. Default is None.
+        chunk_size : int, optional
+            The number of dates in one chunk file of a new cube. Default is 64.
+
+        Returns
+        -------
+        cube : ZTDCube
+            The cube.
+        """
+        if self.index is None:
+            raise ValueError("gacos_dir is required to build a cube.")
+        if cube_dir is None:
+            cube_dir = self.index.gacos_dir / "ztd_cube"
+        cube = ZTDCube(cube_dir, self.bounds, res, chunk_size)
+        cube.ingest_index(self.index, np.unique(self.dates))
+        return cube
+
     @property
     def times_remain(self):
         """The times corresponding to the dates that are not downloaded yet."""
         return self._times_remain
 
-    def gen_datetime_patches(
+    def plan_patches(
         self,
         mode: Literal["all", "remain"] = "remain",
-    ) -> dict:
-        """Generate datetime patches.
+        pending_timeout: Optional[float] = 60 * 60 * 24,
+        capacity: int = 20,
+        time_tolerance: Optional[float] = None,
+    ) -> SubmissionPlan:
+        """Plan the requests to submit the dates to GACOS.
 
         Parameters
         ----------
         mode : Literal["all", "remain"], optional
             The mode to generate datetime patches. If "all", then generate all
             the datetime patches. If "remain", then generate the datetime
-            patches of the dates that are not downloaded yet. Default is
-            "remain".
+            patches of the dates that are not downloaded yet, and not pending
+            in the :attr:`ledger`. Default is "remain".
+        pending_timeout : Optional[float], optional
+            The time in seconds after which a submitted date that is not
+            downloaded yet is submitted again. If None, pending dates are never
+            submitted again. Only used in "remain" mode with a ledger. Default
+            is 1 day.
+        capacity : int, optional
+            The maximum number of dates in one request. Default is 20.
+        time_tolerance : Optional[float], optional
+            Acquisition times within this number of minutes are merged into one
+            request time. If None, :attr:`time_tolerance` of the dataset is
+            used, which is 0 except for a :class:`MergedDataset`. Default is
+            None.
+
+        Returns
+        -------
+        plan : SubmissionPlan
+            The planned requests. See :class:`PatchPlanner` for details.
+        """
+        if time_tolerance is None:
+            time_tolerance = self.time_tolerance
+        planner = PatchPlanner(capacity, time_tolerance)
+        dates, times = np.asarray(self.dates), np.asarray(self._times)
+        if mode == "all":
+            return planner.plan(dates, times)
+
+        remain = np.isin(dates, self.dates_remain)
+        if self.ledger is not None:
+            # requests are recorded under the time they were posted with,
+            # which may be the merged time of a cluster: match the time of
+            # each acquisition with the tolerance used to mark the ledger
+            for _time in np.unique(times[remain]):
+                pending = self.ledger.pending(
+                    self.bounds, _time, pending_timeout, match_time_tolerance
+                )
+                remain &= ~((times == _time) & np.isin(dates, pending))
+        return planner.plan(dates[remain], times[remain])
+
+    def gen_datetime_patches(
+        self,
+        mode: Literal["all", "remain"] = "remain",
+        pending_timeout: Optional[float] = 60 * 60 * 24,
+        capacity: int = 20,
+        time_tolerance: Optional[float] = None,
+    ) -> dict:
+        """Generate datetime patches. See :meth:`plan_patches` for the
+        parameters.
 
         Returns
         -------
@@ -131,23 +298,8 @@ class SarDataset:
             The datetime patches. The key is the time (HH:MM) and the value is
             the datetime patches.
         """
-        nums = 20
-        datetime_patches = {}
-
-        if mode == "all":
-            for _time in self.times:
-                _dts = self.dates[self._times == _time]
-                n_patch = np.ceil(len(_dts) / nums)
-                dates_patch = np.array_split(_dts, n_patch)
-                datetime_patches[_time] = dates_patch
-        elif mode == "remain":
-            for _time in self.times_remain:
-                _dts = self.dates_remain[self._times_remain == _time]
-                n_patch = np.ceil(len(_dts) / nums)
-                dates_patch = np.array_split(_dts, n_patch)
-                datetime_patches[_time] = dates_patch
-
-        return datetime_patches
+        plan = self.plan_patches(mode, pending_timeout, capacity, time_tolerance)
+        return plan.patches
 
     def gen_post_data(
         self,
@@ -189,11 +341,95 @@ class SarDataset:
         return post_data
 
 
+def dataset_cache_dir() -> Path:
+    """The default directory of the metadata cache of datasets."""
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "autogacos"
+
+
+def dir_fingerprint(home_dir: Union[Path, str], depth: int = 2) -> str:
+    """A fingerprint of a directory tree, from the names and modification
+    times of the directories up to `depth` levels below `home_dir`. Adding or
+    removing files changes the modification time of their directory, so the
+    fingerprint changes when products are added or removed."""
+    entries = []
+    stack = [(os.path.abspath(home_dir), 0)]
+    while stack:
+        dir_path, level = stack.pop()
+        entries.append(f"{dir_path}:{os.stat(dir_path).st_mtime_ns}")
+        if level >= depth:
+            continue
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, level + 1))
+    return hashlib.sha1("\n".join(sorted(entries)).encode()).hexdigest()
+
+
+class _MetadataCache:
+    """A JSON cache of the bounds and acquisition datetimes of a dataset,
+    valid as long as the fingerprint of its directory does not change."""
+
+    def __init__(
+        self,
+        home_dir: Path,
+        cache_dir: Optional[Union[Path, str]],
+        variant: str = "",
+    ):
+        if cache_dir is None:
+            cache_dir = dataset_cache_dir()
+        # metadata read in different ways are cached separately
+        key = hashlib.sha1(f"{os.path.abspath(home_dir)}{variant}".encode())
+        key = key.hexdigest()
+        self.cache_file = Path(cache_dir) / f"{key}.json"
+        self.fingerprint = dir_fingerprint(home_dir)
+
+    def load(self) -> Optional[tuple[tuple, pd.DatetimeIndex]]:
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cache.get("fingerprint") != self.fingerprint:
+            return None
+        return tuple(cache["bounds"]), pd.DatetimeIndex(cache["date_times"])
+
+    def save(self, bounds: tuple, date_times: pd.DatetimeIndex) -> None:
+        cache = {
+            "fingerprint": self.fingerprint,
+            "bounds": [float(bounds[i]) for i in range(4)],
+            "date_times": [t.isoformat() for t in date_times],
+        }
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_file, "w") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            warnings.warn(f"Failed to save the metadata cache: {e}")
+
+
+def _raster_bounds(files: list[Path]) -> tuple[float, float, float, float]:
+    """The union of the bounds (W, S, E, N) of rasters in EPSG:4326, read
+    from the raster headers only."""
+    bounds = []
+    for file in files:
+        with rasterio.open(file) as src:
+            bounds.append(transform_bounds(src.crs, "EPSG:4326", *src.bounds))
+    bounds = np.asarray(bounds)
+    return (
+        float(bounds[:, 0].min()),
+        float(bounds[:, 1].min()),
+        float(bounds[:, 2].max()),
+        float(bounds[:, 3].max()),
+    )
+
+
 class LiCSARDataset(SarDataset):
     def __init__(
         self,
         home_dir: Union[Path, str],
         gacos_dir: Optional[Union[Path, str]] = None,
+        metadata_only: bool = True,
+        cache_dir: Optional[Union[Path, str]] = None,
     ) -> None:
         """Initialize LiCSARDataset class
 
@@ -204,14 +440,81 @@ class LiCSARDataset(SarDataset):
         gacos_dir : Optional[Union[Path, str]], optional
             The directory used to save gacos data. Used to check if the data is
             already downloaded and avoid resubmitting. Default is None.
+        metadata_only : bool, optional
+            If True, the bounds are read from the header of one raster of the
+            frame (the DEM, or the first interferogram), and the dates from
+            the names of the interferograms, without loading the LiCSAR
+            dataset. The result is cached in `cache_dir` until the directory
+            tree changes. If False, the full :class:`faninsar.datasets.LiCSAR`
+            dataset is loaded. Default is True.
+        cache_dir : Optional[Union[Path, str]], optional
+            The directory of the metadata cache. If None, ``autogacos`` under
+            the user cache directory (``~/.cache``) is used. Default is None.
         """
         self.home_dir = Path(home_dir)
-        self.dataset = LiCSAR(home_dir)
-        bounds = self.dataset.bounds
+        self._dataset = None
+        if not metadata_only:
+            bounds = self.dataset.bounds
+            dates = self.dataset.pairs.dates
+            time = self._get_time()
+            date_times = pd.to_datetime([f"{d} {time[0]}:{time[1]}:00" for d in dates])
+        else:
+            cache = _MetadataCache(self.home_dir, cache_dir)
+            cached = cache.load()
+            if cached is None:
+                bounds, date_times = self._read_metadata()
+                cache.save(bounds, date_times)
+            else:
+                bounds, date_times = cached
+        super().__init__(bounds, date_times, gacos_dir)
+
+    @property
+    def dataset(self) -> LiCSAR:
+        """The :class:`faninsar.datasets.LiCSAR` dataset, loaded on first
+        access."""
+        if self._dataset is None:
+            self._dataset = LiCSAR(self.home_dir)
+        return self._dataset
+
+    def _unw_files(self) -> list[Path]:
+        """The interferograms of the frame, found from the names of the
+        directories under ``interferograms`` if it exists."""
+        ifg_dir = self.home_dir / "interferograms"
+        if not ifg_dir.is_dir():
+            return sorted(self.home_dir.rglob(LiCSAR.pattern_unw))
+        files = []
+        with os.scandir(ifg_dir) as it:
+            for entry in it:
+                file = Path(entry.path) / f"{entry.name}.geo.unw.tif"
+                if entry.is_dir() and file.exists():
+                    files.append(file)
+        return sorted(files)
+
+    @property
+    def pairs(self) -> np.ndarray:
+        """The pairs of dates (YYYYMMDD) of the interferograms, parsed from
+        their file names, of shape (n_pairs, 2)."""
+        # e.g. 20200101_20200113.geo.unw.tif
+        names = [f.name.split(".")[0].split("_") for f in self._unw_files()]
+        return np.array(names, dtype=str).reshape(-1, 2)
+
+    def _los_up_file(self) -> Optional[Path]:
+        """The raster of the up component of the LOS unit vector."""
+        files = sorted(self.home_dir.rglob(LiCSAR.pattern_U))
+        return files[0] if files else None
+
+    def _read_metadata(self) -> tuple[tuple, pd.DatetimeIndex]:
+        unw_files = self._unw_files()
+        if len(unw_files) == 0:
+            raise FileNotFoundError(f"No interferograms found in {self.home_dir}")
+        dem_files = sorted((self.home_dir / "metadata").glob(LiCSAR.pattern_dem))
+        bounds = _raster_bounds(dem_files[:1] or unw_files[:1])
+
+        pair_names = [f.name.split(".")[0] for f in unw_files]
+        dates = np.unique([d for name in pair_names for d in name.split("_")])
         time = self._get_time()
-        dates = self.dataset.pairs.dates
         date_times = pd.to_datetime([f"{d} {time[0]}:{time[1]}:00" for d in dates])
-        super().__init__(bounds, date_times, gacos_dir)
+        return bounds, date_times
 
     def _get_time(self):
         """Get the acquisition time of acquisitions.
@@ -226,13 +529,17 @@ class LiCSARDataset(SarDataset):
         ValueError
             If no center_time found in metadata.txt.
         """
-        meta_file = sorted(self.home_dir.rglob("metadata.txt"))[0]
+        meta_file = self.home_dir / "metadata" / "metadata.txt"
+        if not meta_file.exists():
+            meta_file = sorted(self.home_dir.rglob("metadata.txt"))[0]
 
         with open(meta_file) as f:
             lines = f.readlines()
             time = None
             for line in lines:
                 line_split = line.split("=")
+                if len(line_split) < 2:
+                    continue
                 key, value = (line_split[0].strip(), line_split[1])
                 if "center_time" == key:
                     center_time = value.strip()
@@ -251,6 +558,8 @@ class HyP3Dataset(SarDataset):
         self,
         home_dir: Union[Path, str],
         gacos_dir: Optional[Union[Path, str]] = None,
+        metadata_only: bool = True,
+        cache_dir: Optional[Union[Path, str]] = None,
     ) -> None:
         """Initialize HyP3Dataset class
 
@@ -261,9 +570,75 @@ class HyP3Dataset(SarDataset):
         gacos_dir : Optional[Union[Path, str]], optional
             The directory used to save gacos data. Used to check if the data is
             already downloaded and avoid resubmitting. Default is None.
+        metadata_only : bool, optional
+            If True, the bounds are the union of the bounds read from the
+            header of each interferogram, so that interferograms of different
+            extents are all covered, and the acquisition datetimes are parsed
+            from the names of the interferograms, without loading the HyP3
+            dataset. The result is cached in `cache_dir` until the directory
+            tree changes. If False, the full :class:`faninsar.datasets.HyP3`
+            dataset is loaded. Default is True.
+        cache_dir : Optional[Union[Path, str]], optional
+            The directory of the metadata cache. If None, ``autogacos`` under
+            the user cache directory (``~/.cache``) is used. Default is None.
         """
-        self.dataset = HyP3(home_dir)
-        bounds = self.dataset.bounds.to_crs("epsg:4326")
-        date_times = self.dataset.datetime
+        self.home_dir = Path(home_dir)
+        self._dataset = None
+        if not metadata_only:
+            bounds = self.dataset.bounds.to_crs("epsg:4326")
+            date_times = self.dataset.datetime
+        else:
+            # metadata cached without this variant hold the bounds of the
+            # first interferogram only, and are not reused
+            cache = _MetadataCache(self.home_dir, cache_dir, ":scan_bounds")
+            cached = cache.load()
+            if cached is None:
+                bounds, date_times = self._read_metadata()
+                cache.save(bounds, date_times)
+            else:
+                bounds, date_times = cached
 
         super().__init__(bounds, date_times, gacos_dir)
+
+    @property
+    def dataset(self) -> HyP3:
+        """The :class:`faninsar.datasets.HyP3` dataset, loaded on first
+        access."""
+        if self._dataset is None:
+            self._dataset = HyP3(self.home_dir)
+        return self._dataset
+
+    def _unw_files(self) -> list[Path]:
+        """The interferograms of the dataset, found in `home_dir` and in the
+        product directories under it, which are named after their products
+        (e.g. ``S1AA_..._ABCD/S1AA_..._ABCD_unw_phase.tif``). The whole tree
+        is only searched if none is found there."""
+        files = []
+        with os.scandir(self.home_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    file = Path(entry.path) / f"{entry.name}_unw_phase.tif"
+                    if fnmatch.fnmatch(file.name, HyP3.pattern_unw) and file.exists():
+                        files.append(file)
+                elif fnmatch.fnmatch(entry.name, HyP3.pattern_unw):
+                    files.append(Path(entry.path))
+        if len(files) == 0:
+            return sorted(self.home_dir.rglob(HyP3.pattern_unw))
+        return sorted(files)
+
+    @property
+    def pairs(self) -> np.ndarray:
+        """The pairs of dates (YYYYMMDD) of the interferograms, parsed from
+        their file names, of shape (n_pairs, 2)."""
+        names = [[t[:8] for t in f.name.split("_")[1:3]] for f in self._unw_files()]
+        return np.array(names, dtype=str).reshape(-1, 2)
+
+    def _read_metadata(self) -> tuple[tuple, pd.DatetimeIndex]:
+        unw_files = self._unw_files()
+        if len(unw_files) == 0:
+            raise FileNotFoundError(f"No interferograms found in {self.home_dir}")
+        bounds = _raster_bounds(unw_files)
+        # e.g. S1AA_20200101T101010_20200113T101011_VVP012_INT80_G_ueF_ABCD
+        names = [f.name.split("_")[1:3] for f in unw_files]
+        date_times = pd.DatetimeIndex(np.unique(np.concatenate(names)))
+        return bounds, date_times
@@ -1,13 +1,29 @@
+import gzip
+import io
+import os
+import shutil
 import tarfile
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
-from typing import Optional, Union
+from typing import BinaryIO, Callable, Optional, Sequence, Union
 
 import numpy as np
 import pandas as pd
-from data_downloader import downloader
-from faninsar.query import BoundingBox
+import requests
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
 
+from .catalog import UrlCatalog, is_catalog_file
+from .cube import ZTDCube
+from .index import ProductIndex, state_file
+from .journal import TransferJournal
+from .ledger import SubmissionLedger
 from .parse_email import GACOSEmail
 
 
@@ -20,15 +36,29 @@ class Downloader:
         keep_original: bool = False,
         times: Optional[Union[float, list[float]]] = None,
         bounds: Optional[tuple[float, float, float, float]] = None,
+        dates: Optional[Sequence[str]] = None,
+        suffixes: Optional[Sequence[str]] = None,
+        urls: Optional[Sequence[str]] = None,
+        ledger: Optional[SubmissionLedger] = None,
+        cube: Optional[ZTDCube] = None,
     ) -> None:
         """Initialize Downloader class
 
         Parameters
         ----------
         url_file : Union[Path, str]
-            Path to file containing URLs that created by :meth:`GACOSEmail.retrieve_gacos_urls`
+            Path to file containing URLs that created by :meth:`GACOSEmail.retrieve_gacos_urls`.
+            Can be a CSV file or a :class:`UrlCatalog` database. For a catalog,
+            the `bounds`, `times` and `dates` filters are applied when querying
+            the database instead of after loading all urls.
         output_dir : Union[Path, str]
-            directory to output gacos files
+            directory to output gacos files. The files of each url are
+            extracted into a subdirectory named after the bounding box of the
+            url (see :func:`product_dir`), so that products of the same date
+            and different extents do not overwrite each other. Products are
+            found by their bounds anywhere under `output_dir`, so products
+            extracted directly into `output_dir` by earlier versions are still
+            used and not downloaded again.
         tar_gz_dir : Optional[Union[Path, str]], optional
             directory to store downloaded *.tar.gz files. If None, then
             `output_dir` is used. Default is None.
@@ -41,12 +71,42 @@ class Downloader:
         bounds : Optional[tuple[float, float, float, float]], optional
             bounds of area of interest with order (W, S, E, N), used to filter
             out files that are not needed. Default is None.
+        dates : Optional[Sequence[str]], optional
+            dates (YYYYMMDD) of acquisitions that are needed, for example the
+            :attr:`SarDataset.dates_remain` of a dataset. Urls without any of
+            these dates are filtered out, and files of other dates are not
+            extracted from the downloaded archives. Default is None, which means
+            all dates are needed.
+        suffixes : Optional[Sequence[str]], optional
+            suffixes of the files to extract from the downloaded archives, for
+            example ``[".ztd.tif"]``. Default is None, which means all files
+            are extracted.
+        urls : Optional[Sequence[str]], optional
+            only download these urls of `url_file`. Default is None, which means
+            all urls are considered.
+        ledger : Optional[SubmissionLedger], optional
+            The ledger in which the dates of downloaded files are marked as
+            downloaded. If None, the ledger in `output_dir` is used, which is
+            the one of a :class:`SarDataset` whose `gacos_dir` is `output_dir`.
+            Default is None.
+        cube : Optional[ZTDCube], optional
+            The cube into which the downloaded products are ingested after
+            :meth:`download`, e.g. the cube returned by
+            :meth:`SarDataset.build_cube`. Only the dates not in the cube yet,
+            and among `dates` if given, are ingested. Default is None.
+
+        .. note::
+            Files of dates whose downloaded products already cover the
+            bounding box of a url are not extracted again from that url.
         """
         self.url_file = Path(url_file)
         self.output_dir = Path(output_dir)
         if tar_gz_dir is None:
-            self.tar_gz_dir = self.output_dir
+            tar_gz_dir = self.output_dir
+        self.tar_gz_dir = Path(tar_gz_dir)
         self.keep_original = keep_original
+        self.dates = None if dates is None else np.asarray(dates, dtype=str)
+        self.suffixes = None if suffixes is None else tuple(suffixes)
 
         if not self.url_file.exists():
             raise FileNotFoundError(f"{self.url_file} does not exist")
@@ -55,104 +115,644 @@ class Downloader:
         if not self.tar_gz_dir.exists():
             self.tar_gz_dir.mkdir(parents=True)
 
-        self.df_urls = pd.read_csv(self.url_file, header=0)
+        self.index = ProductIndex(self.output_dir)
+        self.journal = TransferJournal(
+            state_file(self.output_dir, TransferJournal.journal_name)
+        )
+        if ledger is None:
+            ledger = SubmissionLedger(
+                state_file(self.output_dir, SubmissionLedger.ledger_name)
+            )
+        self.ledger = ledger
+        self.cube = cube
+        self._failed = {}
+        self._lock = threading.Lock()
+
+        if is_catalog_file(self.url_file):
+            self.df_urls = UrlCatalog(self.url_file).query(bounds, times, self.dates)
+        else:
+            self.df_urls = pd.read_csv(self.url_file, header=0)
+        self.df_dates = self._explode_dates()
 
+        self.mask = np.ones(self.df_urls.shape[0], dtype=bool)
         # only keep urls that intersect with bounds
         if bounds is not None:
-            mask_bbox = self._bbox_mask(BoundingBox(*bounds))
+            self.mask &= self._bbox_mask(bounds)
 
         # only keep urls that acquisition time is within 10 minutes of `time`
         if times is not None:
-            if isinstance(times, float):
-                times = [times]
-            mask_time = self._time_mask(times)
-
-        if bounds is not None and times is not None:
-            self.mask = mask_bbox & mask_time
-        elif bounds is not None:
-            self.mask = mask_bbox
-        elif times is not None:
-            self.mask = mask_time
-        else:
-            self.mask = np.ones(self.df_urls.shape[0], dtype=bool)
-            
-        self.mask = self.mask & self.date_mask
-
-    def _bbox_mask(self, bounds) -> np.ndarray:
-        intersection_bbox = np.array(
-            [
-                BoundingBox(*b).intersects(bounds)
-                for b in zip(
-                    self.df_urls["south"].astype(float),
-                    self.df_urls["west"].astype(float),
-                    self.df_urls["north"].astype(float),
-                    self.df_urls["east"].astype(float),
-                )
-            ]
+            self.mask &= self._time_mask(times)
+
+        if urls is not None:
+            self.mask &= self.df_urls["url"].isin(urls).to_numpy()
+
+        self.mask &= self.date_mask
+
+    def _explode_dates(self) -> pd.DataFrame:
+        """Split the date lists of urls into a table with one row per
+        (url, date). The index of the table is the row index of `df_urls`."""
+        dates = self.df_urls["date"]
+        if not is_catalog_file(self.url_file):
+            # date lists are saved as strings in CSV files
+            dates = dates.astype(str).str.findall(r"\d{8}")
+        df_dates = dates.explode().rename("date").to_frame()
+        df_dates["url"] = self.df_urls["url"].reindex(df_dates.index)
+        return df_dates
+
+    def _bbox_mask(self, bounds: tuple[float, float, float, float]) -> np.ndarray:
+        """Only keep urls that intersect with `bounds` (W, S, E, N)"""
+        west, south, east, north = bounds
+        intersection_bbox = (
+            (self.df_urls["west"].to_numpy(dtype=float) <= east)
+            & (self.df_urls["east"].to_numpy(dtype=float) >= west)
+            & (self.df_urls["south"].to_numpy(dtype=float) <= north)
+            & (self.df_urls["north"].to_numpy(dtype=float) >= south)
         )
         return intersection_bbox
 
-    def _time_mask(self, times) -> np.ndarray:
+    def _time_mask(self, times: Union[float, list[float]]) -> np.ndarray:
         """Only keep urls that acquisition time is within 10 minutes of `time`"""
-        intersection_times = []
-        for time in times:
-            intersection_times.append(
-                np.array(
-                    np.abs(self.df_urls["time"].astype(float) - time)
-                    <= 1 / 60 * 10  # 10 minutes
-                )
-            )
-        intersection_time = np.any(intersection_times, axis=0)
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        time_urls = self.df_urls["time"].to_numpy(dtype=float)
+        intersection_time = np.any(
+            np.abs(time_urls[:, None] - times[None, :]) <= 1 / 60 * 10,  # 10 minutes
+            axis=1,
+        )
         return intersection_time
 
     @property
     def date_mask(self) -> np.ndarray:
-        """Remove urls that all acquisition dates have been downloaded"""
-        dates_urls = self.df_urls["date"].map(lambda x: eval(x))
-        intersection_dates = []
-        for dt_url in dates_urls:
-            intersection_dates.append(~np.all(np.isin(dt_url, self.dates_downloaded)))
-        return np.array(intersection_dates)
+        """Remove urls that all acquisition dates have been downloaded or are
+        not needed. A date of a url has been downloaded if the products of the
+        date cover the bounding box of the url, see :meth:`_coverage_mask`."""
+        dates = self.df_dates["date"]
+        # urls without any date are treated as downloaded
+        unneeded = dates.isna() | self._coverage_mask()
+        if self.dates is not None:
+            unneeded |= ~dates.isin(self.dates)
+        all_unneeded = unneeded.groupby(level=0).all()
+        return ~all_unneeded.reindex(self.df_urls.index, fill_value=True).to_numpy()
+
+    def _coverage_mask(self) -> np.ndarray:
+        """Whether each (url, date) of `df_dates` is covered by the downloaded
+        products, i.e. the products of the date cover the bounding box of the
+        url, whichever areas they were requested for."""
+        self.index.refresh()
+        dates = self.df_dates["date"].to_numpy()
+        df_bbox = self.df_urls[["west", "south", "east", "north"]].reindex(
+            self.df_dates.index
+        )
+        covered = np.zeros(len(dates), dtype=bool)
+        groups = df_bbox.reset_index(drop=True).groupby(list(df_bbox.columns))
+        for bounds, idx in groups.indices.items():
+            _dates = dates[idx]
+            valid = pd.notna(_dates)
+            df_coverage = self.index.coverage(bounds, np.unique(_dates[valid]))
+            full = df_coverage.index[df_coverage["coverage"] >= 1 - 1e-9]
+            covered[idx] = valid & np.isin(_dates.astype(str), full)
+        return pd.Series(covered, index=self.df_dates.index)
 
     @property
     def dates_downloaded(self) -> np.ndarray:
-        """Return dates that have been downloaded"""
-        gacos_files = list(self.output_dir.rglob("*.ztd.tif"))
-        dates = []
-        for i in gacos_files:
-            stem = i.stem.split(".")[0]
-            if len(stem) == 8:
-                dates.append(stem)
-        return np.array(dates)
-
-    def download(self) -> None:
-        """Download GACOS files from URLs in file created by :meth:`GACOSEmail.retrieve_gacos_urls`"""
-        urls_used = self.df_urls[self.mask]["url"].values
-
-        for url in tqdm(urls_used, unit="file", desc="Downloading GACOS files"):
-            gz_file = self.tar_gz_dir / Path(url).name
-            downloader.download_data(url, file_name=gz_file)
-            self._extract_tar_gz(gz_file)
-            if not self.keep_original:
-                self._delete_file(gz_file)
+        """Return dates that have at least one product downloaded, of any
+        extent"""
+        self.index.refresh()
+        return self.index.dates
+
+    @property
+    def failed(self) -> dict:
+        """A dict of urls failed to download in last :meth:`download` call,
+        mapping to the error message."""
+        return self._failed
 
-    def _extract_tar_gz(self, gz_file) -> None:
-        """Unzip/extract downloaded GACOS files
+    def download(
+        self,
+        max_workers: int = 1,
+        max_connections: Optional[int] = None,
+        timeout: float = 60,
+        extract_workers: int = 1,
+        max_pending: Optional[int] = None,
+        stream: bool = False,
+    ) -> None:
+        """Download GACOS files from URLs in file created by :meth:`GACOSEmail.retrieve_gacos_urls`
+
+        Downloading and extraction run as a pipeline: downloaded archives are
+        handed to a process pool that extracts them (and deletes them if
+        `keep_original` is False), while the download threads keep fetching the
+        next archives.
 
         Parameters
         ----------
-        gz_file : Path
-            path to downloaded GACOS file (*.tar.gz)
+        max_workers : int, optional
+            The number of files downloaded concurrently. Default is 1.
+        max_connections : Optional[int], optional
+            The maximum number of connections kept open to the GACOS host. If
+            None, `max_workers` is used. Default is None.
+        timeout : float, optional
+            The timeout in seconds of connecting to and reading from the GACOS
+            host. Default is 60.
+        extract_workers : int, optional
+            The number of processes used to extract archives. Default is 1.
+        max_pending : Optional[int], optional
+            The maximum number of archives that are being downloaded or waiting
+            for extraction. When extraction falls behind, downloading pauses
+            until an archive is extracted, so that the archives do not fill the
+            disk. If None, ``max_workers + extract_workers`` is used. Default is
+            None.
+        stream : bool, optional
+            Whether to extract archives directly from the HTTP response without
+            writing the *.tar.gz files to disk. Extraction then runs in the
+            download threads and `extract_workers` / `max_pending` are ignored.
+            If `keep_original` is True, the raw archives are written to
+            `tar_gz_dir` in the same pass. Default is False.
+
+        .. note::
+            Failed urls do not abort the download of other urls. They are
+            reported after all downloads finished and can be accessed by the
+            :attr:`failed` attribute.
+
+        .. note::
+            The transfer state of each url is recorded in :attr:`journal`. Urls
+            whose dates are all downloaded are skipped. Urls verified in
+            previous runs are only downloaded again if some of their dates are
+            still needed, e.g. dates that were not extracted or products that
+            were deleted. Interrupted downloads are resumed from where they
+            stopped by HTTP Range requests. Archives that fail the integrity
+            check are removed and downloaded again in the next run. Streamed
+            downloads cannot be resumed and restart from the beginning.
         """
-        with tarfile.open(gz_file, "r:gz") as tar:
-            tar.extractall(path=self.output_dir)
+        # urls whose dates are all downloaded, including the urls verified in
+        # previous runs, are already dropped by the date mask
+        df_used = self.df_urls[self.mask & self.date_mask]
+        self.journal.add_pending(df_used["url"].values)
+        df_states = self.journal.states(df_used["url"].values)
+        verified = df_states.index[df_states["state"] == "verified"]
+        # verified urls still needed, e.g. for dates not extracted before or
+        # products deleted since, are extracted again
+        for url in verified:
+            gz_file = self.tar_gz_dir / Path(url).name
+            state = "downloaded" if gz_file.exists() else "pending"
+            self.journal.update(url, state, offset=0)
+        if len(verified) > 0:
+            tqdm.write(
+                f"Download {len(verified)} files verified in previous runs again "
+                "for the dates still needed."
+            )
+        if max_connections is None:
+            max_connections = max_workers
+        if max_pending is None:
+            max_pending = max_workers + extract_workers
+        slots = threading.BoundedSemaphore(max_pending)
+        # extract each url into the directory of its bounding box, without
+        # the dates its bounding box is already covered for
+        covered = self.df_dates[self._coverage_mask()]
+        skip_dates = covered.groupby("url")["date"].agg(set).to_dict()
+        targets = {}
+        for url, bounds in zip(
+            df_used["url"].values,
+            df_used[["west", "south", "east", "north"]].to_numpy(dtype=float),
+        ):
+            targets[url] = (
+                product_dir(self.output_dir, bounds),
+                MemberFilter(self.dates, skip_dates.get(url), self.suffixes),
+            )
+
+        self._failed = {}
+        pbar_files = tqdm(
+            total=len(df_used), unit="file", desc="Downloading GACOS files"
+        )
+        pbar_bytes = tqdm(unit="B", unit_scale=True, desc="Downloaded")
+        with self._create_session(max_connections) as session, pbar_files, pbar_bytes:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            extractor = ProcessPoolExecutor(max_workers=extract_workers)
+            with executor, extractor:
+                stage = "stream" if stream else "download"
+                tasks = {}
+                for url, _time in zip(df_used["url"].values, df_used["time"].values):
+                    if stream:
+                        args = (self._stream_url, *targets[url])
+                    else:
+                        args = (self._download_url, slots)
+                    future = executor.submit(
+                        args[0], session, url, timeout, pbar_bytes, *args[1:]
+                    )
+                    tasks[future] = (url, _time, stage)
+                pending = set(tasks)
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, _time, stage = tasks.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            self._failed[url] = str(e)
+                            tqdm.write(f">>> failed {stage}: {url} ({e})")
+                            self._reset_transfer(url, stage)
+                            pbar_files.update(1)
+                            continue
+
+                        if stage == "download":
+                            self.journal.update(url, "downloaded", file=result)
+                            output_dir, member_filter = targets[url]
+                            future = extractor.submit(
+                                extract_tar_gz,
+                                result,
+                                output_dir,
+                                not self.keep_original,
+                                member_filter,
+                            )
+                            future.add_done_callback(lambda _: slots.release())
+                            tasks[future] = (url, _time, "extract")
+                            pending.add(future)
+                        else:
+                            self.journal.update(url, "extracted")
+                            self.index.add_files(result, time=float(_time))
+                            self._mark_downloaded(df_used, url, result)
+                            if all(f.exists() for f in result):
+                                self.journal.update(url, "verified")
+                            pbar_files.update(1)
+
+        if self._failed:
+            tqdm.write(
+                f"{len(self._failed)} of {len(df_used)} files failed to download. "
+                "You can access them by `failed` attribute."
+            )
+        if self.cube is not None:
+            ingested = self.cube.ingest_index(self.index, self.dates)
+            tqdm.write(f"Ingested {len(ingested)} dates into {self.cube}.")
+
+    def _mark_downloaded(
+        self, df_used: pd.DataFrame, url: str, files: list[Path]
+    ) -> None:
+        """Mark the dates of extracted files as downloaded in the ledger."""
+        dates = {Path(f).name.split(".")[0] for f in files}
+        dates = sorted(d for d in dates if len(d) == 8 and d.isdigit())
+        if len(dates) == 0:
+            return
+        row = df_used.loc[df_used["url"] == url].iloc[0]
+        bounds = (row["west"], row["south"], row["east"], row["north"])
+        self.ledger.mark(bounds, row["time"], dates, "downloaded", url=url)
+
+    def _create_session(self, max_connections: int) -> requests.Session:
+        """Create a keep-alive session shared by all download threads, with at
+        most `max_connections` connections per host."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections, pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _download_url(
+        self,
+        session: requests.Session,
+        url: str,
+        timeout: float,
+        pbar_bytes: tqdm,
+        slots: threading.BoundedSemaphore,
+    ) -> Path:
+        """Download one GACOS file once a pending slot is available. The slot
+        is released after the file is extracted, or here if downloading failed.
+        """
+        slots.acquire()
+        try:
+            gz_file = self.tar_gz_dir / Path(url).name
+            if self.journal.state(url) == "downloaded" and gz_file.exists():
+                return gz_file
+            part_file = gz_file.with_name(gz_file.name + ".part")
+
+            def on_chunk(chunk):
+                with self._lock:
+                    pbar_bytes.update(len(chunk))
+
+            fetch_resume(session, url, part_file, timeout, on_chunk, self.journal)
+            part_file.replace(gz_file)
+        except BaseException:
+            slots.release()
+            raise
+        return gz_file
+
+    def _reset_transfer(self, url: str, stage: str) -> None:
+        """Reset the journal of a failed url to pending. Archives that failed
+        extraction are considered corrupted and removed."""
+        if stage == "download":
+            self.journal.update(url, "pending")
+            return
+        if stage == "extract":
+            gz_file = self.tar_gz_dir / Path(url).name
+            gz_file.unlink(missing_ok=True)
+        self.journal.update(url, "pending", offset=0)
 
-    def _delete_file(self, gz_file) -> None:
-        """Delete original GACOS files
+    def _stream_url(
+        self,
+        session: requests.Session,
+        url: str,
+        timeout: float,
+        pbar_bytes: tqdm,
+        output_dir: Path,
+        member_filter: Optional["MemberFilter"] = None,
+    ) -> list[Path]:
+        """Extract one GACOS file into `output_dir` while it is being
+        downloaded."""
+        self.journal.update(url, "downloading", offset=0)
+        gz_file = self.tar_gz_dir / Path(url).name
+        part_file = gz_file.with_name(gz_file.name + ".part")
+
+        def on_chunk(chunk):
+            with self._lock:
+                pbar_bytes.update(len(chunk))
+
+        with session.get(url, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            tee_file = open(part_file, "wb") if self.keep_original else None
+            try:
+                reader = _ResponseReader(r, on_chunk, tee_file)
+                files = extract_tar_gz_stream(reader, output_dir, member_filter)
+                # read the padding after the end of the archive
+                reader.drain()
+            finally:
+                if tee_file is not None:
+                    tee_file.close()
+        if self.keep_original:
+            part_file.replace(gz_file)
+        return files
+
+
+def product_dir(
+    output_dir: Union[Path, str], bounds: tuple[float, float, float, float]
+) -> Path:
+    """The directory of the products of a bounding box (W, S, E, N) under
+    `output_dir`. Products are named by date only, so products of different
+    extents are kept in separate directories to avoid overwriting each
+    other. Products of unknown bounding box go to `output_dir` itself."""
+    if pd.isna(list(bounds)).any():
+        return Path(output_dir)
+    west, south, east, north = [float(b) for b in bounds]
+    return Path(output_dir) / f"bbox_{west:.4f}_{south:.4f}_{east:.4f}_{north:.4f}"
+
+
+def fetch_resume(
+    session: requests.Session,
+    url: str,
+    part_file: Union[Path, str],
+    timeout: Optional[float] = None,
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+    journal: Optional[TransferJournal] = None,
+) -> None:
+    """Download a url to `part_file`, continuing from the bytes already in
+    `part_file` by a HTTP Range request.
+
+    Parameters
+    ----------
+    session : requests.Session
+        session used to send the request
+    url : str
+        url to download
+    part_file : Union[Path, str]
+        file to write the downloaded bytes to. If it exists, only the bytes
+        after its end are requested. If the server ignores the range request,
+        the file is downloaded again from the start.
+    timeout : Optional[float], optional
+        timeout of the request in seconds. Default is None.
+    on_chunk : Optional[Callable[[bytes], None]], optional
+        function called with each chunk written to `part_file`, e.g. to update
+        a progress bar. Default is None.
+    journal : Optional[TransferJournal], optional
+        journal in which the offset and total size of the download are
+        recorded, also when the download fails. Default is None.
+
+    Raises
+    ------
+    IOError
+        If the response is shorter than its Content-Length.
+    """
+    part_file = Path(part_file)
+    offset = part_file.stat().st_size if part_file.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    if journal is not None:
+        journal.update(url, "downloading", file=part_file, offset=offset)
+
+    total = None
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        # the requested range starts at the end of file: already complete
+        if offset > 0 and r.status_code == 416:
+            return
+        r.raise_for_status()
+        if r.status_code != 206:
+            # the server ignored the range request: restart
+            offset = 0
+        if "Content-Length" in r.headers:
+            total = offset + int(r.headers["Content-Length"])
+
+        try:
+            with open(part_file, "ab" if offset > 0 else "wb") as f:
+                for chunk in r.iter_content(chunk_size=1024 * 64):
+                    f.write(chunk)
+                    offset += len(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+        finally:
+            if journal is not None:
+                journal.update(url, "downloading", offset=offset, total=total)
+
+    if total is not None and offset != total:
+        raise IOError(f"incomplete download: {offset} of {total} bytes")
+
+
+class MemberFilter:
+    """Select the files to extract from GACOS archives by date and suffix.
+    Instances are picklable, so they can be passed to worker processes."""
+
+    def __init__(
+        self,
+        dates: Optional[Sequence[str]] = None,
+        skip_dates: Optional[Sequence[str]] = None,
+        suffixes: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize MemberFilter class
 
         Parameters
         ----------
-        gz_file : Path
-            path to downloaded GACOS file (*.tar.gz)
+        dates : Optional[Sequence[str]], optional
+            dates (YYYYMMDD) to extract. If None, all dates are extracted.
+            Default is None.
+        skip_dates : Optional[Sequence[str]], optional
+            dates (YYYYMMDD) not to extract, for example the dates that have
+            been downloaded. Default is None.
+        suffixes : Optional[Sequence[str]], optional
+            suffixes of the files to extract. If None, files with any suffix
+            are extracted. Default is None.
         """
-        gz_file.unlink()
+        self.dates = None if dates is None else set(dates)
+        self.skip_dates = set() if skip_dates is None else set(skip_dates)
+        self.suffixes = None if suffixes is None else tuple(suffixes)
+
+    def __call__(self, name: str) -> bool:
+        name = Path(name).name
+        if self.suffixes is not None and not name.endswith(self.suffixes):
+            return False
+        date = name.split(".")[0]
+        if len(date) == 8 and date.isdigit():
+            if date in self.skip_dates:
+                return False
+            if self.dates is not None and date not in self.dates:
+                return False
+        return True
+
+
+class _ResponseReader(io.RawIOBase):
+    """A read-only file object over the body of a streamed HTTP response.
+
+    Each chunk read from the response is passed to `on_chunk` and, if
+    `tee_file` is given, also written to it.
+    """
+
+    def __init__(
+        self,
+        response: requests.Response,
+        on_chunk: Callable[[bytes], None],
+        tee_file: Optional[BinaryIO] = None,
+    ) -> None:
+        self._chunks = response.iter_content(chunk_size=1024 * 64)
+        self._on_chunk = on_chunk
+        self._tee_file = tee_file
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._on_chunk(chunk)
+        if self._tee_file is not None:
+            self._tee_file.write(chunk)
+        self._buffer = memoryview(chunk)
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            if not self._next_chunk():
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def drain(self) -> None:
+        """Read the rest of the response."""
+        self._buffer = memoryview(b"")
+        while self._next_chunk():
+            pass
+
+
+def extract_tar_gz_stream(
+    fileobj: BinaryIO,
+    output_dir: Union[Path, str],
+    member_filter: Optional[Callable[[str], bool]] = None,
+) -> list[Path]:
+    """Extract a GACOS file (*.tar.gz) from a non-seekable stream, member by
+    member, without writing the archive to disk.
+
+    Members are written to temporary files (``.<name>.part``) and only renamed
+    to their final names after the whole gzip stream has been read and its
+    CRC and length checked. If the stream is truncated or corrupted, the
+    temporary files are removed and no file of the archive is left in
+    `output_dir`.
+
+    Parameters
+    ----------
+    fileobj : BinaryIO
+        file object to read the archive from
+    output_dir : Union[Path, str]
+        directory to output gacos files
+    member_filter : Optional[Callable[[str], bool]], optional
+        function called with the name of each file in the archive, only files
+        for which it returns True are extracted. Default is None, which means
+        all files are extracted.
+
+    Returns
+    -------
+    files : list[Path]
+        paths of the extracted files
+
+    Raises
+    ------
+    tarfile.TarError, gzip.BadGzipFile, EOFError
+        If the archive is truncated or corrupted.
+    """
+    output_dir = Path(output_dir)
+    extracted = []
+    try:
+        with gzip.GzipFile(fileobj=fileobj, mode="rb") as gz:
+            with tarfile.open(fileobj=gz, mode="r|") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    name = Path(member.name)
+                    if name.is_absolute() or ".." in name.parts:
+                        continue
+                    if member_filter is not None and not member_filter(member.name):
+                        continue
+                    file = output_dir / name
+                    part_file = file.with_name(f".{file.name}.part")
+                    part_file.parent.mkdir(parents=True, exist_ok=True)
+                    extracted.append((part_file, file))
+                    with tar.extractfile(member) as src, open(part_file, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+            # read to the end of the gzip stream, so that its CRC and length
+            # are checked
+            while gz.read(1024 * 1024):
+                pass
+    except BaseException:
+        for part_file, _ in extracted:
+            part_file.unlink(missing_ok=True)
+        raise
+    for part_file, file in extracted:
+        os.replace(part_file, file)
+    return [file for _, file in extracted]
+
+
+def extract_tar_gz(
+    gz_file: Union[Path, str],
+    output_dir: Union[Path, str],
+    delete: bool = False,
+    member_filter: Optional[Callable[[str], bool]] = None,
+) -> list[Path]:
+    """Unzip/extract a downloaded GACOS file. This is a module level function
+    so that it can be run in worker processes.
+
+    The archive is checked and extracted in a single pass, see
+    :func:`extract_tar_gz_stream`: the extracted files only appear in
+    `output_dir` once the gzip CRC and length of the whole archive passed.
+
+    Parameters
+    ----------
+    gz_file : Union[Path, str]
+        path to downloaded GACOS file (*.tar.gz)
+    output_dir : Union[Path, str]
+        directory to output gacos files
+    delete : bool, optional
+        Whether to delete `gz_file` after extraction. Default is False.
+    member_filter : Optional[Callable[[str], bool]], optional
+        function called with the name of each file in the archive, only files
+        for which it returns True are extracted. Default is None, which means
+        all files are extracted.
+
+    Returns
+    -------
+    files : list[Path]
+        paths of the extracted files
+
+    Raises
+    ------
+    tarfile.TarError, gzip.BadGzipFile, EOFError
+        If the archive is truncated or corrupted.
+    """
+    with open(gz_file, "rb") as f:
+        files = extract_tar_gz_stream(f, output_dir, member_filter)
+    if delete:
+        Path(gz_file).unlink()
+    return files
@@ -0,0 +1,384 @@
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+import rasterio
+
+# the subdirectory of a gacos directory holding the state databases
+state_dir_name = ".gacos"
+
+
+def state_file(gacos_dir: Union[Path, str], name: str) -> Path:
+    """The path of a state database (index, journal, ledger) of a gacos
+    directory.
+
+    The databases are kept in the ``.gacos`` subdirectory rather than in
+    `gacos_dir` itself: every write transaction creates and deletes journal
+    files next to the database, which would change the modification time of
+    `gacos_dir` and make :meth:`ProductIndex.refresh` rescan it each time.
+    """
+    file = Path(gacos_dir) / state_dir_name / name
+    file.parent.mkdir(parents=True, exist_ok=True)
+    return file
+
+
+class ProductIndex:
+    """An on-disk index of the GACOS products (``*.ztd.tif``) stored in a
+    directory.
+
+    The index is a SQLite database in the ``.gacos`` state directory under the
+    gacos directory (see :func:`state_file`), which is not scanned. It records
+    the date, bounding box, acquisition time, file size and modification time of
+    each product. :meth:`refresh` updates the index incrementally: only the
+    directories whose modification time changed since the last refresh are
+    listed again, and only the new or modified files in those directories have
+    their raster header read.
+
+    .. note::
+        Directory modification times only change when files are added, removed
+        or renamed. Products that are rewritten in place are not detected until
+        their directory changes.
+    """
+
+    index_name = "index.sqlite"
+
+    def __init__(
+        self,
+        gacos_dir: Union[Path, str],
+        index_file: Optional[Union[Path, str]] = None,
+        suffix: str = ".ztd.tif",
+    ) -> None:
+        """Initialize ProductIndex class
+
+        Parameters
+        ----------
+        gacos_dir : Union[Path, str]
+            The directory used to save gacos data.
+        index_file : Optional[Union[Path, str]], optional
+            The path of the index database. If None, ``index.sqlite`` in the
+            state directory of `gacos_dir` is used (see :func:`state_file`).
+            Default is None.
+        suffix : str, optional
+            The suffix of the gacos products to index. Default is ".ztd.tif".
+        """
+        self.gacos_dir = Path(gacos_dir)
+        if not self.gacos_dir.exists():
+            self.gacos_dir.mkdir(parents=True)
+        if index_file is None:
+            index_file = state_file(self.gacos_dir, self.index_name)
+        self.index_file = Path(index_file)
+        self.suffix = suffix
+        self._init_db()
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(gacos_dir={self.gacos_dir})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_file, timeout=60)
+
+    def _init_db(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS directories (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime_ns INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS products (
+                    path TEXT PRIMARY KEY,
+                    directory TEXT,
+                    date TEXT,
+                    west REAL,
+                    south REAL,
+                    east REAL,
+                    north REAL,
+                    time REAL,
+                    size INTEGER,
+                    mtime_ns INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_products_date ON products (date);
+                CREATE INDEX IF NOT EXISTS idx_products_directory
+                    ON products (directory);
+                CREATE INDEX IF NOT EXISTS idx_directories_parent
+                    ON directories (parent);
+                """)
+
+    def _parse_date(self, name: str) -> Optional[str]:
+        """Return the date (YYYYMMDD) of a product file name, or None if the
+        file is not a gacos product."""
+        if not name.endswith(self.suffix):
+            return None
+        stem = name.split(".")[0]
+        if len(stem) == 8 and stem.isdigit():
+            return stem
+        return None
+
+    def refresh(self) -> None:
+        """Update the index to match the products on disk. Only directories
+        whose modification time changed since last refresh are rescanned."""
+        with closing(self._connect()) as conn, conn:
+            known = dict(conn.execute("SELECT path, mtime_ns FROM directories"))
+            children = {}
+            for path, parent in conn.execute("SELECT path, parent FROM directories"):
+                children.setdefault(parent, []).append(path)
+
+            seen = set()
+            stack = [(os.path.abspath(self.gacos_dir), None)]
+            while stack:
+                dir_path, parent = stack.pop()
+                try:
+                    mtime_ns = os.stat(dir_path).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                seen.add(dir_path)
+
+                if known.get(dir_path) == mtime_ns:
+                    stack.extend((d, dir_path) for d in children.get(dir_path, []))
+                    continue
+
+                subdirs = self._scan_directory(conn, dir_path)
+                stack.extend((d, dir_path) for d in subdirs)
+                conn.execute(
+                    "INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                    (dir_path, parent, mtime_ns),
+                )
+
+            removed = [(d,) for d in known if d not in seen]
+            conn.executemany("DELETE FROM directories WHERE path = ?", removed)
+            conn.executemany("DELETE FROM products WHERE directory = ?", removed)
+
+    def _scan_directory(self, conn: sqlite3.Connection, dir_path: str) -> list:
+        """List a directory, update the products in it and return the paths of
+        its subdirectories."""
+        indexed = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in conn.execute(
+                "SELECT path, size, mtime_ns FROM products WHERE directory = ?",
+                (dir_path,),
+            )
+        }
+
+        subdirs = []
+        present = set()
+        rows = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != state_dir_name:
+                        subdirs.append(entry.path)
+                    continue
+                date = self._parse_date(entry.name)
+                if date is None:
+                    continue
+                present.add(entry.path)
+                stat = entry.stat()
+                if indexed.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                rows.append(self._product_row(entry.path, dir_path, date, stat))
+
+        self._upsert(conn, rows)
+        conn.executemany(
+            "DELETE FROM products WHERE path = ?",
+            [(p,) for p in indexed if p not in present],
+        )
+        return subdirs
+
+    def _product_row(
+        self,
+        path: str,
+        dir_path: str,
+        date: str,
+        stat: os.stat_result,
+        time: Optional[float] = None,
+    ) -> tuple:
+        try:
+            with rasterio.open(path) as src:
+                west, south, east, north = src.bounds
+        except rasterio.errors.RasterioIOError:
+            west = south = east = north = None
+        return (
+            path,
+            dir_path,
+            date,
+            west,
+            south,
+            east,
+            north,
+            time,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def _upsert(self, conn: sqlite3.Connection, rows: list) -> None:
+        # keep the acquisition time of products that are re-indexed
+        conn.executemany(
+            """
+            INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                west = excluded.west,
+                south = excluded.south,
+                east = excluded.east,
+                north = excluded.north,
+                time = COALESCE(excluded.time, products.time),
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns
+            """,
+            rows,
+        )
+
+    def add_files(
+        self,
+        files: Iterable[Union[Path, str]],
+        time: Optional[float] = None,
+    ) -> None:
+        """Add products to the index directly, without rescanning directories.
+
+        Parameters
+        ----------
+        files : Iterable[Union[Path, str]]
+            The paths of products. Files that are not gacos products are ignored.
+        time : Optional[float], optional
+            The acquisition time (hours) of the products. Default is None.
+        """
+        rows = []
+        for file in files:
+            file = Path(os.path.abspath(file))
+            date = self._parse_date(file.name)
+            if date is None or not file.exists():
+                continue
+            rows.append(
+                self._product_row(str(file), str(file.parent), date, file.stat(), time)
+            )
+        with closing(self._connect()) as conn, conn:
+            self._upsert(conn, rows)
+
+    def query(
+        self,
+        dates: Optional[Iterable[str]] = None,
+    ) -> pd.DataFrame:
+        """Query the indexed products.
+
+        Parameters
+        ----------
+        dates : Optional[Iterable[str]], optional
+            Only return products of these dates (YYYYMMDD). If None, all
+            products are returned. Default is None.
+
+        Returns
+        -------
+        df_products : pd.DataFrame
+            The products with columns of path, directory, date, west, south,
+            east, north, time, size and mtime_ns.
+        """
+        with closing(self._connect()) as conn:
+            if dates is None:
+                return pd.read_sql_query("SELECT * FROM products", conn)
+            conn.execute("CREATE TEMP TABLE query_dates (date TEXT PRIMARY KEY)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO query_dates VALUES (?)",
+                [(str(d),) for d in dates],
+            )
+            return pd.read_sql_query(
+                "SELECT products.* FROM products "
+                "JOIN query_dates ON products.date = query_dates.date",
+                conn,
+            )
+
+    def coverage(
+        self,
+        bounds: tuple[float, float, float, float],
+        dates: Optional[Iterable[str]] = None,
+        tolerance: float = 0.01,
+    ) -> pd.DataFrame:
+        """Compute how much of `bounds` the indexed products cover per date.
+
+        Parameters
+        ----------
+        bounds : tuple[float, float, float, float]
+            The area of interest (W, S, E, N).
+        dates : Optional[Iterable[str]], optional
+            The dates (YYYYMMDD) to compute. If None, all indexed dates are
+            computed. Default is None.
+        tolerance : float, optional
+            The distance in degrees by which the product bounds are extended,
+            so that products whose edges are snapped to the pixel grid still
+            cover `bounds`. Default is 0.01.
+
+        Returns
+        -------
+        df_coverage : pd.DataFrame
+            The coverage indexed by date, with columns of coverage (the
+            fraction of `bounds` covered by the union of the products of the
+            date) and products (the paths of the products that intersect with
+            `bounds`). Products whose bounds are unknown, i.e. whose header
+            cannot be read, are ignored so that their dates are downloaded
+            again. Dates without products have a coverage of 0.
+        """
+        df_products = self.query(dates)
+        groups = dict(tuple(df_products.groupby("date")))
+        if dates is None:
+            dates = list(groups)
+        bounds = tuple(float(bounds[i]) for i in range(4))
+        rows = []
+        for date in dates:
+            df_date = groups.get(str(date), df_products.iloc[:0])
+            rects, paths = [], []
+            for row in df_date.itertuples():
+                rect = (row.west, row.south, row.east, row.north)
+                # unreadable products, e.g. truncated files, cover nothing
+                if pd.isna(list(rect)).any():
+                    continue
+                rect = (
+                    rect[0] - tolerance,
+                    rect[1] - tolerance,
+                    rect[2] + tolerance,
+                    rect[3] + tolerance,
+                )
+                if covered_fraction(bounds, [rect]) > 0:
+                    rects.append(rect)
+                    paths.append(row.path)
+            rows.append((str(date), covered_fraction(bounds, rects), paths))
+        return pd.DataFrame(rows, columns=["date", "coverage", "products"]).set_index(
+            "date"
+        )
+
+    @property
+    def dates(self) -> np.ndarray:
+        """The unique dates (YYYYMMDD) of the indexed products."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT date FROM products ORDER BY date"
+            ).fetchall()
+        return np.array([r[0] for r in rows], dtype=str)
+
+
+def covered_fraction(
+    bounds: tuple[float, float, float, float], rects: list[tuple]
+) -> float:
+    """The fraction of `bounds` covered by the union of rectangles, all in
+    (W, S, E, N) order."""
+    west, south, east, north = bounds
+    area = (east - west) * (north - south)
+    if area <= 0 or len(rects) == 0:
+        return 0.0
+    rects = np.clip(
+        np.asarray(rects, dtype=float),
+        [west, south, west, south],
+        [east, north, east, north],
+    )
+    # sum the cells of the grid formed by all edges that are covered
+    xs = np.unique(np.concatenate([rects[:, 0], rects[:, 2]]))
+    ys = np.unique(np.concatenate([rects[:, 1], rects[:, 3]]))
+    cx, cy = (xs[:-1] + xs[1:]) / 2, (ys[:-1] + ys[1:]) / 2
+    covered = np.zeros((len(cy), len(cx)), dtype=bool)
+    for w, s, e, n in rects:
+        covered |= ((cx > w) & (cx < e))[None, :] & ((cy > s) & (cy < n))[:, None]
+    cell_area = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+    return float(min(1.0, (cell_area * covered).sum() / area))
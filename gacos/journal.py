@@ -0,0 +1,137 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Literal, Optional, Union
+
+import pandas as pd
+
+TransferState = Literal["pending", "downloading", "downloaded", "extracted", "verified"]
+
+
+class TransferJournal:
+    """A persistent journal of the transfer state of GACOS files.
+
+    The journal is a SQLite database recording, for each url, its state and
+    the number of bytes downloaded so far. The states of a url are, in order:
+
+    * ``pending``: the url is queued, or its last transfer failed.
+    * ``downloading``: the file is being downloaded.
+    * ``downloaded``: the file is completely downloaded.
+    * ``extracted``: the file passed the integrity check and has been
+      extracted.
+    * ``verified``: all extracted files exist on disk.
+    """
+
+    journal_name = "journal.sqlite"
+
+    def __init__(self, journal_file: Union[Path, str]) -> None:
+        """Initialize TransferJournal class
+
+        Parameters
+        ----------
+        journal_file : Union[Path, str]
+            The path of the journal database.
+        """
+        self.journal_file = Path(journal_file)
+        self._init_db()
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(journal_file={self.journal_file})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.journal_file, timeout=60)
+
+    def _init_db(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transfers (
+                    url TEXT PRIMARY KEY,
+                    state TEXT,
+                    file TEXT,
+                    offset INTEGER,
+                    total INTEGER,
+                    updated REAL
+                )
+                """)
+
+    def update(
+        self,
+        url: str,
+        state: TransferState,
+        file: Optional[Union[Path, str]] = None,
+        offset: Optional[int] = None,
+        total: Optional[int] = None,
+    ) -> None:
+        """Update the transfer state of a url. Arguments that are None keep
+        their recorded values.
+
+        Parameters
+        ----------
+        url : str
+            The url of the GACOS file.
+        state : str
+            The new state of the url.
+        file : Optional[Union[Path, str]], optional
+            The path the file is downloaded to. Default is None.
+        offset : Optional[int], optional
+            The number of bytes downloaded. Default is None.
+        total : Optional[int], optional
+            The total size of the file in bytes. Default is None.
+        """
+        file = None if file is None else str(file)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    state = excluded.state,
+                    file = COALESCE(excluded.file, transfers.file),
+                    offset = COALESCE(excluded.offset, transfers.offset),
+                    total = COALESCE(excluded.total, transfers.total),
+                    updated = excluded.updated
+                """,
+                (url, state, file, offset, total, time.time()),
+            )
+
+    def add_pending(self, urls: Iterable[str]) -> None:
+        """Record urls that are not in the journal yet as pending."""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO transfers (url, state, offset, updated) "
+                "VALUES (?, 'pending', 0, ?)",
+                [(url, time.time()) for url in urls],
+            )
+
+    def states(self, urls: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Return the recorded transfers.
+
+        Parameters
+        ----------
+        urls : Optional[Iterable[str]], optional
+            Only return the transfers of these urls. If None, all transfers are
+            returned. Default is None.
+
+        Returns
+        -------
+        df_transfers : pd.DataFrame
+            The transfers indexed by url, with columns of state, file, offset,
+            total and updated.
+        """
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query("SELECT * FROM transfers", conn, index_col="url")
+        if urls is not None:
+            df = df[df.index.isin(list(urls))]
+        return df
+
+    def state(self, url: str) -> Optional[TransferState]:
+        """Return the state of a url, or None if it is not recorded."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT state FROM transfers WHERE url = ?", (url,)
+            ).fetchone()
+        return None if row is None else row[0]
@@ -0,0 +1,268 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Literal, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+SubmissionState = Literal[
+    "failed", "submitted", "acknowledged", "received", "downloaded"
+]
+
+# states of requests that are expected to be answered by GACOS
+pending_states = ("submitted", "acknowledged", "received")
+
+# the tolerance in hours of matching the times of requests and acquisitions
+match_time_tolerance = 1 / 60 * 10
+
+
+def time_to_hours(_time: Union[str, float]) -> float:
+    """Convert an acquisition time of "HH:MM" or hours to hours."""
+    if isinstance(_time, str):
+        hour, minute = _time.split(":")[:2]
+        return int(hour) + int(minute) / 60
+    return float(_time)
+
+
+class SubmissionLedger:
+    """A persistent ledger of the dates submitted to GACOS.
+
+    The ledger is a SQLite database with one row per (bounding box, time,
+    date), recording how far the request of the date has got:
+
+    * ``failed``: the submission was rejected.
+    * ``submitted``: the request is being posted to GACOS.
+    * ``acknowledged``: GACOS accepted the request.
+    * ``received``: the GACOS email with the url of the date arrived.
+    * ``downloaded``: the GACOS file of the date has been downloaded.
+
+    :class:`Submitter` records ``submitted``, ``acknowledged`` and ``failed``.
+    :class:`GACOSEmail` and :class:`Downloader` mark ``received`` and
+    ``downloaded``, matching the rows with a tolerance as the bounding box and
+    time in emails may be rounded. Marks never move a row back to an earlier
+    state. :meth:`SarDataset.gen_datetime_patches` skips the dates that are
+    pending, i.e. submitted but not downloaded yet, within a timeout.
+    """
+
+    ledger_name = "ledger.sqlite"
+    states_order = ["failed", "submitted", "acknowledged", "received", "downloaded"]
+
+    def __init__(self, ledger_file: Union[Path, str]) -> None:
+        """Initialize SubmissionLedger class
+
+        Parameters
+        ----------
+        ledger_file : Union[Path, str]
+            The path of the ledger database. It is created if not exists.
+        """
+        self.ledger_file = Path(ledger_file)
+        self._init_db()
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(ledger_file={self.ledger_file})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.ledger_file, timeout=60)
+
+    def _init_db(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    west REAL,
+                    south REAL,
+                    east REAL,
+                    north REAL,
+                    time REAL,
+                    date TEXT,
+                    state TEXT,
+                    url TEXT,
+                    updated REAL,
+                    PRIMARY KEY (west, south, east, north, time, date)
+                );
+                CREATE INDEX IF NOT EXISTS idx_submissions_date
+                    ON submissions (date);
+                """)
+
+    @staticmethod
+    def _key(
+        bounds: tuple[float, float, float, float], _time: Union[str, float]
+    ) -> tuple:
+        west, south, east, north = [round(float(bounds[i]), 4) for i in range(4)]
+        return west, south, east, north, round(time_to_hours(_time), 4)
+
+    def record(
+        self,
+        bounds: tuple[float, float, float, float],
+        _time: Union[str, float],
+        dates: Iterable[str],
+        state: SubmissionState,
+    ) -> None:
+        """Record the state of submitted dates, overwriting their previous
+        state.
+
+        Parameters
+        ----------
+        bounds : tuple[float, float, float, float]
+            The bounding box (W, S, E, N) of the request.
+        _time : Union[str, float]
+            The acquisition time of the request, "HH:MM" or hours.
+        dates : Iterable[str]
+            The dates (YYYYMMDD) of the request.
+        state : str
+            The new state of the dates.
+        """
+        key = self._key(bounds, _time)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                """
+                INSERT INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)
+                ON CONFLICT (west, south, east, north, time, date) DO UPDATE SET
+                    state = excluded.state,
+                    updated = excluded.updated
+                """,
+                [(*key, str(d), state, now) for d in dates],
+            )
+
+    def mark(
+        self,
+        bounds: tuple[float, float, float, float],
+        _time: Union[str, float],
+        dates: Iterable[str],
+        state: SubmissionState,
+        url: Optional[str] = None,
+        insert: bool = False,
+        bbox_tolerance: float = 1e-3,
+        time_tolerance: float = match_time_tolerance,
+    ) -> int:
+        """Advance the state of dates whose bounding box and time match within
+        a tolerance. Rows already in a later state are not changed.
+
+        Parameters
+        ----------
+        bounds : tuple[float, float, float, float]
+            The bounding box (W, S, E, N) of the GACOS file.
+        _time : Union[str, float]
+            The acquisition time of the GACOS file, "HH:MM" or hours.
+        dates : Iterable[str]
+            The dates (YYYYMMDD) of the GACOS file.
+        state : str
+            The new state of the dates.
+        url : Optional[str], optional
+            The url of the GACOS file. Default is None.
+        insert : bool, optional
+            Whether to add the dates that are not in the ledger, e.g. the
+            dates submitted before the ledger is used. Default is False.
+        bbox_tolerance : float, optional
+            The tolerance of bounding box in degrees. Default is 0.001.
+        time_tolerance : float, optional
+            The tolerance of time in hours. Default is 10 minutes.
+
+        Returns
+        -------
+        n : int
+            The number of dates whose state changed or were inserted.
+        """
+        west, south, east, north, hours = self._key(bounds, _time)
+        rank = self.states_order.index(state)
+        # rank of the recorded state, as a SQL expression
+        rank_sql = "CASE state " + " ".join(
+            f"WHEN '{s}' THEN {i}" for i, s in enumerate(self.states_order)
+        )
+        now = time.time()
+        n = 0
+        with closing(self._connect()) as conn, conn:
+            for date in dates:
+                matched = conn.execute(
+                    f"""
+                    SELECT rowid, {rank_sql} END FROM submissions
+                    WHERE date = ?
+                        AND ABS(west - ?) <= ? AND ABS(south - ?) <= ?
+                        AND ABS(east - ?) <= ? AND ABS(north - ?) <= ?
+                        AND ABS(time - ?) <= ?
+                    """,
+                    (
+                        str(date),
+                        *(west, bbox_tolerance, south, bbox_tolerance),
+                        *(east, bbox_tolerance, north, bbox_tolerance),
+                        hours,
+                        time_tolerance,
+                    ),
+                ).fetchall()
+                rowids = [(rowid,) for rowid, _rank in matched if _rank < rank]
+                conn.executemany(
+                    "UPDATE submissions SET state = ?, "
+                    "url = COALESCE(?, url), updated = ? WHERE rowid = ?",
+                    [(state, url, now, rowid) for (rowid,) in rowids],
+                )
+                n += len(rowids)
+                if insert and not matched:
+                    conn.execute(
+                        "INSERT INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (west, south, east, north, hours, str(date), state, url, now),
+                    )
+                    n += 1
+        return n
+
+    def pending(
+        self,
+        bounds: tuple[float, float, float, float],
+        _time: Union[str, float],
+        timeout: Optional[float] = None,
+        time_tolerance: float = 0,
+    ) -> np.ndarray:
+        """Return the dates of a request that are pending, i.e. submitted but
+        not downloaded yet.
+
+        Parameters
+        ----------
+        bounds : tuple[float, float, float, float]
+            The bounding box (W, S, E, N) of the request.
+        _time : Union[str, float]
+            The acquisition time of the request, "HH:MM" or hours.
+        timeout : Optional[float], optional
+            The time in seconds after which a pending date is considered lost
+            and can be submitted again. If None, pending dates never time out.
+            Default is None.
+        time_tolerance : float, optional
+            The tolerance of time in hours, e.g. the tolerance used to cluster
+            the acquisition times of requests. Default is 0.
+
+        Returns
+        -------
+        dates : np.ndarray
+            The pending dates (YYYYMMDD).
+        """
+        since = -np.inf if timeout is None else time.time() - timeout
+        west, south, east, north, hours = self._key(bounds, _time)
+        placeholders = ",".join("?" * len(pending_states))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT DISTINCT date FROM submissions
+                WHERE west = ? AND south = ? AND east = ? AND north = ?
+                    AND ABS(time - ?) <= ? AND state IN ({placeholders})
+                    AND updated >= ?
+                ORDER BY date
+                """,
+                (
+                    *(west, south, east, north, hours),
+                    # times are rounded to 4 decimals in the ledger
+                    time_tolerance + 1e-4,
+                    *pending_states,
+                    since,
+                ),
+            ).fetchall()
+        return np.array([r[0] for r in rows], dtype=str)
+
+    def states(self) -> pd.DataFrame:
+        """Return all the recorded dates, with columns of west, south, east,
+        north, time, date, state, url and updated."""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query("SELECT * FROM submissions", conn)
@@ -0,0 +1,208 @@
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .datasets import SarDataset
+from .plan import time_to_minutes
+
+
+def _bounds(dataset: SarDataset) -> tuple[float, float, float, float]:
+    return tuple(float(dataset.bounds[i]) for i in range(4))
+
+
+def _union_bounds(bounds: Sequence[tuple]) -> tuple[float, float, float, float]:
+    bounds = np.asarray(bounds, dtype=float)
+    return (
+        float(bounds[:, 0].min()),
+        float(bounds[:, 1].min()),
+        float(bounds[:, 2].max()),
+        float(bounds[:, 3].max()),
+    )
+
+
+def _unique_acquisitions(
+    date_times: pd.DatetimeIndex, tolerance: float
+) -> pd.DatetimeIndex:
+    """Drop the acquisitions within `tolerance` minutes after a kept
+    acquisition of the same date, e.g. the same pass seen by adjacent frames."""
+    kept = []
+    for date_time in date_times.unique().sort_values():
+        if (
+            len(kept) > 0
+            and date_time.date() == kept[-1].date()
+            and date_time - kept[-1] <= pd.Timedelta(minutes=tolerance)
+        ):
+            continue
+        kept.append(date_time)
+    return pd.DatetimeIndex(kept)
+
+
+class MergedDataset(SarDataset):
+    """A dataset covering several overlapping datasets (frames), so that each
+    date and time is requested and downloaded once for all of them.
+
+    The bounds are the union of the bounds of the frames, and the acquisitions
+    are the union of their acquisitions, where the acquisitions of a date
+    within `time_tolerance` minutes of each other are kept once. Use :func:`merge_datasets` to group
+    frames into merged datasets. The times of frames merged within a
+    tolerance are merged into one request time with the same tolerance by
+    :meth:`plan_patches`, so that a date shared by the frames is requested
+    once.
+    """
+
+    def __init__(
+        self,
+        datasets: Sequence[SarDataset],
+        gacos_dir: Optional[Union[Path, str]] = None,
+        time_tolerance: float = 0,
+    ) -> None:
+        """Initialize MergedDataset class
+
+        Parameters
+        ----------
+        datasets : Sequence[SarDataset]
+            The datasets (frames) to merge.
+        gacos_dir : Optional[Union[Path, str]], optional
+            The directory used to save gacos data of the merged dataset.
+            Default is None.
+        time_tolerance : float, optional
+            The maximum difference in minutes between the acquisition times of
+            the frames, used as the default tolerance of merging times in
+            :meth:`plan_patches`. Default is 0.
+        """
+        if len(datasets) == 0:
+            raise ValueError("At least one dataset is required.")
+        self.members = list(datasets)
+        self.time_tolerance = time_tolerance
+        bounds = _union_bounds([_bounds(ds) for ds in self.members])
+        date_times = pd.DatetimeIndex(
+            np.concatenate([ds.date_times.values for ds in self.members])
+        )
+        date_times = _unique_acquisitions(date_times, time_tolerance)
+        super().__init__(bounds, date_times, gacos_dir)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    bounds={self.bounds}, \n"
+            f"    frames={len(self.members)}, \n"
+            f"    times={len(self.times)}, \n"
+            f"    dates={len(self.dates)}\n"
+            ")"
+        )
+
+    @property
+    def frames(self) -> pd.DataFrame:
+        """The frames served by the GACOS products of the merged dataset, with
+        one row per (frame, date) and columns of frame, date and time. The
+        frame is the home directory of the dataset if it has one, otherwise its
+        position in :attr:`members`."""
+        dfs = []
+        for i, ds in enumerate(self.members):
+            frame = str(getattr(ds, "home_dir", i))
+            dfs.append(
+                pd.DataFrame(
+                    {
+                        "frame": frame,
+                        "date": np.asarray(ds.dates),
+                        "time": ds._times.to_numpy(),
+                    }
+                )
+            )
+        return pd.concat(dfs, ignore_index=True)
+
+    def serves(self, date: str) -> list[SarDataset]:
+        """Return the frames that need the GACOS product of a date."""
+        return [ds for ds in self.members if date in set(ds.dates)]
+
+
+def _times_compatible(times1: Sequence[str], times2: Sequence[str], tolerance) -> bool:
+    minutes1 = np.array([time_to_minutes(t) for t in times1])
+    minutes2 = np.array([time_to_minutes(t) for t in times2])
+    return bool((np.abs(minutes1[:, None] - minutes2[None, :]) <= tolerance).any())
+
+
+def merge_datasets(
+    datasets: Sequence[SarDataset],
+    max_extent: Union[float, tuple[float, float]] = 5,
+    time_tolerance: float = 10,
+    buffer: float = 0,
+    gacos_dir: Optional[Union[Path, str]] = None,
+) -> list[MergedDataset]:
+    """Group overlapping datasets (frames) into merged datasets, so that each
+    group submits and downloads one GACOS product per date and time.
+
+    Two groups are merged if their bounds intersect (after extending them by
+    `buffer`), they have acquisition times within `time_tolerance` minutes,
+    and the union of their bounds is not larger than `max_extent`. Groups are
+    merged agglomeratively, smallest merged area first.
+
+    Parameters
+    ----------
+    datasets : Sequence[SarDataset]
+        The datasets to group.
+    max_extent : Union[float, tuple[float, float]], optional
+        The maximum width and height in degrees of merged bounds. A single
+        number applies to both. Default is 5.
+    time_tolerance : float, optional
+        The maximum difference in minutes between acquisition times of merged
+        datasets. It is kept as the :attr:`MergedDataset.time_tolerance` of
+        the merged datasets, so that their requests merge the times of the
+        frames. Default is 10.
+    buffer : float, optional
+        The distance in degrees by which bounds are extended when testing
+        whether they intersect, to merge frames that are close but do not
+        overlap. Default is 0.
+    gacos_dir : Optional[Union[Path, str]], optional
+        The directory used to save gacos data of the merged datasets. Default
+        is None.
+
+    Returns
+    -------
+    merged : list[MergedDataset]
+        The merged datasets. Datasets that cannot be merged with others form
+        a group on their own.
+    """
+    max_width, max_height = np.broadcast_to(np.asarray(max_extent, dtype=float), 2)
+    groups = [[i] for i in range(len(datasets))]
+    bounds = [_bounds(ds) for ds in datasets]
+    times = [list(ds.times) for ds in datasets]
+
+    def mergeable(g1, g2):
+        w1, s1, e1, n1 = _union_bounds([bounds[i] for i in g1])
+        w2, s2, e2, n2 = _union_bounds([bounds[i] for i in g2])
+        intersects = (
+            w1 - buffer <= e2
+            and w2 - buffer <= e1
+            and s1 - buffer <= n2
+            and s2 - buffer <= n1
+        )
+        if not intersects:
+            return None
+        west, south, east, north = min(w1, w2), min(s1, s2), max(e1, e2), max(n1, n2)
+        if east - west > max_width or north - south > max_height:
+            return None
+        times1 = sum((times[i] for i in g1), [])
+        times2 = sum((times[i] for i in g2), [])
+        if not _times_compatible(times1, times2, time_tolerance):
+            return None
+        return (east - west) * (north - south)
+
+    while True:
+        best = None
+        for a in range(len(groups)):
+            for b in range(a + 1, len(groups)):
+                area = mergeable(groups[a], groups[b])
+                if area is not None and (best is None or area < best[0]):
+                    best = (area, a, b)
+        if best is None:
+            break
+        _, a, b = best
+        groups[a] = groups[a] + groups.pop(b)
+
+    return [
+        MergedDataset([datasets[i] for i in g], gacos_dir, time_tolerance)
+        for g in groups
+    ]
@@ -1,9 +1,21 @@
 import email
 import email.message
+import functools
 import getpass
 import imaplib
+import json
+import mmap
+import os
 import poplib
 import re
+import threading
+import warnings
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
 from email.parser import Parser
 from email.utils import parseaddr
 from pathlib import Path
@@ -12,6 +24,9 @@ from typing import Literal, Optional, Union
 import pandas as pd
 from tqdm.auto import tqdm
 
+from .catalog import UrlCatalog, is_catalog_file
+from .ledger import SubmissionLedger
+
 
 class GACOSEmail:
     """a class to retrieve gacos urls from email.
@@ -23,13 +38,15 @@ class GACOSEmail:
         avoid polluting your own email account**.
     """
 
+    fetch_batch_size = 100
+
     def __init__(
         self,
         username: str,
         password: str,
         host: str,
         prompt: bool = False,
-        email_protocol: Literal["imap", "pop3"] = "imap",
+        email_protocol: Literal["imap", "pop3", "file"] = "imap",
         port: Optional[int] = None,
         gacos_email: str = "gacos2017@foxmail.com",
         gacos_suffix: str = "tar.gz",
@@ -37,6 +54,7 @@ class GACOSEmail:
         end_date: Optional[str] = None,
         date_args: Optional[dict] = None,
         ssl: bool = False,
+        ledger: Optional[Union[SubmissionLedger, Path, str]] = None,
     ) -> None:
         """Retrieve gacos urls from email.
 
@@ -49,12 +67,16 @@ class GACOSEmail:
         host : str
             The host of the email address. For example, the host of gmail for
             imap is "imap.gmail.com". You can find the host of your email
-            settings or search it on the Internet.
+            settings or search it on the Internet. For the "file" protocol,
+            this is the path of an mbox file, a Maildir directory, or a
+            directory of .eml files.
         prompt: bool, optional
             Prompt for username and/or password interactively when they are not
             provided as keyword parameters. Default is False.
-        email_protocol : str, one of ["imap", "pop3"], optional
-            The protocol of the email. Default is "imap".
+        email_protocol : str, one of ["imap", "pop3", "file"], optional
+            The protocol of the email. "file" reads an email archive on disk
+            (see `host`) instead of connecting to a mail server, and `username`
+            and `password` are not used. Default is "imap".
         port : int, optional
             The port of the host of your email. If None, the default port will be
             used. Default is None.
@@ -70,6 +92,16 @@ class GACOSEmail:
             The arguments are passed to pandas.to_datetime. Default is None.
         ssl : bool, optional
             Whether to use SSL connection. Default is False.
+        ledger : Optional[Union[SubmissionLedger, Path, str]], optional
+            The :class:`SubmissionLedger` (or its path) in which the dates of
+            retrieved urls are marked as received, so that they are not
+            submitted again. Default is None.
+
+        .. note::
+            For IMAP, the sender and date range are searched on the server and
+            only the headers of the found messages are fetched, in batches of
+            :attr:`fetch_batch_size` messages. The bodies are fetched only for
+            the messages that match. Messages are not marked as read.
         """
         if prompt:
             self.username = None
@@ -83,6 +115,9 @@ class GACOSEmail:
         self.gacos_email = gacos_email
         self.gacos_suffix = gacos_suffix
         self.ssl = ssl
+        if ledger is not None and not isinstance(ledger, SubmissionLedger):
+            ledger = SubmissionLedger(ledger)
+        self.ledger = ledger
 
         # date part
         self.start_date = start_date
@@ -91,128 +126,525 @@ class GACOSEmail:
             date_args = {}
         self.date_args = date_args
 
-    def _retrieve_gacos_urls_pop3(self):
+    def _is_gacos_message(self, messageObject: email.message.Message) -> bool:
+        """Whether a message is sent by gacos within the date range."""
+        senderContent = messageObject["From"]
+        senderRealName, senderAdr = parseaddr(senderContent)
+        if senderAdr != self.gacos_email:
+            return False
+        return in_date_range(
+            pd.to_datetime(messageObject["Date"]).tz_localize(None),
+            self.start_date,
+            self.end_date,
+            self.date_args,
+        )
+
+    def _parse_message(self, messageObject: email.message.Message):
+        """Parse gacos info from a message, return None if the message is not
+        a gacos message within the date range."""
+        if not self._is_gacos_message(messageObject):
+            return None
+        return parse_gacos_info_fast(
+            iter_content(messageObject),
+            gacos_suffix=self.gacos_suffix,
+        )
+
+    def _parse_raw(self, raw: str, check_sender: bool = True):
+        """Parse gacos info from a raw message. If `check_sender` is False, the
+        sender and date of the message are assumed to be checked already."""
+        messageObject = Parser().parsestr(raw)
+        if check_sender:
+            return self._parse_message(messageObject)
+        return parse_gacos_info_fast(
+            iter_content(messageObject),
+            gacos_suffix=self.gacos_suffix,
+        )
+
+    def _retrieve_gacos_urls_pop3(
+        self,
+        sync_state: Optional[dict] = None,
+        n_workers: int = 1,
+    ):
+        self._prompt_credentials()
         server = login_in_email_pop3(
             self.username, self.password, self.host, self.port, ssl=self.ssl
         )
         print(server.getwelcome())
 
-        nums = server.stat()[0]
-
-        gacos = []
-        for i in tqdm(range(1, nums + 1), unit=" emails", desc="Retrieving GACOS Urls"):
-            response, msgLines, octets = server.retr(i)
-            msgLinesToStr = b"\r\n".join(msgLines).decode("utf8", "ignore")
-            messageObject = Parser().parsestr(msgLinesToStr)
-
-            senderContent = messageObject["From"]
-            senderRealName, senderAdr = parseaddr(senderContent)
-            if senderAdr == self.gacos_email:
-                if not in_date_range(
-                    pd.to_datetime(messageObject["Date"]).tz_localize(None),
-                    self.start_date,
-                    self.end_date,
-                    self.date_args,
-                ):
-                    continue
-
-                msgBodyContents = get_content(messageObject)
-                info = parse_gacos_info(
-                    msgBodyContents,
-                    gacos_suffix=self.gacos_suffix,
-                )
-                if info is not None:
-                    gacos.append(info)
+        # unique ids of messages, used to skip messages seen in previous runs
+        response, uidl_lines, octets = server.uidl()
+        uidls = {}
+        for line in uidl_lines:
+            i, uidl = line.decode().split(maxsplit=1)
+            uidls[int(i)] = uidl
+        seen = set()
+        if sync_state is not None and sync_state.get("protocol") == "pop3":
+            seen = set(sync_state.get("uidl", []))
+        nums = [i for i in sorted(uidls) if uidls[i] not in seen]
+
+        futures = []
+        with parser_pool(n_workers) as pool:
+            for i in tqdm(nums, unit=" emails", desc="Retrieving GACOS Urls"):
+                response, msgLines, octets = server.retr(i)
+                msgLinesToStr = b"\r\n".join(msgLines).decode("utf8", "ignore")
+                futures.append(pool.submit(self._parse_raw, msgLinesToStr))
+            infos = [f.result() for f in futures]
+        gacos = [info for info in infos if info is not None]
 
         server.quit()
 
-        return gacos
-
-    def _retrieve_gacos_urls_imap(self):
+        sync_state = {"protocol": "pop3", "uidl": sorted(uidls.values())}
+        return gacos, sync_state
+
+    def _imap_search_criteria(self) -> list:
+        """IMAP SEARCH criteria of the sender and date range. SINCE and BEFORE
+        only compare dates (of the internal date of messages), so the range is
+        widened by one day on each side and checked exactly after fetching the
+        headers."""
+        criteria = ["FROM", f'"{self.gacos_email}"']
+        start_date = pd.to_datetime(self.start_date, **self.date_args)
+        end_date = pd.to_datetime(self.end_date, **self.date_args)
+        if not pd.isna(start_date):
+            criteria += ["SINCE", imap_date(start_date - pd.Timedelta(days=1))]
+        if not pd.isna(end_date):
+            criteria += ["BEFORE", imap_date(end_date + pd.Timedelta(days=2))]
+        return criteria
+
+    def _prompt_credentials(self) -> None:
+        """Prompt for the missing username and/or password once, and keep them
+        for the later connections. Must be called in the main thread before
+        connections are opened in other threads."""
+        self.username, self.password = prompt_credentials(self.username, self.password)
+
+    def _login_imap(self) -> imaplib.IMAP4:
+        self._prompt_credentials()
         server = login_in_email_imap(
             self.username, self.password, self.host, self.port, ssl=self.ssl
         )
-        server.select("inbox")
-        status, data = server.search(None, "ALL")
-
-        gacos = []
-        for i in tqdm(data[0].split(), unit=" emails", desc="Retrieving GACOS urls"):
-            res, msg = server.fetch(i, "(RFC822)")
-            for response_part in msg:
-                if isinstance(response_part, tuple):
-                    msgLines = response_part[1].decode("utf8", "ignore")
-                    break
-
-            messageObject = Parser().parsestr(msgLines)
-
-            senderContent = messageObject["From"]
-            senderRealName, senderAdr = parseaddr(senderContent)
-            if senderAdr == self.gacos_email:
-                if not in_date_range(
-                    pd.to_datetime(messageObject["Date"]).tz_localize(None),
-                    self.start_date,
-                    self.end_date,
-                    self.date_args,
-                ):
-                    continue
-
-                msgBodyContents = get_content(messageObject)
-                info = parse_gacos_info(
-                    msgBodyContents,
-                    gacos_suffix=self.gacos_suffix,
-                )
-                if info is not None:
-                    gacos.append(info)
+        server.select("inbox", readonly=True)
+        return server
 
+    def _retrieve_gacos_urls_imap(
+        self,
+        sync_state: Optional[dict] = None,
+        n_connections: int = 1,
+        n_workers: int = 1,
+    ):
+        server = self._login_imap()
+        gacos, sync_state = self._fetch_new_imap(
+            server, sync_state, n_connections, n_workers
+        )
         server.close()
+        return gacos, sync_state
 
-        return gacos
+    def _fetch_new_imap(
+        self,
+        server: imaplib.IMAP4,
+        sync_state: Optional[dict] = None,
+        n_connections: int = 1,
+        n_workers: int = 1,
+    ):
+        """Retrieve gacos info from the messages of the selected mailbox of
+        `server` that are newer than `sync_state`. If `n_connections` > 1, the
+        messages are split into contiguous UID ranges fetched by that many
+        connections concurrently."""
+        code, data = server.response("UIDVALIDITY")
+        if data[0] is not None:
+            uidvalidity = int(data[0])
+        else:
+            # UIDVALIDITY is only returned once after SELECT. Later calls on
+            # the same connection keep the recorded one.
+            uidvalidity = (sync_state or {}).get("uidvalidity")
+
+        # UIDs are only comparable between sessions with the same UIDVALIDITY
+        last_uid = 0
+        if (
+            sync_state is not None
+            and sync_state.get("protocol") == "imap"
+            and sync_state.get("uidvalidity") == uidvalidity
+        ):
+            last_uid = sync_state.get("last_uid", 0)
+
+        criteria = self._imap_search_criteria() + ["UID", f"{last_uid + 1}:*"]
+        status, data = server.uid("SEARCH", None, *criteria)
+        # "n:*" always matches the largest UID, even if it is less than n
+        uids = [i for i in data[0].split() if int(i) > last_uid]
+
+        pbar = tqdm(total=len(uids), unit=" emails", desc="Retrieving GACOS urls")
+        lock = threading.Lock()
+        with parser_pool(n_workers) as pool:
+            if n_connections <= 1:
+                futures = self._fetch_uids_imap(server, uids, pool, pbar, lock)
+            else:
+                size = -(-len(uids) // n_connections)
+                parts = [uids[i : i + size] for i in range(0, len(uids), size)]
+                with ThreadPoolExecutor(max_workers=n_connections) as executor:
+                    part_futures = [
+                        executor.submit(
+                            self._fetch_uids_imap, None, part, pool, pbar, lock
+                        )
+                        for part in parts
+                    ]
+                    # keep the UID order so that results are deterministic
+                    futures = [f for pf in part_futures for f in pf.result()]
+            infos = [f.result() for f in futures]
+        pbar.close()
+        gacos = [info for info in infos if info is not None]
+
+        sync_state = {
+            "protocol": "imap",
+            "uidvalidity": uidvalidity,
+            "last_uid": max([last_uid] + [int(i) for i in uids]),
+        }
+        return gacos, sync_state
+
+    def _fetch_uids_imap(
+        self,
+        server: Optional[imaplib.IMAP4],
+        uids: list,
+        pool: Executor,
+        pbar: tqdm,
+        lock: threading.Lock,
+    ) -> list[Future]:
+        """Fetch the messages of `uids` in batches and submit the gacos
+        messages to `pool` for parsing. If `server` is None, a new connection
+        is used. Return the parsing futures in the order of `uids`."""
+        new_connection = server is None
+        if new_connection:
+            server = self._login_imap()
+
+        futures = []
+        for start in range(0, len(uids), self.fetch_batch_size):
+            batch = uids[start : start + self.fetch_batch_size]
+            headers = imap_fetch(
+                server, batch, f"BODY.PEEK[HEADER.FIELDS ({_header_fields})]"
+            )
+
+            matched = []
+            for i, header in headers.items():
+                if self._is_gacos_message(Parser().parsestr(header, headersonly=True)):
+                    matched.append(i)
+
+            texts = imap_fetch(server, matched, "BODY.PEEK[TEXT]") if matched else {}
+            for i in matched:
+                futures.append(
+                    pool.submit(self._parse_raw, headers[i] + texts[i], False)
+                )
+            with lock:
+                pbar.update(len(batch))
+
+        if new_connection:
+            server.close()
+            server.logout()
+        return futures
 
     def retrieve_gacos_urls(
         self,
         output_file: Union[str, Path],
+        incremental: bool = False,
+        n_connections: int = 1,
+        n_workers: int = 1,
     ):
         """Retrieve gacos urls from username.
 
         Parameters
         ----------
         output_file : str or Path
-            The output file used to save the gacos urls.
+            The output file used to save the gacos urls. If the suffix of the
+            file is one of ".sqlite", ".sqlite3" and ".db", the urls are
+            appended to a :class:`UrlCatalog` database. Otherwise, the urls are
+            saved to a CSV file.
+        incremental : bool, optional
+            Whether to only retrieve the messages that arrived since the last
+            incremental call, and append their urls to `output_file`. The
+            position in the mailbox (the UIDVALIDITY and last seen UID for
+            IMAP, the seen UIDLs for POP3) is saved to a ``.sync.json`` file
+            beside `output_file`. Not supported for the "file" protocol, which
+            always reads the whole archive. Default is False.
+        n_connections : int, optional
+            The number of IMAP connections used to fetch messages concurrently.
+            The messages are split into contiguous UID ranges, one for each
+            connection. Ignored for POP3, which locks the mailbox to a single
+            session. Default is 1.
+        n_workers : int, optional
+            The number of processes used to parse the messages. Default is 1,
+            which parses messages in the current process.
+
+        .. note::
+            In incremental mode, messages seen in previous calls are skipped
+            even if `start_date` or `end_date` changed since then.
+
+        .. note::
+            The results do not depend on `n_connections` and `n_workers`: urls
+            are kept in the order of messages, and only the first of duplicated
+            urls is kept.
         """
+        sync_state = self._load_sync_state(output_file) if incremental else None
+
+        if self.email_protocol in ["pop3", "imap"]:
+            self._prompt_credentials()
         if self.email_protocol == "pop3":
-            gacos = self._retrieve_gacos_urls_pop3()
+            gacos, sync_state = self._retrieve_gacos_urls_pop3(sync_state, n_workers)
         elif self.email_protocol == "imap":
-            gacos = self._retrieve_gacos_urls_imap()
+            gacos, sync_state = self._retrieve_gacos_urls_imap(
+                sync_state, n_connections, n_workers
+            )
+        elif self.email_protocol == "file":
+            gacos, sync_state = self._retrieve_gacos_urls_file(n_workers)
         else:
-            raise ValueError("email_protocol must be 'pop3' or 'imap'.")
+            raise ValueError("email_protocol must be 'pop3', 'imap' or 'file'.")
+
+        saved = self._save_gacos(gacos, output_file, append=incremental)
+        if incremental and saved:
+            self._dump_sync_state(output_file, sync_state)
+
+    def _retrieve_gacos_urls_file(self, n_workers: int = 1):
+        path = Path(self.host)
+        if not path.exists():
+            raise FileNotFoundError(f"{path} does not exist")
+        spans = mail_archive_spans(path)
+
+        # messages are read by the workers, only their locations are sent
+        with parser_pool(n_workers) as pool:
+            chunksize = max(1, len(spans) // (n_workers * 4))
+            infos = list(
+                tqdm(
+                    pool.map(self._parse_span, spans, chunksize=chunksize),
+                    total=len(spans),
+                    unit=" emails",
+                    desc="Retrieving GACOS urls",
+                )
+            )
+        gacos = [info for info in infos if info is not None]
+        return gacos, {"protocol": "file"}
+
+    def _parse_span(self, span: tuple[str, int, Optional[int]]):
+        """Parse gacos info from a message stored in bytes [start, end) of a
+        file. If end is None, the message extends to the end of file."""
+        file, start, end = span
+        with open(file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                raw = mm[start:end].decode("utf8", "ignore")
+        return self._parse_raw(raw)
+
+    @classmethod
+    def from_archive(cls, path: Union[str, Path], **kwargs) -> "GACOSEmail":
+        """Create a GACOSEmail that reads emails from an archive on disk
+        instead of a mail server.
+
+        Parameters
+        ----------
+        path : str or Path
+            The path of an mbox file, a Maildir directory, or a directory of
+            .eml files.
+        **kwargs
+            Other arguments passed to :class:`GACOSEmail`, e.g. `start_date`.
+        """
+        return cls(None, None, str(path), email_protocol="file", **kwargs)
+
+    def _load_sync_state(self, output_file: Union[str, Path]) -> Optional[dict]:
+        """Load the mailbox position of incremental retrieval for
+        `output_file`, or None if not exists."""
+        state_file = sync_state_file(output_file)
+        if not state_file.exists():
+            return None
+        with open(state_file) as f:
+            return json.load(f)
+
+    def _dump_sync_state(self, output_file: Union[str, Path], sync_state: dict):
+        """Save the mailbox position of incremental retrieval for
+        `output_file`."""
+        with open(sync_state_file(output_file), "w") as f:
+            json.dump(sync_state, f)
+
+    def _save_gacos(
+        self,
+        gacos: list,
+        output_file: Union[str, Path],
+        append: bool = False,
+    ) -> bool:
+        """Save gacos urls to `output_file`. Return whether succeeded."""
+        self._mark_received(gacos)
+        if is_catalog_file(output_file):
+            n = UrlCatalog(output_file).append(gacos)
+            print(f"Append {n} new gacos urls to {output_file}")
+            return True
 
         cols = ["url", "south", "north", "west", "east", "time", "date"]
-        df_gacos = pd.DataFrame(gacos, columns=cols).drop_duplicates(subset="url")
+        df_gacos = pd.DataFrame(gacos, columns=cols)
+        if append and Path(output_file).exists():
+            df_old = pd.read_csv(output_file, index_col=0)
+            df_gacos = pd.concat([df_old, df_gacos], ignore_index=True)
+        df_gacos = df_gacos.drop_duplicates(subset="url")
 
         # save to file
         try:
             df_gacos.to_csv(output_file)
             print(f"Save gacos urls to {output_file}")
+            return True
         except Exception as e:
             self.df_gacos = df_gacos
             print(e)
             print("Save gacos urls failed")
             print("You can access the gacos urls by `df_gacos` attribute.")
+            return False
+
+    def _mark_received(self, gacos: list) -> None:
+        """Mark the dates of retrieved urls as received in the ledger."""
+        if self.ledger is None:
+            return
+        for url, south, north, west, east, _time, date_list in gacos:
+            if None in (south, north, west, east, _time):
+                continue
+            self.ledger.mark(
+                (west, south, east, north),
+                _time,
+                date_list,
+                "received",
+                url=url,
+                insert=True,
+            )
+
+
+def sync_state_file(output_file: Union[str, Path]) -> Path:
+    """The file used to save the mailbox position of incremental retrieval
+    for `output_file`."""
+    output_file = Path(output_file)
+    return output_file.with_name(output_file.name + ".sync.json")
+
+
+class _InlineExecutor(Executor):
+    """An executor that runs the submitted functions immediately in the
+    current thread."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def parser_pool(n_workers: int = 1) -> Executor:
+    """Return a process pool of `n_workers` processes to parse messages, or an
+    executor running in the current thread if `n_workers` is 1."""
+    if n_workers > 1:
+        return ProcessPoolExecutor(max_workers=n_workers)
+    return _InlineExecutor()
+
+
+def mail_archive_spans(path: Union[str, Path]) -> list[tuple[str, int, Optional[int]]]:
+    """Locate the messages of an email archive on disk.
+
+    Parameters
+    ----------
+    path : str or Path
+        The path of an mbox file, a Maildir directory (with ``cur`` and ``new``
+        subdirectories), or a directory of .eml files.
+
+    Returns
+    -------
+    spans : list[tuple[str, int, Optional[int]]]
+        The (file, start, end) byte ranges of the messages, in the order of
+        the archive. end is None for messages that extend to the end of file.
+    """
+    path = Path(path)
+    if path.is_dir():
+        if (path / "cur").is_dir() and (path / "new").is_dir():
+            files = sorted((path / "cur").iterdir()) + sorted((path / "new").iterdir())
+        else:
+            files = sorted(path.rglob("*.eml"))
+        return [(str(f), 0, None) for f in files if f.is_file()]
+
+    # mbox: messages start with a "From " line at the beginning of a line
+    spans = []
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return spans
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0 if mm[:5] == b"From " else mm.find(b"\nFrom ")
+            while pos != -1:
+                # skip the "From " separator line
+                start = mm.find(b"\n", pos + 1) + 1
+                pos = mm.find(b"\nFrom ", start)
+                if start == 0:
+                    break
+                spans.append((str(path), start, None if pos == -1 else pos + 1))
+    return spans
 
 
 def in_date_range(date, start_date, end_date, date_args={}):
     start_date = pd.to_datetime(start_date, **date_args)
     end_date = pd.to_datetime(end_date, **date_args)
-    if start_date is None and end_date is None:
+    # pandas may return NaT instead of None for missing dates
+    if pd.isna(start_date) and pd.isna(end_date):
         return True
-    elif start_date is None:
+    elif pd.isna(start_date):
         return date <= end_date
-    elif end_date is None:
+    elif pd.isna(end_date):
         return date >= start_date
     else:
         return (date >= start_date) and (date <= end_date)
 
 
+_header_fields = "FROM DATE CONTENT-TYPE CONTENT-TRANSFER-ENCODING MIME-VERSION"
+
+_imap_months = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+]  # fmt: skip
+
+_uid_pattern = re.compile(rb"\bUID (\d+)")
+
+
+def imap_date(date: pd.Timestamp) -> str:
+    """Format a date as an IMAP date (e.g. 01-Jan-2024), independent of the
+    locale."""
+    return f"{date.day:02d}-{_imap_months[date.month - 1]}-{date.year}"
+
+
+def imap_fetch(server: imaplib.IMAP4, uids: list, item: str) -> dict:
+    """Fetch one item of several messages in a single UID FETCH command.
+
+    Parameters
+    ----------
+    server : imaplib.IMAP4
+        The IMAP server with a selected mailbox.
+    uids : list
+        The message UIDs (bytes or str).
+    item : str
+        The data item to fetch, e.g. "BODY.PEEK[TEXT]".
+
+    Returns
+    -------
+    contents : dict
+        The fetched contents (decoded as utf8) keyed by message UID.
+        Messages whose UID is not found in the response are skipped with a
+        warning.
+    """
+    uids = [i.decode() if isinstance(i, bytes) else str(i) for i in uids]
+    status, data = server.uid("FETCH", ",".join(uids), f"({item})")
+    contents = {}
+    for n, response_part in enumerate(data):
+        if not isinstance(response_part, tuple):
+            continue
+        match = _uid_pattern.search(response_part[0])
+        # the order of FETCH items is not fixed, some servers send the UID
+        # after the literal, in the next part of the response
+        if match is None and n + 1 < len(data) and isinstance(data[n + 1], bytes):
+            match = _uid_pattern.search(data[n + 1])
+        if match is None:
+            warnings.warn(
+                f"No UID in the FETCH response {response_part[0]!r}, skipped."
+            )
+            continue
+        contents[match.group(1).decode()] = response_part[1].decode("utf8", "ignore")
+    return {i: contents[i] for i in uids if i in contents}
+
+
 def decodeBody(msgPart: email.message.Message):
     """decode email body
 
@@ -237,65 +669,74 @@ def decodeBody(msgPart: email.message.Message):
 
 
 def get_content(messageObject):
-    msgBodyContents = []
+    return list(iter_content(messageObject))
+
+
+def iter_content(messageObject):
+    """Yield the decoded text body parts of a message one by one, so that the
+    parts after the GACOS information is found are never decoded."""
     if messageObject.is_multipart():  # parse multipart email
         messageParts = messageObject.get_payload()
-        for messagePart in messageParts:
-            bodyContent = decodeBody(messagePart)
-            if bodyContent:
-                msgBodyContents.append(bodyContent)
     else:
-        bodyContent = decodeBody(messageObject)
+        messageParts = [messageObject]
+    for messagePart in messageParts:
+        bodyContent = decodeBody(messagePart)
         if bodyContent:
-            msgBodyContents.append(bodyContent)
-    return msgBodyContents
+            yield bodyContent
+
+
+class LoginError(Exception):
+    """Raised when the mail server rejects the username or password."""
+
+
+def prompt_credentials(username=None, password=None):
+    """Prompt for the username and/or password that are None."""
+    if username is None:
+        username = input("username: ")
+    if password is None:
+        password = getpass.getpass("password: ")
+    return username, password
 
 
 def login_in_email_pop3(username, password, host, port, ssl=False):
-    try:
-        if username is None:
-            username = input("username: ")
-        if password is None:
-            password = getpass.getpass("password: ")
-
-        if ssl:
-            if port is None:
-                port = 995
-            server = poplib.POP3_SSL(host, port)
-        else:
-            if port is None:
-                port = 110
-            server = poplib.POP3(host, port)
+    username, password = prompt_credentials(username, password)
+    if ssl:
+        if port is None:
+            port = 995
+        server = poplib.POP3_SSL(host, port)
+    else:
+        if port is None:
+            port = 110
+        server = poplib.POP3(host, port)
 
+    try:
         server.user(username)
         server.pass_(password)
-        return server
-    except Exception as e:
-        print(e)
-        print("login failed")
+    except poplib.error_proto as e:
+        server.close()
+        raise LoginError(f"failed to log in to {host} as {username}: {e}") from e
+    return server
 
 
 def login_in_email_imap(username, password, host, port, ssl=False):
-    try:
-        if username is None:
-            username = input("username: ")
-        if password is None:
-            password = getpass.getpass("password: ")
-
-        if ssl:
-            if port is None:
-                port = 993
-            server = imaplib.IMAP4_SSL(host, port)
-        else:
-            if port is None:
-                port = 143
-            server = imaplib.IMAP4(host, port)
+    username, password = prompt_credentials(username, password)
+    if ssl:
+        if port is None:
+            port = 993
+        server = imaplib.IMAP4_SSL(host, port)
+    else:
+        if port is None:
+            port = 143
+        server = imaplib.IMAP4(host, port)
 
+    try:
         server.login(username, password)
-        return server
-    except Exception as e:
-        print(e)
-        print("login failed")
+    except imaplib.IMAP4.abort:
+        raise
+    except imaplib.IMAP4.error as e:
+        server.shutdown()
+        raise LoginError(f"failed to log in to {host} as {username}: {e}") from e
+    return server
 
 
 def parse_gacos_info(msgBodyContents, gacos_suffix="tar.gz"):
@@ -357,3 +798,59 @@ def parse_gacos_info(msgBodyContents, gacos_suffix="tar.gz"):
         return None
     else:
         return url, south, north, west, east, _time, date_list
+
+
+_bbox_keys = {"MinLat": 1, "MaxLat": 2, "MinLon": 3, "MaxLon": 4}
+
+
+@functools.lru_cache(maxsize=None)
+def _gacos_pattern(gacos_suffix: str) -> re.Pattern:
+    """The compiled pattern matching all GACOS fields of an email body in one
+    pass. Each line is matched by at most one of the alternatives."""
+    return re.compile(
+        r"^[^\S\n]*(?:"
+        r"(?P<key>MinLat|MaxLat|MinLon|MaxLon)[^\S\n]*=(?P<value>[^=\n]*)"
+        r"|Time[^\S\n]*:(?P<time>[^:\n]*)"
+        r"|(?P<date>\d{8})[^\S\n]*"
+        r")$"
+        rf"|\((?P<url>(?:https?|ftp)[^\n]*{re.escape(gacos_suffix)})\)",
+        re.MULTILINE,
+    )
+
+
+def parse_gacos_info_fast(msgBodyContents, gacos_suffix="tar.gz"):
+    """Parse gacos info from email body in a single pass.
+
+    This is a faster equivalent of :func:`parse_gacos_info`: each body part is
+    scanned once by a precompiled pattern, and the remaining parts are skipped
+    once the url, bounding box, time and dates are all found. Duplicated dates
+    (e.g. from the plain text and HTML parts of the same email) are dropped.
+
+    Parameters
+    ----------
+    msgBodyContents : Iterable[str]
+        The email body contents. Can be a lazy iterator such as the one
+        returned by :func:`iter_content`.
+    gacos_suffix : str, optional
+        The suffix of the gacos file url. Default is "tar.gz".
+    """
+    pattern = _gacos_pattern(gacos_suffix)
+    info = [None] * 6
+    dates = {}
+    for contents in msgBodyContents:
+        for match in pattern.finditer(contents):
+            url, key, time, date = match.group("url", "key", "time", "date")
+            if url is not None:
+                info[0] = url
+            elif key is not None:
+                info[_bbox_keys[key]] = float(match.group("value"))
+            elif time is not None:
+                info[5] = float(time)
+            else:
+                dates[date] = None
+        if dates and None not in info:
+            break
+
+    if info.count(None) == 6:
+        return None
+    return (*info, list(dates))
@@ -0,0 +1,212 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def minutes_to_time(minutes: float) -> str:
+    """Format minutes of day as "HH:MM"."""
+    minutes = int(np.round(minutes)) % (24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def time_to_minutes(_time: str) -> int:
+    """Convert "HH:MM" to minutes of day."""
+    hour, minute = _time.split(":")[:2]
+    return int(hour) * 60 + int(minute)
+
+
+class SubmissionPlan:
+    """The requests planned to submit the dates of a dataset to GACOS.
+
+    Attributes
+    ----------
+    patches : dict
+        The datetime patches. The key is the time (HH:MM) of requests and the
+        value is the list of date arrays, one per request.
+    members : dict
+        The acquisition times (HH:MM) merged into each time of `patches`.
+    rate : Optional[float]
+        The rate of requests (requests per second) used to estimate the
+        duration of the submission.
+    """
+
+    def __init__(
+        self,
+        patches: dict,
+        members: Optional[dict] = None,
+        rate: Optional[float] = None,
+    ) -> None:
+        """Initialize SubmissionPlan class
+
+        Parameters
+        ----------
+        patches : dict
+            The datetime patches, as returned by
+            :meth:`SarDataset.gen_datetime_patches`.
+        members : Optional[dict], optional
+            The acquisition times merged into each time of `patches`. Default
+            is None, which means no times are merged.
+        rate : Optional[float], optional
+            The rate of requests in requests per second. Default is None.
+        """
+        self.patches = patches
+        if members is None:
+            members = {_time: [_time] for _time in patches}
+        self.members = members
+        self.rate = rate
+
+    def __str__(self) -> str:
+        lines = [f"{self.__class__.__name__}("]
+        for _time, _dates in self.patches.items():
+            merged = ""
+            if self.members[_time] != [_time]:
+                merged = f" (merged {', '.join(self.members[_time])})"
+            lines.append(
+                f"    {_time}: {len(_dates)} requests of "
+                f"{'/'.join(str(len(d)) for d in _dates)} dates{merged}"
+            )
+        lines.append(f"    total: {self.n_requests} requests, {self.n_dates} dates")
+        duration = self.duration
+        if duration is not None:
+            lines.append(
+                f"    estimated duration: {pd.Timedelta(seconds=round(duration))}"
+            )
+        lines.append(")")
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @property
+    def n_requests(self) -> int:
+        """The number of requests (POSTs) of the plan."""
+        return sum(len(_dates) for _dates in self.patches.values())
+
+    @property
+    def n_dates(self) -> int:
+        """The number of dates submitted by the plan."""
+        return sum(len(d) for _dates in self.patches.values() for d in _dates)
+
+    @property
+    def dates_per_request(self) -> list[int]:
+        """The number of dates of each request."""
+        return [len(d) for _dates in self.patches.values() for d in _dates]
+
+    @property
+    def duration(self) -> Optional[float]:
+        """The estimated duration in seconds of submitting all requests at
+        :attr:`rate`, or None if the rate is unknown. The first request is
+        sent at once."""
+        if self.rate is None or self.rate <= 0:
+            return None
+        return max(0, self.n_requests - 1) / self.rate
+
+
+class PatchPlanner:
+    """Plan the requests to submit dates to GACOS with as few POSTs as
+    possible.
+
+    Acquisition times within `time_tolerance` minutes of each other are merged
+    into one representative time, so that acquisitions a minute apart (common
+    in HyP3 stacks) share requests. The times are clustered greedily from the
+    earliest: each cluster spans at most ``2 * time_tolerance`` minutes, and
+    its representative time is the middle of the span, so that every
+    acquisition is within `time_tolerance` of it. The unique dates of each
+    cluster are then split evenly into ``ceil(n_dates / capacity)`` requests.
+
+    .. note::
+        Times are not merged across midnight.
+    """
+
+    def __init__(self, capacity: int = 20, time_tolerance: float = 0) -> None:
+        """Initialize PatchPlanner class
+
+        Parameters
+        ----------
+        capacity : int, optional
+            The maximum number of dates in one request. Default is 20.
+        time_tolerance : float, optional
+            The maximum difference in minutes between an acquisition time and
+            the time of the request it is merged into. Default is 0, which
+            means only identical times (HH:MM) are merged.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        if time_tolerance < 0:
+            raise ValueError("time_tolerance must not be negative.")
+        self.capacity = capacity
+        self.time_tolerance = time_tolerance
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(capacity={self.capacity}, "
+            f"time_tolerance={self.time_tolerance})"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def cluster_times(self, times: Sequence[str]) -> dict:
+        """Merge acquisition times into representative times.
+
+        Parameters
+        ----------
+        times : Sequence[str]
+            The acquisition times (HH:MM).
+
+        Returns
+        -------
+        members : dict
+            The acquisition times merged into each representative time (HH:MM).
+        """
+        unique = sorted(set(times), key=time_to_minutes)
+        members = {}
+        cluster = []
+        for _time in unique + [None]:
+            if _time is not None and (
+                not cluster
+                or time_to_minutes(_time) - time_to_minutes(cluster[0])
+                <= 2 * self.time_tolerance
+            ):
+                cluster.append(_time)
+                continue
+            if cluster:
+                start, end = time_to_minutes(cluster[0]), time_to_minutes(cluster[-1])
+                members.setdefault(minutes_to_time((start + end) / 2), []).extend(
+                    cluster
+                )
+            cluster = [_time]
+        return members
+
+    def plan(
+        self,
+        dates: Sequence[str],
+        times: Sequence[str],
+    ) -> SubmissionPlan:
+        """Plan the requests of acquisitions.
+
+        Parameters
+        ----------
+        dates : Sequence[str]
+            The dates (YYYYMMDD) of acquisitions.
+        times : Sequence[str]
+            The times (HH:MM) of acquisitions, in the same order as `dates`.
+
+        Returns
+        -------
+        plan : SubmissionPlan
+            The planned requests.
+        """
+        dates = np.asarray(dates, dtype=str)
+        times = np.asarray(times, dtype=str)
+        members = self.cluster_times(times)
+
+        patches = {}
+        kept = {}
+        for _time, _members in members.items():
+            _dts = np.unique(dates[np.isin(times, _members)])
+            n_patch = int(np.ceil(len(_dts) / self.capacity))
+            patches[_time] = np.array_split(_dts, n_patch)
+            kept[_time] = _members
+        return SubmissionPlan(patches, kept)
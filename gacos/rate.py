@@ -0,0 +1,223 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+
+class RateLimiter(ABC):
+    """The interface of the rate control used by :class:`Submitter`.
+
+    Before each request, :meth:`acquire` is called and blocks until the
+    request is allowed. The outcome of the request is then reported with
+    :meth:`success` or :meth:`failure`, so that limiters can adapt their rate.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._waiting = 0
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(rate={self.rate * 60:.3g}/min)"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @property
+    @abstractmethod
+    def rate(self) -> float:
+        """The current rate in requests per second."""
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of requests waiting in :meth:`acquire`."""
+        return self._waiting
+
+    @abstractmethod
+    def _delay(self, now: float) -> float:
+        """The time in seconds to wait before the next request is allowed.
+        Called with the condition held."""
+
+    @abstractmethod
+    def _consume(self, now: float) -> None:
+        """Record that a request is allowed. Called with the condition held."""
+
+    def acquire(self) -> float:
+        """Block until the next request is allowed.
+
+        Returns
+        -------
+        waited : float
+            The time in seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(now)
+                    if delay <= 0:
+                        self._consume(now)
+                        break
+                    # woken up early if the rate changes
+                    self._cond.wait(delay)
+            finally:
+                self._waiting -= 1
+        return time.monotonic() - start
+
+    def success(self) -> None:
+        """Report that a request succeeded."""
+
+    def failure(self, retry_after: Optional[float] = None) -> None:
+        """Report that a request failed.
+
+        Parameters
+        ----------
+        retry_after : Optional[float], optional
+            The time in seconds the server asked to wait (the Retry-After
+            header), if any. Default is None.
+        """
+
+
+class RandomSleepLimiter(RateLimiter):
+    """Wait a random time between requests, regardless of their outcome. This
+    is the behavior of the early versions of :class:`Submitter`."""
+
+    def __init__(self, sleep_time_range: tuple[int, int] = (60 / 2, 60 * 5)) -> None:
+        """Initialize RandomSleepLimiter class
+
+        Parameters
+        ----------
+        sleep_time_range : tuple[int, int], optional
+            The range of sleep time in seconds. Default is (30, 60 * 5).
+        """
+        super().__init__()
+        self.sleep_time_range = sleep_time_range
+        self._next = None
+        self._interval = np.mean(sleep_time_range)
+
+    @property
+    def rate(self) -> float:
+        return 1 / self._interval
+
+    def _delay(self, now: float) -> float:
+        return 0 if self._next is None else self._next - now
+
+    def _consume(self, now: float) -> None:
+        self._interval = np.random.randint(*self.sleep_time_range)
+        self._next = now + self._interval
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """A token bucket whose rate adapts to the responses of the server with
+    additive increase and multiplicative decrease (AIMD).
+
+    Tokens are added to the bucket at :attr:`rate` and each request consumes
+    one. After each successful request the rate is increased by `increase`,
+    up to `max_rate`. After a failure the rate is multiplied by `decrease`,
+    down to `min_rate`, and no request is allowed for a backoff time that
+    doubles with every consecutive failure.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1 / 120,
+        max_rate: float = 1 / 30,
+        min_rate: float = 1 / 600,
+        increase: float = 1 / 600,
+        decrease: float = 0.5,
+        burst: int = 1,
+        backoff: float = 60,
+        max_backoff: float = 60 * 30,
+    ) -> None:
+        """Initialize AdaptiveRateLimiter class
+
+        Parameters
+        ----------
+        rate : float, optional
+            The initial rate in requests per second. Default is 1/120, i.e.
+            one request every 2 minutes.
+        max_rate : float, optional
+            The ceiling of the rate in requests per second. Default is 1/30.
+        min_rate : float, optional
+            The floor of the rate in requests per second. Default is 1/600.
+        increase : float, optional
+            The rate added after each successful request. Default is 1/600.
+        decrease : float, optional
+            The factor the rate is multiplied by after a failed request.
+            Default is 0.5.
+        burst : int, optional
+            The capacity of the bucket, i.e. the number of requests that can
+            be sent at once after idling. Default is 1.
+        backoff : float, optional
+            The time in seconds to pause after the first failure. It doubles
+            with every consecutive failure. Default is 60.
+        max_backoff : float, optional
+            The maximum time in seconds to pause after failures. Default is
+            30 minutes.
+        """
+        super().__init__()
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("min_rate must be positive and not above max_rate.")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1.")
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._n_failures = 0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def paused(self) -> float:
+        """The remaining backoff time in seconds after failures."""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - max(self._updated, self._paused_until))
+        self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
+        self._updated = now
+
+    def _delay(self, now: float) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self._rate
+
+    def _consume(self, now: float) -> None:
+        self._tokens -= 1
+
+    def success(self) -> None:
+        with self._cond:
+            self._refill(time.monotonic())
+            self._n_failures = 0
+            self._rate = min(self.max_rate, self._rate + self.increase)
+            self._cond.notify_all()
+
+    def failure(self, retry_after: Optional[float] = None) -> None:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self._n_failures += 1
+            self._rate = max(self.min_rate, self._rate * self.decrease)
+            pause = min(self.max_backoff, self.backoff * 2 ** (self._n_failures - 1))
+            if retry_after is not None:
+                pause = max(pause, retry_after)
+            self._paused_until = max(self._paused_until, now + pause)
+            self._tokens = 0.0
+            self._cond.notify_all()
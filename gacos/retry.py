@@ -0,0 +1,240 @@
+import json
+import random
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Literal, Optional, Union
+
+import pandas as pd
+import requests
+
+RetryState = Literal["queued", "running", "done", "permanent"]
+
+# HTTP status codes of errors that may disappear when retried
+transient_status_codes = (408, 425, 429, 500, 502, 503, 504)
+
+
+def is_transient(error: Optional[Exception]) -> bool:
+    """Whether a failed post may succeed when retried.
+
+    Timeouts, connection errors, server errors (5xx) and rate limiting (429)
+    are transient. A response without the acknowledgement of GACOS (`error`
+    is None) is also considered transient, as the service does not tell why.
+    Other errors, e.g. client errors (4xx) or invalid urls, are permanent.
+    """
+    if error is None:
+        return True
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in transient_status_codes
+    return False
+
+
+class RetryQueue:
+    """A persistent queue of the post data of :class:`Submitter`.
+
+    The queue is a SQLite database with one row per post data, so that posts
+    are not lost if the submission is interrupted. A queued post is retried
+    after a jittered exponential backoff ("full jitter"): the n-th retry waits
+    a random time between 0 and ``min(max_backoff, backoff * 2 ** n)``
+    seconds. Posts that failed permanently, or more than `max_attempts` times,
+    are kept in the ``permanent`` state for inspection.
+
+    :meth:`next` claims a post by moving it to the ``running`` state, so that
+    several threads can take posts from the same queue.
+    """
+
+    queue_name = "retry.sqlite"
+
+    def __init__(
+        self,
+        queue_file: Union[Path, str],
+        max_attempts: int = 5,
+        backoff: float = 60,
+        max_backoff: float = 60 * 60,
+    ) -> None:
+        """Initialize RetryQueue class
+
+        Parameters
+        ----------
+        queue_file : Union[Path, str]
+            The path of the queue database. It is created if not exists.
+        max_attempts : int, optional
+            The maximum number of attempts of a post. Default is 5.
+        backoff : float, optional
+            The base of the backoff time in seconds. Default is 60.
+        max_backoff : float, optional
+            The maximum backoff time in seconds. Default is 1 hour.
+        """
+        self.queue_file = Path(queue_file)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._init_db()
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(queue_file={self.queue_file})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        """The number of queued posts."""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM retries WHERE state = 'queued'"
+            ).fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.queue_file, timeout=60)
+
+    def _init_db(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS retries (
+                    id INTEGER PRIMARY KEY,
+                    post_data TEXT UNIQUE,
+                    state TEXT,
+                    attempts INTEGER,
+                    next_attempt REAL,
+                    error TEXT,
+                    updated REAL
+                )
+                """)
+
+    def put(self, post_data: Iterable[dict]) -> None:
+        """Queue post data to be posted now. Post data that are already in the
+        queue keep their schedule; finished ones are queued again."""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                """
+                INSERT INTO retries VALUES (NULL, ?, 'queued', 0, ?, NULL, ?)
+                ON CONFLICT (post_data) DO UPDATE SET
+                    state = 'queued',
+                    attempts = 0,
+                    next_attempt = excluded.next_attempt,
+                    error = NULL,
+                    updated = excluded.updated
+                WHERE state NOT IN ('queued', 'running')
+                """,
+                [
+                    (json.dumps(d, sort_keys=True, default=float), now, now)
+                    for d in post_data
+                ],
+            )
+
+    def next(self) -> Optional[tuple[int, dict, float]]:
+        """Claim the queued post that is due first.
+
+        Returns
+        -------
+        item : Optional[tuple[int, dict, float]]
+            The id, post data and time (seconds since the epoch) of the next
+            attempt, or None if the queue is empty.
+        """
+        with closing(self._connect()) as conn:
+            while True:
+                with conn:
+                    row = conn.execute(
+                        "SELECT id, post_data, next_attempt FROM retries "
+                        "WHERE state = 'queued' ORDER BY next_attempt, id LIMIT 1"
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    claimed = conn.execute(
+                        "UPDATE retries SET state = 'running' "
+                        "WHERE id = ? AND state = 'queued'",
+                        (row[0],),
+                    ).rowcount
+                if claimed:
+                    return row[0], json.loads(row[1]), row[2]
+
+    def release(self, item_id: int) -> None:
+        """Queue a claimed post again without counting an attempt."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE retries SET state = 'queued' WHERE id = ?", (item_id,))
+
+    def recover(self) -> int:
+        """Queue again the posts left running by an interrupted submission.
+        Return the number of posts recovered."""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                "UPDATE retries SET state = 'queued' WHERE state = 'running'"
+            ).rowcount
+
+    def done(self, item_id: int) -> None:
+        """Mark a post as succeeded."""
+        self._update(item_id, "done", None)
+
+    def fail(self, item_id: int, error: str, transient: bool = True) -> bool:
+        """Record a failed attempt of a post and schedule its retry.
+
+        Parameters
+        ----------
+        item_id : int
+            The id of the post returned by :meth:`next`.
+        error : str
+            The description of the failure.
+        transient : bool, optional
+            Whether the failure is transient. Permanent failures are not
+            retried. Default is True.
+
+        Returns
+        -------
+        retry : bool
+            Whether the post will be retried.
+        """
+        with closing(self._connect()) as conn, conn:
+            (attempts,) = conn.execute(
+                "SELECT attempts FROM retries WHERE id = ?", (item_id,)
+            ).fetchone()
+            attempts += 1
+            retry = transient and attempts < self.max_attempts
+            delay = random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+            )
+            conn.execute(
+                "UPDATE retries SET state = ?, attempts = ?, next_attempt = ?, "
+                "error = ?, updated = ? WHERE id = ?",
+                (
+                    "queued" if retry else "permanent",
+                    attempts,
+                    time.time() + delay,
+                    error,
+                    time.time(),
+                    item_id,
+                ),
+            )
+        return retry
+
+    def _update(self, item_id: int, state: RetryState, error: Optional[str]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE retries SET state = ?, error = ?, updated = ? WHERE id = ?",
+                (state, error, time.time(), item_id),
+            )
+
+    def items(self, state: Optional[RetryState] = None) -> pd.DataFrame:
+        """Return the posts in the queue.
+
+        Parameters
+        ----------
+        state : Optional[str], optional
+            Only return the posts in this state. Default is None.
+
+        Returns
+        -------
+        df_items : pd.DataFrame
+            The posts indexed by id, with columns of post_data, state,
+            attempts, next_attempt, error and updated.
+        """
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query("SELECT * FROM retries", conn, index_col="id")
+        df["post_data"] = df["post_data"].map(json.loads)
+        if state is not None:
+            df = df[df["state"] == state]
+        return df
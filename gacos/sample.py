@@ -0,0 +1,213 @@
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+from .cube import ZTDCube
+from .index import ProductIndex
+
+
+def bilinear_weights(
+    transform: rasterio.Affine,
+    shape: tuple[int, int],
+    xs: np.ndarray,
+    ys: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the pixels and weights of the bilinear interpolation of points
+    on a grid.
+
+    Parameters
+    ----------
+    transform : rasterio.Affine
+        The affine transform of the grid.
+    shape : tuple[int, int]
+        The shape (height, width) of the grid.
+    xs, ys : np.ndarray
+        The coordinates of the points in the CRS of the grid.
+
+    Returns
+    -------
+    rows, cols : np.ndarray
+        The rows and columns of the 4 neighboring pixels of each point, of
+        shape (n_points, 4).
+    weights : np.ndarray
+        The weights of the 4 neighboring pixels, of shape (n_points, 4).
+    valid : np.ndarray
+        Whether each point is within the grid. Points within half a pixel of
+        the edge take the value of the edge pixels.
+    """
+    height, width = shape
+    cols, rows = ~transform * (np.asarray(xs, float), np.asarray(ys, float))
+    # positions relative to the pixel centers
+    cols, rows = np.asarray(cols) - 0.5, np.asarray(rows) - 0.5
+    valid = (
+        (cols >= -0.5) & (cols <= width - 0.5) & (rows >= -0.5) & (rows <= height - 0.5)
+    )
+    cols = np.clip(cols, 0, width - 1)
+    rows = np.clip(rows, 0, height - 1)
+    c0 = np.minimum(np.floor(cols).astype(int), max(width - 2, 0))
+    r0 = np.minimum(np.floor(rows).astype(int), max(height - 2, 0))
+    c1 = np.minimum(c0 + 1, width - 1)
+    r1 = np.minimum(r0 + 1, height - 1)
+    fc, fr = cols - c0, rows - r0
+
+    rows = np.stack([r0, r0, r1, r1], axis=1)
+    cols = np.stack([c0, c1, c0, c1], axis=1)
+    weights = np.stack(
+        [(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc], axis=1
+    )
+    return rows, cols, weights, valid
+
+
+class PointSampler:
+    """Sample the ZTD of all dates at points with bilinear interpolation.
+
+    The pixels and weights of the points are computed once per grid geometry
+    (transform and shape) and reused for all dates on the same grid. Only the
+    pixels around the points are read: elements of the memory-mapped chunks of
+    a :class:`ZTDCube`, or the window enclosing the points of each product.
+    A point takes NaN if it is outside the grid or any of its neighboring
+    pixels is NaN.
+    """
+
+    def __init__(
+        self,
+        lons: Union[Sequence[float], np.ndarray],
+        lats: Union[Sequence[float], np.ndarray],
+    ) -> None:
+        """Initialize PointSampler class
+
+        Parameters
+        ----------
+        lons, lats : Union[Sequence[float], np.ndarray]
+            The longitudes and latitudes of the points in degrees.
+        """
+        self.lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        self.lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        if self.lons.shape != self.lats.shape:
+            raise ValueError("lons and lats must have the same shape.")
+        self._weights = {}
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(points={len(self)})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        return len(self.lons)
+
+    def weights(self, transform: rasterio.Affine, shape: tuple[int, int]) -> tuple:
+        """The pixels and weights of the points on a grid in EPSG:4326, see
+        :func:`bilinear_weights`. They are cached per grid geometry."""
+        key = (tuple(transform)[:6], tuple(shape))
+        if key not in self._weights:
+            self._weights[key] = bilinear_weights(
+                transform, shape, self.lons, self.lats
+            )
+        return self._weights[key]
+
+    def sample_cube(
+        self,
+        cube: ZTDCube,
+        dates: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """Sample the ZTD of dates in a cube.
+
+        Parameters
+        ----------
+        cube : ZTDCube
+            The cube to sample.
+        dates : Optional[Iterable[str]], optional
+            The dates (YYYYMMDD) to sample. If None, all dates of the cube
+            (:attr:`ZTDCube.dates`) are sampled. Dates not in the cube are NaN.
+            Default is None.
+
+        Returns
+        -------
+        values : np.ndarray
+            The ZTD of shape (n_points, n_dates), in the order of `dates`.
+        """
+        dates = cube.dates if dates is None else [str(d) for d in dates]
+        out = np.full((len(self), len(dates)), np.nan)
+        if len(dates) == 0 or cube.shape is None:
+            return out
+        rows, cols, weights, valid = self.weights(cube.transform, cube.shape)
+        points = np.where(valid)[0]
+        rows, cols, weights = rows[points], cols[points], weights[points]
+
+        for idx, chunk, slots in cube.iter_chunks(dates):
+            # fancy indexing of the memory map only touches the needed pages
+            values = chunk[slots[:, None, None], rows[None], cols[None]]
+            out[np.ix_(points, idx)] = (values * weights[None]).sum(axis=-1).T
+        return out
+
+    def _sample_file(self, file: Union[Path, str]) -> np.ndarray:
+        """Sample the first band of a raster in EPSG:4326, reading only the
+        window enclosing the points."""
+        out = np.full(len(self), np.nan)
+        with rasterio.open(file) as src:
+            rows, cols, weights, valid = self.weights(src.transform, src.shape)
+            points = np.where(valid)[0]
+            if len(points) == 0:
+                return out
+            rows, cols, weights = rows[points], cols[points], weights[points]
+            row_off, col_off = rows.min(), cols.min()
+            window = Window(
+                col_off,
+                row_off,
+                cols.max() - col_off + 1,
+                rows.max() - row_off + 1,
+            )
+            arr = src.read(1, window=window).astype(float)
+            if src.nodata is not None:
+                arr[arr == src.nodata] = np.nan
+        values = arr[rows - row_off, cols - col_off]
+        out[points] = (values * weights).sum(axis=-1)
+        return out
+
+    def sample_products(
+        self,
+        index: ProductIndex,
+        dates: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """Sample the ZTD of dates from the indexed products. Where the
+        products of a date overlap, the first sampled product wins.
+
+        Parameters
+        ----------
+        index : ProductIndex
+            The index of the downloaded products. It is refreshed first.
+        dates : Optional[Iterable[str]], optional
+            The dates (YYYYMMDD) to sample. If None, all indexed dates
+            (:attr:`ProductIndex.dates`) are sampled. Default is None.
+
+        Returns
+        -------
+        values : np.ndarray
+            The ZTD of shape (n_points, n_dates), in the order of `dates`.
+        """
+        index.refresh()
+        dates = index.dates if dates is None else [str(d) for d in dates]
+        out = np.full((len(self), len(dates)), np.nan)
+        if len(dates) == 0:
+            return out
+        df_products = index.query(dates)
+        columns = {d: i for i, d in enumerate(dates)}
+        for row in df_products.sort_values("path").itertuples():
+            if pd.notna(row.west) and not (
+                self.lons.max() >= row.west
+                and self.lons.min() <= row.east
+                and self.lats.max() >= row.south
+                and self.lats.min() <= row.north
+            ):
+                continue
+            col = out[:, columns[row.date]]
+            fill = np.isnan(col)
+            if fill.any():
+                col[fill] = self._sample_file(row.path)[fill]
+                out[:, columns[row.date]] = col
+        return out
@@ -1,21 +1,33 @@
+import functools
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Optional, Sequence, Union
 
-import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
 
-from .datasets import SarDataset
+from .datasets import SarDataset, dataset_cache_dir
+from .ledger import SubmissionLedger
+from .plan import SubmissionPlan
+from .rate import AdaptiveRateLimiter, RandomSleepLimiter, RateLimiter
+from .retry import RetryQueue, is_transient
 
 
 class Submitter:
     def __init__(
         self,
         dataset: SarDataset,
-        email: str,
-        sleep_time_range: tuple[int, int] = (60 / 2, 60 * 5),
+        email: Union[str, Sequence[str]],
+        sleep_time_range: Optional[tuple[int, int]] = None,
         gacos_url="http://www.gacos.net/M/action_page.php",
+        rate_limiter: Optional[Union[RateLimiter, Callable[[], RateLimiter]]] = None,
+        ledger: Optional[SubmissionLedger] = None,
+        retry_queue: Optional[RetryQueue] = None,
+        timeout: float = 60,
     ) -> None:
         """Initialize Submitter class
 
@@ -23,61 +35,262 @@ class Submitter:
         ----------
         dataset : SarDataset
             The SarDataset object.
-        email : str
-            The email address to submit to gacos.
-        sleep_time_range : tuple[int, int], optional
-            The range of sleep time in seconds. Default is (60, 60 * 5).
+        email : Union[str, Sequence[str]]
+            The email address to submit to gacos. If several addresses are
+            given, posts are submitted concurrently, one stream per address,
+            and the results of each post are sent to the address that posted
+            it.
+        sleep_time_range : Optional[tuple[int, int]], optional
+            If given, sleep a random time in this range (seconds) between
+            posts, like the early versions of Submitter. Ignored if
+            `rate_limiter` is given. Default is None.
         gacos_url : str, optional
             The url of gacos website. Default is "http://www.gacos.net/M/action_page.php".
+        rate_limiter : Optional[Union[RateLimiter, Callable[[], RateLimiter]]], optional
+            The rate control of posts. A callable (e.g. a RateLimiter class) is
+            called once per email address, so that each address has its own
+            rate budget, while a RateLimiter object is shared by all addresses.
+            If None and `sleep_time_range` is None, an
+            :class:`AdaptiveRateLimiter` with default settings is used for each
+            address, which speeds up while posts succeed and backs off on
+            failures. Default is None.
+        ledger : Optional[SubmissionLedger], optional
+            The ledger to record the submitted dates in, so that pending dates
+            are not submitted again. If None, the :attr:`SarDataset.ledger` of
+            `dataset` is used. Default is None.
+        retry_queue : Optional[RetryQueue], optional
+            The persistent queue of posts. Failed posts are retried from it,
+            and an interrupted submission resumes from it. If None, the queue
+            is kept next to the ledger, or in ``autogacos/retry`` under the
+            user cache directory if there is no ledger, in a file named after
+            the bounds of `dataset`. A new Submitter of the same dataset
+            resumes it, while datasets sharing a gacos_dir have their own
+            queues. Default is None.
+        timeout : float, optional
+            The timeout in seconds of posts. Default is 60.
         """
         self.dataset = dataset
         self.email = email
+        self.emails = [email] if isinstance(email, str) else list(email)
+        if len(self.emails) == 0:
+            raise ValueError("At least one email address is required.")
         self.sleep_time_range = sleep_time_range
         self.gacos_url = gacos_url
+        self.timeout = timeout
+        if rate_limiter is None:
+            if sleep_time_range is None:
+                rate_limiter = AdaptiveRateLimiter
+            else:
+                rate_limiter = functools.partial(RandomSleepLimiter, sleep_time_range)
+        if isinstance(rate_limiter, RateLimiter):
+            self.rate_limiters = {e: rate_limiter for e in self.emails}
+        else:
+            self.rate_limiters = {e: rate_limiter() for e in self.emails}
+        if ledger is None:
+            ledger = getattr(dataset, "ledger", None)
+        self.ledger = ledger
+        if retry_queue is None:
+            retry_queue = RetryQueue(self._default_queue_file(dataset, ledger))
+        self.retry_queue = retry_queue
 
         self._failed = []
         self._succeed = []
+        self._stop = threading.Event()
 
-    def _post_data(self, data):
+    @staticmethod
+    def _default_queue_file(
+        dataset: SarDataset, ledger: Optional[SubmissionLedger] = None
+    ) -> Path:
+        """The retry queue of a dataset, next to the ledger or in the user
+        cache directory if there is no ledger. The file is keyed by the bounds
+        of the dataset, so that datasets sharing a gacos_dir do not post the
+        queued posts of each other."""
+        bounds = ",".join(f"{float(dataset.bounds[i]):.4f}" for i in range(4))
+        key = hashlib.sha1(bounds.encode()).hexdigest()
+        if ledger is None:
+            queue_dir = dataset_cache_dir() / "retry"
+        else:
+            queue_dir = Path(ledger.ledger_file).parent
+        queue_dir.mkdir(parents=True, exist_ok=True)
+        return queue_dir / f"{Path(RetryQueue.queue_name).stem}_{key}.sqlite"
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        """The rate limiter of the first email address."""
+        return self.rate_limiters[self.emails[0]]
+
+    def _create_session(self) -> requests.Session:
+        """Create a keep-alive session shared by the posting threads."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=len(self.emails), pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _post_data(self, session: requests.Session, data: dict) -> bool:
         """Post data to gacos website."""
-        r = requests.post(self.gacos_url, data=data)
+        r = session.post(self.gacos_url, data=data, timeout=self.timeout)
+        r.raise_for_status()
         return "Thanks for using GACOS!" in r.text
 
-    def post_requests(self):
+    def plan(
+        self, capacity: int = 20, time_tolerance: Optional[float] = None
+    ) -> SubmissionPlan:
+        """Plan the requests of the remaining dates of the dataset, with the
+        duration estimated at the current :attr:`rate`. See
+        :meth:`SarDataset.plan_patches` for the parameters."""
+        plan = self.dataset.plan_patches(
+            capacity=capacity, time_tolerance=time_tolerance
+        )
+        plan.rate = self.rate
+        return plan
+
+    def post_requests(self, capacity: int = 20, time_tolerance: Optional[float] = None):
+        """Post the remaining dates of the dataset to gacos website.
+
+        The requests are planned by :meth:`plan`, and the plan is reported
+        before submitting. The post data are added to :attr:`retry_queue`, and
+        posted from the queue, together with the posts left by previous runs.
+        Posts that failed transiently (timeouts, server errors, no
+        acknowledgement) are retried later with a jittered exponential backoff,
+        while the other posts go on. Posts that failed permanently are added to
+        :attr:`failed`.
+
+        With several email addresses, one thread per address takes the next
+        due post from the queue whenever its rate limiter allows, so that the
+        posts are spread over the addresses in turn.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            The maximum number of dates in one request. Default is 20.
+        time_tolerance : Optional[float], optional
+            Acquisition times within this number of minutes are submitted in
+            the same requests. If None, the :attr:`SarDataset.time_tolerance`
+            of the dataset is used, e.g. the tolerance the frames of a
+            :class:`MergedDataset` were merged with. Default is None.
+        """
         # post gacos info to website
-        datetime_patches = self.dataset.gen_datetime_patches()
-        for _key, _dates in tqdm(
-            datetime_patches.items(),
-            desc="submitting times",
-            unit="times",
-        ):
+        plan = self.plan(capacity, time_tolerance)
+        tqdm.write(str(plan))
+        datetime_patches = plan.patches
+        self.retry_queue.recover()
+        self.retry_queue.put(
+            _without_email(
+                self.dataset.gen_post_data(_dt, _key.split(":"), self.emails[0])
+            )
+            for _key, _dates in datetime_patches.items()
+            for _dt in _dates
+        )
+
+        self._stop.clear()
+        with self._create_session() as session, tqdm(
+            total=self.queue_depth, desc="submitting dates", unit="posts"
+        ) as pbar, ThreadPoolExecutor(max_workers=len(self.emails)) as executor:
+            futures = [
+                executor.submit(self._post_worker, session, email, pbar)
+                for email in self.emails
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                # let the other threads finish their current post and stop
+                self._stop.set()
+
+    def _post_worker(self, session: requests.Session, email: str, pbar: tqdm) -> None:
+        """Post the queued post data with an email address until the queue is
+        empty."""
+        rate_limiter = self.rate_limiters[email]
+        while not self._stop.is_set():
+            item = self.retry_queue.next()
+            if item is None:
+                break
+            item_id, post_data, next_attempt = item
+            post_data["email"] = email
+            delay = next_attempt - time.time()
+            if delay > 0:
+                tqdm.write(f"    retrying in {delay:.0f} seconds...")
+                if self._stop.wait(delay):
+                    self.retry_queue.release(item_id)
+                    break
+
+            # wait to avoid be rejected
+            rate_limiter.acquire()
+            self._record(post_data, "submitted")
+
+            error, retry_after = None, None
             try:
-                for _dt in tqdm(_dates, desc="submitting dates", unit="dates"):
-                    post_data = self.dataset.gen_post_data(
-                        _dt, _key.split(":"), self.email
-                    )
-                    status_ok = self._post_data(post_data)
-                    if status_ok:
-                        self._succeed.append(post_data)
-                        tqdm.write(f">>> succeed post: {post_data}")
-                    else:
-                        self._failed.append(post_data)
-                        tqdm.write(f">>> failed post: {post_data}")
-
-                    # wait to avoid be rejected
-                    sleep_time = np.random.randint(*self.sleep_time_range)
-                    tqdm.write(f"    sleeping for {sleep_time} seconds...")
-                    time.sleep(sleep_time)
-            except:
-                self._failed.append(post_data)
-                tqdm.write(f">>> failed post: {post_data}")
+                status_ok = self._post_data(session, post_data)
+            except requests.RequestException as e:
+                status_ok = False
+                error, retry_after = e, _retry_after(e.response)
+
+            if status_ok:
+                rate_limiter.success()
+                self._record(post_data, "acknowledged")
+                self.retry_queue.done(item_id)
+                self._succeed.append(post_data)
+                tqdm.write(f">>> succeed post: {post_data}")
+                pbar.update(1)
+            else:
+                rate_limiter.failure(retry_after)
+                self._record(post_data, "failed")
+                reason = "not acknowledged" if error is None else str(error)
+                if self.retry_queue.fail(item_id, reason, is_transient(error)):
+                    tqdm.write(f">>> failed post, will retry: {reason}")
+                else:
+                    self._failed.append(post_data)
+                    tqdm.write(f">>> failed post: {post_data} ({reason})")
+                    pbar.update(1)
+            tqdm.write(
+                f"    rate: {self.rate * 60:.2f} posts/min, "
+                f"{self.queue_depth} posts queued"
+            )
+
+    def _record(self, post_data: dict, state: str) -> None:
+        if self.ledger is not None:
+            bounds = (post_data["W"], post_data["S"], post_data["E"], post_data["N"])
+            _time = f"{post_data['H']:02d}:{post_data['M']:02d}"
+            dates = post_data["date"].split("\n")
+            self.ledger.record(bounds, _time, dates, state)
+
+    @property
+    def rate(self) -> float:
+        """The current rate of posts in posts per second, summed over the
+        email addresses."""
+        limiters = {id(r): r for r in self.rate_limiters.values()}
+        return sum(r.rate for r in limiters.values())
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of posts waiting in :attr:`retry_queue`."""
+        return len(self.retry_queue)
 
     @property
     def failed(self):
-        """A list of failed post data."""
+        """A list of post data that failed permanently. All failed posts are
+        also kept in :attr:`retry_queue`."""
         return self._failed
 
     @property
     def succeed(self):
         """A list of succeed post data."""
         return self._succeed
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """The Retry-After header of a response in seconds, if given."""
+    if response is None:
+        return None
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _without_email(post_data: dict) -> dict:
+    """Drop the email address from post data, which is set when posting."""
+    return {k: v for k, v in post_data.items() if k != "email"}
@@ -0,0 +1,272 @@
+import imaplib
+import queue
+import select
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from tqdm.auto import tqdm
+
+from .download import Downloader
+from .parse_email import GACOSEmail
+
+
+class GACOSWatcher:
+    """Watch the mailbox for GACOS emails and download the GACOS files as soon
+    as they arrive.
+
+    For IMAP, the watcher holds a connection in IDLE state, so that the server
+    pushes new messages to it. If the server does not support IDLE, or for
+    POP3, the mailbox is polled every `poll_interval` seconds. The urls of new
+    GACOS emails are appended to `output_file` (the same as
+    :meth:`GACOSEmail.retrieve_gacos_urls` with ``incremental=True``) and, if
+    `output_dir` is given, downloaded by a background thread.
+    """
+
+    def __init__(
+        self,
+        gacos_email: GACOSEmail,
+        output_file: Union[str, Path],
+        output_dir: Optional[Union[str, Path]] = None,
+        poll_interval: float = 60,
+        idle_timeout: float = 60 * 25,
+        downloader_kwargs: Optional[dict] = None,
+        download_kwargs: Optional[dict] = None,
+    ) -> None:
+        """Initialize GACOSWatcher class
+
+        Parameters
+        ----------
+        gacos_email : GACOSEmail
+            The GACOSEmail object used to log in and parse the emails.
+        output_file : Union[str, Path]
+            The file to append the gacos urls to. Can be a CSV file or a
+            :class:`UrlCatalog` database.
+        output_dir : Optional[Union[str, Path]], optional
+            The directory to download gacos files to. If None, the urls are only
+            appended to `output_file`. Default is None.
+        poll_interval : float, optional
+            The interval in seconds of polling the mailbox when IMAP IDLE is
+            not available. Default is 60.
+        idle_timeout : float, optional
+            The time in seconds after which the IDLE command is renewed. Servers
+            may drop IDLE connections after 30 minutes. Default is 25 minutes.
+        downloader_kwargs : Optional[dict], optional
+            Other keyword arguments passed to :class:`Downloader`, e.g.
+            `bounds`, `times` or `suffixes`. Default is None.
+        download_kwargs : Optional[dict], optional
+            Keyword arguments passed to :meth:`Downloader.download`. Default is
+            None.
+        """
+        if gacos_email.email_protocol not in ["imap", "pop3"]:
+            raise ValueError("GACOSWatcher only supports 'imap' and 'pop3' protocols.")
+        self.gacos_email = gacos_email
+        self.output_file = Path(output_file)
+        self.output_dir = None if output_dir is None else Path(output_dir)
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.downloader_kwargs = downloader_kwargs or {}
+        self.download_kwargs = download_kwargs or {}
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(host={self.gacos_email.host}, "
+            f"output_file={self.output_file})"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """Watch the mailbox until `duration` seconds passed, :meth:`stop` is
+        called or the process is interrupted.
+
+        Parameters
+        ----------
+        duration : Optional[float], optional
+            The time in seconds to watch. If None, watch forever. Default is
+            None.
+
+        Raises
+        ------
+        LoginError
+            If the server rejects the username or password. Dropped connections
+            are reconnected with the same credentials instead.
+        """
+        deadline = None if duration is None else time.monotonic() + duration
+        self._stop.clear()
+        # prompt before the first connection, so that reconnections reuse the
+        # credentials
+        self.gacos_email._prompt_credentials()
+
+        worker = None
+        if self.output_dir is not None:
+            worker = threading.Thread(target=self._download_worker, daemon=True)
+            worker.start()
+
+        try:
+            while not self._should_stop(deadline):
+                try:
+                    if self.gacos_email.email_protocol == "imap":
+                        self._watch_imap(deadline)
+                    else:
+                        self._watch_pop3(deadline)
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    # reconnect after the connection is dropped
+                    tqdm.write(f">>> connection lost: {e}, reconnecting...")
+                    self._stop.wait(self.poll_interval)
+        finally:
+            if worker is not None:
+                self._queue.put(None)
+                worker.join()
+
+    def stop(self) -> None:
+        """Stop watching. The watcher returns after the current IDLE or poll
+        interval ends."""
+        self._stop.set()
+
+    def _should_stop(self, deadline: Optional[float]) -> bool:
+        if self._stop.is_set():
+            return True
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _remaining(self, deadline: Optional[float], interval: float) -> float:
+        if deadline is None:
+            return interval
+        return max(0, min(interval, deadline - time.monotonic()))
+
+    def _on_gacos(self, gacos: list, sync_state: dict) -> None:
+        """Save the gacos urls of new emails and queue them for download."""
+        if len(gacos) == 0:
+            self.gacos_email._dump_sync_state(self.output_file, sync_state)
+            return
+        with self._lock:
+            saved = self.gacos_email._save_gacos(gacos, self.output_file, append=True)
+        if not saved:
+            return
+        self.gacos_email._dump_sync_state(self.output_file, sync_state)
+        for info in gacos:
+            tqdm.write(f">>> new gacos url: {info[0]}")
+            if self.output_dir is not None:
+                self._queue.put(info[0])
+
+    def _watch_imap(self, deadline: Optional[float]) -> None:
+        gacos_email = self.gacos_email
+        server = gacos_email._login_imap()
+        try:
+            supports_idle = "IDLE" in server.capabilities
+            sync_state = gacos_email._load_sync_state(self.output_file)
+            while True:
+                gacos, sync_state = gacos_email._fetch_new_imap(server, sync_state)
+                self._on_gacos(gacos, sync_state)
+                if self._should_stop(deadline):
+                    break
+                if supports_idle:
+                    imap_idle(server, self._remaining(deadline, self.idle_timeout))
+                else:
+                    self._stop.wait(self._remaining(deadline, self.poll_interval))
+                    server.noop()
+        finally:
+            try:
+                server.close()
+                server.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+    def _watch_pop3(self, deadline: Optional[float]) -> None:
+        # POP3 sessions see a snapshot of the mailbox, so log in for each poll
+        while True:
+            sync_state = self.gacos_email._load_sync_state(self.output_file)
+            gacos, sync_state = self.gacos_email._retrieve_gacos_urls_pop3(sync_state)
+            self._on_gacos(gacos, sync_state)
+            if self._should_stop(deadline):
+                break
+            self._stop.wait(self._remaining(deadline, self.poll_interval))
+
+    def _download_worker(self) -> None:
+        """Download the queued urls in batches until None is queued."""
+        stop = False
+        while not stop:
+            urls = [self._queue.get()]
+            while True:
+                try:
+                    urls.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in urls:
+                stop = True
+                urls = [url for url in urls if url is not None]
+            if len(urls) == 0:
+                continue
+
+            try:
+                with self._lock:
+                    downloader = Downloader(
+                        self.output_file,
+                        self.output_dir,
+                        urls=urls,
+                        **self.downloader_kwargs,
+                    )
+                downloader.download(**self.download_kwargs)
+            except Exception as e:
+                tqdm.write(f">>> failed download: {urls} ({e})")
+
+
+def imap_idle(server: imaplib.IMAP4, timeout: float) -> bool:
+    """Wait in IMAP IDLE state (RFC 2177) until the server reports a change of
+    the selected mailbox or `timeout` seconds passed.
+
+    Parameters
+    ----------
+    server : imaplib.IMAP4
+        The IMAP server with a selected mailbox.
+    timeout : float
+        The maximum time in seconds to wait.
+
+    Returns
+    -------
+    changed : bool
+        Whether the server reported new or expunged messages.
+    """
+    # read the socket unbuffered during IDLE, so that select() sees all the
+    # data that has not been read yet
+    sock = server.socket()
+    buffered_file = server.file
+    server.file = sock.makefile("rb", buffering=0)
+    try:
+        tag = server._new_tag()
+        server.send(tag + b" IDLE\r\n")
+        line = server.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + timeout
+        while not changed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # SSL sockets may hold decrypted data that select() does not see
+            pending = getattr(sock, "pending", lambda: 0)()
+            if not pending and not select.select([sock], [], [], remaining)[0]:
+                break
+            line = server.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            changed = b"EXISTS" in line or b"EXPUNGE" in line
+
+        server.send(b"DONE\r\n")
+        while True:
+            line = server.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.startswith(tag):
+                break
+    finally:
+        server.file = buffered_file
+    return changed
@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+from gacos.catalog import UrlCatalog, is_catalog_file
+
+GACOS = [
+    ("http://a/1.tar.gz", 30.0, 32.0, 100.0, 110.0, 10.5, ["20200113", "20200101"]),
+    ("http://a/2.tar.gz", 0.0, 1.0, 0.0, 1.0, 10.5, ["20200101"]),
+    ("http://a/3.tar.gz", 30.0, 32.0, 100.0, 110.0, 22.0, ["20200125"]),
+]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = UrlCatalog(tmp_path / "urls.sqlite")
+    assert catalog.append(GACOS) == 3
+    return catalog
+
+
+def urls(df):
+    return df["url"].tolist()
+
+
+def test_is_catalog_file():
+    assert is_catalog_file("urls.sqlite")
+    assert is_catalog_file("urls.DB")
+    assert not is_catalog_file("urls.csv")
+
+
+def test_append_ignores_known_urls(catalog):
+    # the dates of known urls are not changed either
+    assert catalog.append([(*GACOS[1][:6], ["20200113"]), GACOS[0]]) == 0
+    assert len(catalog) == 3
+    new = ("http://a/4.tar.gz", 0.0, 1.0, 0.0, 1.0, 9.0, ["20200101", "20200101"])
+    assert catalog.append([new, new]) == 1
+    assert len(catalog) == 4
+
+    df = catalog.read()
+    assert urls(df) == [g[0] for g in GACOS] + [new[0]]
+    assert df["date"].tolist() == [
+        ["20200101", "20200113"],
+        ["20200101"],
+        ["20200125"],
+        ["20200101"],
+    ]
+    assert list(df.columns) == UrlCatalog.columns + ["date"]
+
+
+def test_query_bounds(catalog):
+    # a wide and flat bounding box, so that swapped axes do not intersect
+    assert urls(catalog.query(bounds=(105, 31, 106, 31.5))) == [
+        "http://a/1.tar.gz",
+        "http://a/3.tar.gz",
+    ]
+    assert urls(catalog.query(bounds=(31, 105, 31.5, 106))) == []
+    # touching edges intersect
+    assert urls(catalog.query(bounds=(1, 1, 2, 2))) == ["http://a/2.tar.gz"]
+
+
+def test_query_times(catalog):
+    assert urls(catalog.query(times=10.6)) == ["http://a/1.tar.gz", "http://a/2.tar.gz"]
+    assert urls(catalog.query(times=[10.5 + 11 / 60, 21.9])) == ["http://a/3.tar.gz"]
+
+
+def test_query_dates(catalog):
+    df = catalog.query(dates=["20200101"])
+    assert urls(df) == ["http://a/1.tar.gz", "http://a/2.tar.gz"]
+    # all the dates of the matched urls are returned
+    assert df["date"].tolist() == [["20200101", "20200113"], ["20200101"]]
+    assert urls(catalog.query(dates=["20200125", "20200113"])) == [
+        "http://a/1.tar.gz",
+        "http://a/3.tar.gz",
+    ]
+    assert urls(catalog.query(dates=[])) == []
+
+
+def test_query_combined(catalog):
+    df = catalog.query(bounds=(105, 31, 106, 31.5), times=10.5, dates=["20200101"])
+    assert urls(df) == ["http://a/1.tar.gz"]
+    df = catalog.query(bounds=(105, 31, 106, 31.5), dates=["20200101", "20200125"])
+    assert urls(df) == ["http://a/1.tar.gz", "http://a/3.tar.gz"]
+
+
+def test_query_chunks(tmp_path):
+    catalog = UrlCatalog(tmp_path / "urls.sqlite")
+    gacos = [
+        (f"http://a/{i}.tar.gz", 0.0, 1.0, 0.0, 1.0, 10.5, [f"2020{i + 1:04d}"])
+        for i in range(10)
+    ]
+    catalog.append(gacos)
+
+    chunks = list(catalog.read(chunksize=4))
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    df = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(df, catalog.read())
+    assert df["date"].tolist() == [[g[6][0]] for g in gacos]
+
+    chunks = list(catalog.query(dates=["20200002", "20200009"], chunksize=1))
+    assert [urls(c) for c in chunks] == [["http://a/1.tar.gz"], ["http://a/8.tar.gz"]]
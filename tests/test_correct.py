@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gacos.correct import GridCache, ZTDCorrector
+from gacos.cube import ZTDCube
+
+BOUNDS = (100.0, 28.0, 102.0, 30.0)
+SHAPE = (4, 4)
+GRID_BYTES = 4 * 4 * 4
+
+
+def grid(value):
+    return np.full(SHAPE, value, dtype="float32")
+
+
+def test_cache_evicts_least_recently_used():
+    cache = GridCache(3 * GRID_BYTES)
+    for date in ("a", "b", "c"):
+        cache.put(date, grid(0))
+    assert cache.nbytes == 3 * GRID_BYTES
+
+    # "a" becomes the most recently used, so "b" is evicted first
+    assert cache.get("a") is not None
+    cache.put("d", grid(0))
+    assert "b" not in cache
+    assert [d in cache for d in "acd"] == [True, True, True]
+    assert cache.nbytes == 3 * GRID_BYTES
+
+    # a larger array evicts as many arrays as needed
+    cache.put("e", np.zeros((2, *SHAPE), dtype="float32"))
+    assert len(cache) == 2
+    assert "e" in cache and "d" in cache
+    assert cache.nbytes <= cache.max_bytes
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert cache.get("b") is None
+    assert cache.misses == 1
+
+
+def test_cache_keeps_last_array():
+    cache = GridCache(GRID_BYTES // 2)
+    cache.put("a", grid(0))
+    cache.put("b", grid(0))
+    assert len(cache) == 1 and "b" in cache
+    # replacing an array does not count it twice
+    cache.put("b", grid(1))
+    assert cache.nbytes == GRID_BYTES
+
+
+def corrector(source, pairs, **kwargs):
+    return ZTDCorrector(
+        source, pairs, from_origin(100, 30, 0.5, 0.5), "EPSG:4326", SHAPE, **kwargs
+    )
+
+
+@pytest.mark.parametrize("n_grids", [2, 3, 5])
+def test_blocks_bounded_by_cache(tmp_path, n_grids):
+    dates = [f"202001{d:02d}" for d in range(1, 13)]
+    # every pair of the first dates with each other, then a chain
+    pairs = [(d1, d2) for i, d1 in enumerate(dates[:4]) for d2 in dates[i + 1 : 4]]
+    pairs += list(zip(dates[3:-1], dates[4:]))
+    ztd = corrector(
+        ZTDCube(tmp_path, BOUNDS),
+        pairs,
+        cache_size=n_grids * GRID_BYTES,
+        block_size=4,
+    )
+    assert ztd.max_block_dates == n_grids
+
+    blocks = list(ztd._blocks(list(range(len(pairs)))))
+    assert sorted(i for block in blocks for i in block) == list(range(len(pairs)))
+    for block in blocks:
+        assert len(block) <= 4
+        assert len(np.unique(ztd.pairs[block])) <= n_grids
+
+
+def test_max_block_dates_at_least_a_pair(tmp_path):
+    ztd = corrector(ZTDCube(tmp_path, BOUNDS), [("20200101", "20200113")], cache_size=1)
+    assert ztd.max_block_dates == 2
+
+
+@pytest.mark.parametrize(
+    "tile_size, expected", [(None, 256), (1, 256), (256, 256), (300, 512)]
+)
+def test_tile_size_aligned_to_tiff_blocks(tmp_path, tile_size, expected):
+    ztd = corrector(
+        ZTDCube(tmp_path, BOUNDS), [("20200101", "20200113")], tile_size=tile_size
+    )
+    assert ztd.tile_size == expected
+    assert ztd.tile_size % ztd.tiff_block_size == 0
+
+
+def test_run_with_small_cache(tmp_path):
+    dates = [f"202001{d:02d}" for d in range(1, 8)]
+    products = {}
+    for date in dates:
+        file = tmp_path / "gacos" / f"{date}.ztd.tif"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with rasterio.open(
+            file,
+            "w",
+            driver="GTiff",
+            height=4,
+            width=4,
+            count=1,
+            dtype="float32",
+            crs="EPSG:4326",
+            transform=from_origin(100, 30, 0.5, 0.5),
+        ) as dst:
+            dst.write(grid(int(date) % 100)[None])
+        products[date] = [file]
+    cube = ZTDCube(tmp_path / "cube", BOUNDS)
+    cube.ingest(products)
+
+    pairs = [(d1, d2) for i, d1 in enumerate(dates) for d2 in dates[i + 1 : i + 3]]
+    ztd = corrector(cube, pairs, cache_size=3 * GRID_BYTES, los_up=0.5)
+    files = ztd.run(tmp_path / "out")
+    assert len(files) == len(pairs)
+    for (d1, d2), file in zip(ztd.pairs, files):
+        with rasterio.open(file) as src:
+            arr = src.read(1)
+        np.testing.assert_allclose(arr, (int(d2) - int(d1)) / 0.5)
+    assert ztd.cache.nbytes <= 3 * GRID_BYTES
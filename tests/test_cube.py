@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from gacos.cube import ZTDCube
+
+BOUNDS = (100.0, 28.0, 102.0, 30.0)
+
+
+def write_product(file, value, west=100, north=30, size=4, res=0.5):
+    """Write a 2 x 2 degrees product filled with `value`."""
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(
+        file,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, res, res),
+    ) as dst:
+        dst.write(np.full((1, size, size), value, dtype="float32"))
+
+
+def products(tmp_path, dates):
+    files = {}
+    for date in dates:
+        file = tmp_path / "gacos" / f"{date}.ztd.tif"
+        write_product(file, float(date[-2:]))
+        files[date] = [file]
+    return files
+
+
+def test_ingest_reopen_read(tmp_path):
+    cube_dir = tmp_path / "cube"
+    cube = ZTDCube(cube_dir, BOUNDS, chunk_size=2)
+    # three dates fill the first chunk and start the second one
+    first = ["20200105", "20200111", "20200117"]
+    assert cube.ingest(products(tmp_path, first)) == first
+    assert sorted(f.name for f in cube_dir.glob("chunk_*.npy")) == [
+        "chunk_0000.npy",
+        "chunk_0001.npy",
+    ]
+    # dates already in the cube are skipped, an earlier date goes to the end
+    later = ["20200101", "20200111", "20200123"]
+    assert cube.ingest(products(tmp_path, later)) == ["20200101", "20200123"]
+
+    cube = ZTDCube(cube_dir)
+    assert cube.shape == (4, 4)
+    assert cube.res == 0.5
+    assert len(cube) == 5
+    assert list(cube.dates) == [
+        "20200101",
+        "20200105",
+        "20200111",
+        "20200117",
+        "20200123",
+    ]
+
+    # read across chunks in an order unrelated to the slots
+    dates = ["20200123", "20200105", "20200101", "20200117"]
+    arr = cube.read(dates)
+    assert arr.shape == (4, 4, 4)
+    for date, grid in zip(dates, arr):
+        np.testing.assert_allclose(grid, float(date[-2:]))
+        np.testing.assert_array_equal(cube[date], grid)
+
+    window = cube.read(["20200111", "20200101"], Window(1, 2, 2, 1))
+    assert window.shape == (2, 1, 2)
+    np.testing.assert_allclose(window[:, 0, 0], [11, 1])
+
+    with pytest.raises(KeyError):
+        cube.read(["20200129"])
+    with pytest.raises(ValueError):
+        ZTDCube(cube_dir, (0, 0, 1, 1))
+
+
+def test_iter_chunks(tmp_path):
+    cube = ZTDCube(tmp_path / "cube", BOUNDS, chunk_size=2)
+    cube.ingest(products(tmp_path, ["20200105", "20200111", "20200117"]))
+    dates = ["20200117", "20200101", "20200105", "20200111"]
+    groups = list(cube.iter_chunks(dates))
+    # the date not in the cube is skipped
+    assert [idx.tolist() for idx, _, _ in groups] == [[2, 3], [0]]
+    for idx, chunk, slots in groups:
+        for i, slot in zip(idx, slots):
+            np.testing.assert_array_equal(chunk[slot], cube[dates[i]])
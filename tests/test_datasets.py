@@ -0,0 +1,44 @@
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from gacos.datasets import HyP3Dataset
+
+
+def write_unw(home_dir, name, west, north, size=4, res=0.5):
+    """Write an interferogram in its product directory, as unzipped from
+    HyP3."""
+    product_dir = home_dir / name
+    product_dir.mkdir(parents=True)
+    with rasterio.open(
+        product_dir / f"{name}_unw_phase.tif",
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, res, res),
+    ) as dst:
+        dst.write(np.zeros((1, size, size), dtype="float32"))
+
+
+def test_hyp3_bounds_union(tmp_path):
+    home_dir = tmp_path / "hyp3"
+    write_unw(
+        home_dir, "S1AA_20200101T101010_20200113T101011_VVP012_INT80_G_ueF_A", 100, 32
+    )
+    # a later interferogram of a shifted extent
+    write_unw(
+        home_dir, "S1AA_20200113T101011_20200125T101012_VVP012_INT80_G_ueF_B", 101, 33
+    )
+
+    dataset = HyP3Dataset(home_dir, cache_dir=tmp_path / "cache")
+    assert dataset.bounds == (100, 30, 103, 33)
+    assert list(dataset.dates) == ["20200101", "20200113", "20200125"]
+
+    # the cached metadata are the same
+    cached = HyP3Dataset(home_dir, cache_dir=tmp_path / "cache")
+    assert cached.bounds == dataset.bounds
+    assert list(cached.date_times) == list(dataset.date_times)
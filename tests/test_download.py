@@ -0,0 +1,420 @@
+import gzip
+import io
+import tarfile
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+import requests
+from rasterio.transform import from_origin
+
+from gacos.download import (
+    Downloader,
+    MemberFilter,
+    extract_tar_gz,
+    extract_tar_gz_stream,
+    fetch_resume,
+)
+from gacos.download import product_dir
+from gacos.journal import TransferJournal
+
+DATA = bytes(range(256)) * 40
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {} if headers is None else headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+
+class DroppedResponse(FakeResponse):
+    """A response whose connection drops after `n_bytes` of the body."""
+
+    def __init__(self, status_code, body, headers, n_bytes):
+        super().__init__(status_code, body, headers)
+        self.n_bytes = n_bytes
+
+    def iter_content(self, chunk_size=1):
+        yield self.body[: self.n_bytes]
+        raise requests.ConnectionError("connection dropped")
+
+
+class FakeSession:
+    """Serve `data` for any url, honoring Range requests unless `ranges` is
+    False."""
+
+    def __init__(self, ranges=True, data=DATA):
+        self.ranges = ranges
+        self.data = data
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def get(self, url, stream=True, timeout=None, headers=None):
+        headers = {} if headers is None else headers
+        self.requests.append(headers)
+        data = self.data
+        if not self.ranges or "Range" not in headers:
+            return FakeResponse(200, data, {"Content-Length": str(len(data))})
+        start = int(headers["Range"][len("bytes=") : -1])
+        if start >= len(data):
+            return FakeResponse(416)
+        body = data[start:]
+        return FakeResponse(206, body, {"Content-Length": str(len(body))})
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return TransferJournal(tmp_path / "journal.sqlite")
+
+
+def fetch(journal, session, part_file):
+    """Return the number of bytes received."""
+    chunks = []
+    fetch_resume(session, "url", part_file, 10, chunks.append, journal)
+    return sum(len(c) for c in chunks)
+
+
+def test_fetch_from_scratch(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    session = FakeSession()
+    assert fetch(journal, session, part_file) == len(DATA)
+    assert part_file.read_bytes() == DATA
+    assert session.requests == [{}]
+    states = journal.states()
+    assert states.loc["url", "offset"] == len(DATA)
+    assert states.loc["url", "total"] == len(DATA)
+
+
+def test_fetch_resumes_partial_file(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    part_file.write_bytes(DATA[:1000])
+    session = FakeSession()
+    assert fetch(journal, session, part_file) == len(DATA) - 1000
+    assert session.requests == [{"Range": "bytes=1000-"}]
+    assert part_file.read_bytes() == DATA
+
+
+def test_fetch_restarts_if_range_ignored(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    part_file.write_bytes(DATA[:1000])
+    session = FakeSession(ranges=False)
+    assert fetch(journal, session, part_file) == len(DATA)
+    assert part_file.read_bytes() == DATA
+    assert journal.states().loc["url", "total"] == len(DATA)
+
+
+def test_fetch_complete_file(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    part_file.write_bytes(DATA)
+    session = FakeSession()
+    assert fetch(journal, session, part_file) == 0
+    assert session.requests == [{"Range": f"bytes={len(DATA)}-"}]
+    assert part_file.read_bytes() == DATA
+
+
+def test_fetch_incomplete_response(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    session = FakeSession()
+    session.get = lambda *args, **kwargs: FakeResponse(
+        200, DATA[:100], {"Content-Length": str(len(DATA))}
+    )
+    with pytest.raises(IOError, match="incomplete download"):
+        fetch(journal, session, part_file)
+    # the bytes received are kept and recorded to be resumed
+    assert part_file.read_bytes() == DATA[:100]
+    assert journal.states().loc["url", "offset"] == 100
+
+
+def test_fetch_resumes_after_dropped_connection(journal, tmp_path):
+    part_file = tmp_path / "file.tar.gz.part"
+    session = FakeSession()
+    session.get = lambda *args, **kwargs: DroppedResponse(
+        200, DATA, {"Content-Length": str(len(DATA))}, 1000
+    )
+    with pytest.raises(requests.ConnectionError):
+        fetch(journal, session, part_file)
+    assert part_file.read_bytes() == DATA[:1000]
+    assert journal.states().loc["url", "offset"] == 1000
+
+    session = FakeSession()
+    assert fetch(journal, session, part_file) == len(DATA) - 1000
+    assert session.requests == [{"Range": "bytes=1000-"}]
+    assert part_file.read_bytes() == DATA
+    assert journal.states().loc["url", "offset"] == len(DATA)
+
+
+def make_tar_gz(members):
+    """Build a tar.gz archive in memory from a dict of name to content."""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+MEMBERS = {
+    "20200101.ztd.tif": b"a" * 3000,
+    "20200101.ztd.tif.rsc": b"b" * 10,
+    "20200113.ztd.tif": b"c" * 3000,
+    "20200113.ztd.tif.rsc": b"d" * 10,
+}
+
+
+def files_in(directory):
+    return sorted(str(f.relative_to(directory)) for f in directory.rglob("*"))
+
+
+def test_extract_stream(tmp_path):
+    out = tmp_path / "out"
+    files = extract_tar_gz_stream(io.BytesIO(make_tar_gz(MEMBERS)), out)
+    assert sorted(f.name for f in files) == sorted(MEMBERS)
+    assert files_in(out) == sorted(MEMBERS)
+    for name, content in MEMBERS.items():
+        assert (out / name).read_bytes() == content
+
+
+def test_extract_stream_bad_crc(tmp_path):
+    data = bytearray(make_tar_gz(MEMBERS))
+    # the gzip trailer is the CRC32 and the length of the uncompressed data
+    data[-8] ^= 0xFF
+    out = tmp_path / "out"
+    with pytest.raises(gzip.BadGzipFile):
+        extract_tar_gz_stream(io.BytesIO(bytes(data)), out)
+    # the members were written, but not committed and removed
+    assert files_in(out) == []
+
+
+@pytest.mark.parametrize("size", [100, 0.5, -8])
+def test_extract_stream_truncated(tmp_path, size):
+    data = make_tar_gz(MEMBERS)
+    size = int(len(data) * size) if isinstance(size, float) else size
+    out = tmp_path / "out"
+    with pytest.raises((tarfile.TarError, EOFError)):
+        extract_tar_gz_stream(io.BytesIO(data[:size]), out)
+    assert not out.exists() or files_in(out) == []
+
+
+def test_extract_stream_unsafe_members(tmp_path):
+    members = {
+        str(tmp_path / "absolute.txt"): b"x",
+        "../outside.txt": b"x",
+        "sub/../../outside.txt": b"x",
+        "sub/20200101.ztd.tif": b"a",
+    }
+    out = tmp_path / "out"
+    files = extract_tar_gz_stream(io.BytesIO(make_tar_gz(members)), out)
+    assert files == [out / "sub" / "20200101.ztd.tif"]
+    assert files_in(out) == ["sub", "sub/20200101.ztd.tif"]
+    assert not (tmp_path / "outside.txt").exists()
+    assert not (tmp_path / "absolute.txt").exists()
+
+
+@pytest.mark.parametrize(
+    "member_filter, expected",
+    [
+        (MemberFilter(), sorted(MEMBERS)),
+        (
+            MemberFilter(dates=["20200113"]),
+            ["20200113.ztd.tif", "20200113.ztd.tif.rsc"],
+        ),
+        (
+            MemberFilter(skip_dates=["20200113"]),
+            ["20200101.ztd.tif", "20200101.ztd.tif.rsc"],
+        ),
+        (MemberFilter(suffixes=[".ztd.tif"]), ["20200101.ztd.tif", "20200113.ztd.tif"]),
+        (
+            MemberFilter(["20200101", "20200113"], ["20200101"], [".ztd.tif"]),
+            ["20200113.ztd.tif"],
+        ),
+        (MemberFilter(dates=["20200125"]), []),
+    ],
+)
+def test_extract_member_filter(tmp_path, member_filter, expected):
+    gz_file = tmp_path / "file.tar.gz"
+    gz_file.write_bytes(make_tar_gz({**MEMBERS, "gacos/README.txt": b"r"}))
+    out = tmp_path / "out"
+    files = extract_tar_gz(gz_file, out, delete=True, member_filter=member_filter)
+    # files without a date in their names are only filtered by suffix
+    if member_filter.suffixes is None:
+        expected = expected + ["gacos", "gacos/README.txt"]
+    assert files_in(out) == sorted(expected)
+    assert sorted(str(f.relative_to(out)) for f in files) == [
+        e for e in sorted(expected) if e != "gacos"
+    ]
+    assert not gz_file.exists()
+
+
+def write_url_file(file, rows):
+    """Write a CSV url file as saved by :meth:`GACOSEmail.retrieve_gacos_urls`,
+    from rows of (url, south, north, west, east, time, dates)."""
+    cols = ["url", "south", "north", "west", "east", "time", "date"]
+    pd.DataFrame(rows, columns=cols).to_csv(file)
+    return file
+
+
+@pytest.fixture
+def url_file(tmp_path):
+    # a wide and flat bounding box, so that swapped axes do not intersect
+    return write_url_file(
+        tmp_path / "urls.csv",
+        [
+            ("http://a/1.tar.gz", 30.0, 32.0, 100.0, 110.0, 10.5, ["20200101"]),
+            ("http://a/2.tar.gz", 0.0, 1.0, 0.0, 1.0, 10.5, ["20200101"]),
+            ("http://a/3.tar.gz", 30.0, 32.0, 100.0, 110.0, 22.0, ["20200113"]),
+        ],
+    )
+
+
+def test_bbox_mask(url_file, tmp_path):
+    downloader = Downloader(url_file, tmp_path / "gacos")
+    mask = downloader._bbox_mask((105.0, 31.0, 106.0, 31.5))
+    assert mask.tolist() == [True, False, True]
+    # bounds in (S, W, N, E) order do not intersect
+    assert not downloader._bbox_mask((31.0, 105.0, 31.5, 106.0)).any()
+    # touching edges intersect
+    assert downloader._bbox_mask((110.0, 32.0, 111.0, 33.0)).tolist() == [
+        True,
+        False,
+        True,
+    ]
+
+
+def test_time_mask(url_file, tmp_path):
+    downloader = Downloader(url_file, tmp_path / "gacos")
+    assert downloader._time_mask(10.6).tolist() == [True, True, False]
+    assert downloader._time_mask(10.5 + 11 / 60).tolist() == [False, False, False]
+    assert downloader._time_mask([10.5, 21.9]).tolist() == [True, True, True]
+
+
+def test_masks_combined(url_file, tmp_path):
+    downloader = Downloader(
+        url_file,
+        tmp_path / "gacos",
+        bounds=(105.0, 31.0, 106.0, 31.5),
+        times=10.5,
+    )
+    assert downloader.mask.tolist() == [True, False, False]
+    downloader = Downloader(url_file, tmp_path / "gacos", dates=["20200113"])
+    assert downloader.date_mask.tolist() == [False, False, True]
+
+
+def product_bytes(tmp_path, west=100, north=32, size=4, res=0.5):
+    """The bytes of a GeoTIFF product of 2 x 2 degrees."""
+    file = tmp_path / "product.tif"
+    with rasterio.open(
+        file,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, res, res),
+    ) as dst:
+        dst.write(np.ones((1, size, size), dtype="float32"))
+    return file.read_bytes()
+
+
+@pytest.fixture
+def archive_downloader(tmp_path, monkeypatch):
+    """A Downloader of one url whose archive holds the products of two dates
+    covering the bounding box of the url."""
+    url_file = write_url_file(
+        tmp_path / "urls.csv",
+        [
+            (
+                "http://a/1.tar.gz",
+                30.0,
+                32.0,
+                100.0,
+                102.0,
+                10.5,
+                ["20200101", "20200113"],
+            )
+        ],
+    )
+    product = product_bytes(tmp_path)
+    session = FakeSession(
+        data=make_tar_gz({"20200101.ztd.tif": product, "20200113.ztd.tif": product})
+    )
+    monkeypatch.setattr(Downloader, "_create_session", lambda self, n: session)
+
+    def create(**kwargs):
+        return Downloader(url_file, tmp_path / "gacos", **kwargs)
+
+    return create
+
+
+def test_download_verified_url_needed_again(archive_downloader, tmp_path):
+    out = product_dir(tmp_path / "gacos", (100.0, 30.0, 102.0, 32.0))
+    downloader = archive_downloader(dates=["20200101"])
+    downloader.download()
+    assert downloader.failed == {}
+    assert sorted(f.name for f in out.iterdir()) == ["20200101.ztd.tif"]
+    assert downloader.journal.state("http://a/1.tar.gz") == "verified"
+
+    # the other date of the archive is still needed
+    downloader = archive_downloader(dates=["20200113"])
+    assert downloader.mask.tolist() == [True]
+    downloader.download()
+    assert sorted(f.name for f in out.iterdir()) == [
+        "20200101.ztd.tif",
+        "20200113.ztd.tif",
+    ]
+
+    # all dates are downloaded
+    downloader = archive_downloader()
+    assert downloader.mask.tolist() == [False]
+
+    # deleted products are downloaded again
+    (out / "20200101.ztd.tif").unlink()
+    downloader = archive_downloader()
+    assert downloader.mask.tolist() == [True]
+    downloader.download()
+    assert sorted(f.name for f in out.iterdir()) == [
+        "20200101.ztd.tif",
+        "20200113.ztd.tif",
+    ]
+
+
+def test_download_flat_layout(archive_downloader, tmp_path):
+    # products extracted directly into output_dir by earlier versions
+    flat_dir = tmp_path / "gacos"
+    flat_dir.mkdir()
+    (flat_dir / "20200101.ztd.tif").write_bytes(product_bytes(tmp_path))
+
+    downloader = archive_downloader()
+    assert downloader.mask.tolist() == [True]
+    downloader.download()
+    # only the date that is not covered by the flat products is extracted
+    out = product_dir(flat_dir, (100.0, 30.0, 102.0, 32.0))
+    assert sorted(f.name for f in out.iterdir()) == ["20200113.ztd.tif"]
+
+    (flat_dir / "20200113.ztd.tif").write_bytes(product_bytes(tmp_path))
+    (out / "20200113.ztd.tif").unlink()
+    downloader = archive_downloader()
+    assert downloader.mask.tolist() == [False]
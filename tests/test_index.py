@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gacos.index import ProductIndex, covered_fraction
+
+
+def write_product(file, west, north, size=4, res=0.5):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(
+        file,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, res, res),
+    ) as dst:
+        dst.write(np.ones((1, size, size), dtype="float32"))
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Record the directories scanned by :meth:`ProductIndex.refresh`."""
+    scanned = []
+    scan = ProductIndex._scan_directory
+
+    def spy(self, conn, dir_path):
+        scanned.append(dir_path)
+        return scan(self, conn, dir_path)
+
+    monkeypatch.setattr(ProductIndex, "_scan_directory", spy)
+    return scanned
+
+
+def test_refresh_is_incremental(tmp_path, scans):
+    write_product(tmp_path / "20200101.ztd.tif", 100, 30)
+    write_product(tmp_path / "a" / "20200102.ztd.tif", 100, 30)
+    write_product(tmp_path / "b" / "20200103.ztd.tif", 100, 30)
+    index = ProductIndex(tmp_path)
+
+    index.refresh()
+    assert len(scans) == 3
+    assert list(index.dates) == ["20200101", "20200102", "20200103"]
+
+    scans.clear()
+    index.refresh()
+    index.refresh()
+    assert scans == []
+
+    # only the changed directory is listed again
+    write_product(tmp_path / "a" / "20200104.ztd.tif", 100, 30)
+    index.refresh()
+    assert scans == [str(tmp_path / "a")]
+    assert "20200104" in index.dates
+
+
+def test_refresh_removed_products(tmp_path, scans):
+    write_product(tmp_path / "a" / "20200101.ztd.tif", 100, 30)
+    write_product(tmp_path / "b" / "20200102.ztd.tif", 100, 30)
+    index = ProductIndex(tmp_path)
+    index.refresh()
+
+    (tmp_path / "a" / "20200101.ztd.tif").unlink()
+    (tmp_path / "a").rmdir()
+    index.refresh()
+    assert list(index.dates) == ["20200102"]
+
+
+def test_refresh_ignores_other_files(tmp_path):
+    write_product(tmp_path / "20200101.ztd.tif", 100, 30)
+    (tmp_path / "20200101.ztd.tif.rsc").write_text("")
+    (tmp_path / "notes.ztd.tif").write_text("")
+    index = ProductIndex(tmp_path)
+    index.refresh()
+    assert len(index.query()) == 1
+
+
+def test_coverage(tmp_path):
+    # two products of 2 x 2 degrees side by side
+    write_product(tmp_path / "20200101.ztd.tif", 100, 30)
+    write_product(tmp_path / "a" / "20200101.ztd.tif", 102, 30)
+    write_product(tmp_path / "20200102.ztd.tif", 100, 30)
+    (tmp_path / "20200103.ztd.tif").write_bytes(b"truncated")
+    index = ProductIndex(tmp_path)
+    index.refresh()
+
+    df = index.coverage((100.5, 28.5, 103.5, 29.5), ["20200101", "20200102"])
+    assert df.loc["20200101", "coverage"] == pytest.approx(1)
+    assert len(df.loc["20200101", "products"]) == 2
+    # the product bounds are extended by the tolerance (0.01 degrees)
+    assert df.loc["20200102", "coverage"] == pytest.approx(0.5, abs=0.01)
+
+    df = index.coverage((100.5, 28.5, 101.5, 29.5), ["20200103", "20200104"])
+    # unreadable products and missing dates cover nothing
+    assert (df["coverage"] == 0).all()
+    assert df.loc["20200103", "products"] == []
+
+
+def test_coverage_overlapping_tiles(tmp_path):
+    # two products of 2 x 2 degrees overlapping by 1 degree
+    write_product(tmp_path / "a" / "20200101.ztd.tif", 100, 30)
+    write_product(tmp_path / "b" / "20200101.ztd.tif", 101, 30)
+    index = ProductIndex(tmp_path)
+    index.refresh()
+
+    df = index.coverage((100.5, 28.5, 102.5, 29.5))
+    assert list(df.index) == ["20200101"]
+    assert df.loc["20200101", "coverage"] == pytest.approx(1)
+    assert len(df.loc["20200101", "products"]) == 2
+    # the overlap is not counted twice
+    df = index.coverage((99, 28, 104, 30), tolerance=0)
+    assert df.loc["20200101", "coverage"] == pytest.approx(3 * 2 / (5 * 2))
+
+
+def test_coverage_gap_between_tiles(tmp_path):
+    # two products of 2 x 2 degrees with a gap of 0.5 degree
+    write_product(tmp_path / "a" / "20200101.ztd.tif", 100, 30)
+    write_product(tmp_path / "b" / "20200101.ztd.tif", 102.5, 30)
+    index = ProductIndex(tmp_path)
+    index.refresh()
+
+    df = index.coverage((101, 28.5, 103.5, 29.5), tolerance=0)
+    assert df.loc["20200101", "coverage"] == pytest.approx(2 / 2.5)
+    # a bounding box inside the gap is not covered at all
+    df = index.coverage((102.1, 28.5, 102.4, 29.5))
+    assert df.loc["20200101", "coverage"] == 0
+    assert df.loc["20200101", "products"] == []
+
+
+def test_covered_fraction():
+    bounds = (0, 0, 2, 2)
+    assert covered_fraction(bounds, []) == 0
+    assert covered_fraction(bounds, [(-1, -1, 3, 3)]) == 1
+    assert covered_fraction(bounds, [(0, 0, 1, 2)]) == pytest.approx(0.5)
+    assert covered_fraction(bounds, [(0, 0, 1, 1), (1, 1, 2, 2)]) == pytest.approx(0.5)
+    # partial rectangles covering the bounds together
+    assert covered_fraction(bounds, [(0, 0, 1, 2), (1, 0, 2, 2)]) == 1
+    assert covered_fraction(
+        bounds, [(0, 0, 1, 1), (1, 0, 2, 1), (0, 1, 2, 2)]
+    ) == pytest.approx(1)
+    # a gap between rectangles
+    assert covered_fraction(bounds, [(0, 0, 0.5, 2), (1.5, 0, 2, 2)]) == pytest.approx(
+        0.5
+    )
+    # the overlap is counted once
+    assert covered_fraction(bounds, [(0, 0, 1.5, 2), (0.5, 0, 2, 2)]) == 1
+    assert covered_fraction(bounds, [(0, 0, 1, 1), (0, 0, 1, 1)]) == pytest.approx(0.25)
+    # rectangles outside the bounds
+    assert covered_fraction(bounds, [(3, 3, 4, 4)]) == 0
+    assert covered_fraction((0, 0, 0, 2), [(0, 0, 1, 1)]) == 0
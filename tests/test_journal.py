@@ -0,0 +1,49 @@
+from gacos.journal import TransferJournal
+
+
+def test_states_transitions(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    assert journal.state("a") is None
+
+    journal.add_pending(["a", "b"])
+    assert journal.state("a") == "pending"
+    assert journal.states().loc["a", "offset"] == 0
+
+    journal.update("a", "downloading", file="a.part", offset=10, total=100)
+    journal.update("a", "downloading", offset=50)
+    row = journal.states().loc["a"]
+    assert row["state"] == "downloading"
+    # arguments that are None keep their recorded values
+    assert (row["file"], row["offset"], row["total"]) == ("a.part", 50, 100)
+
+    for state in ("downloaded", "extracted", "verified"):
+        journal.update("a", state)
+        assert journal.state("a") == state
+    assert journal.states().loc["a", "offset"] == 50
+
+
+def test_add_pending_keeps_known_urls(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    journal.update("a", "verified")
+    journal.add_pending(["a", "b"])
+    assert journal.state("a") == "verified"
+    assert journal.state("b") == "pending"
+
+
+def test_reset_to_pending(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    journal.update("a", "downloading", offset=50)
+    journal.update("a", "pending", offset=0)
+    assert journal.state("a") == "pending"
+    assert journal.states().loc["a", "offset"] == 0
+
+
+def test_states_of_urls(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    journal.add_pending(["a", "b", "c"])
+    assert sorted(journal.states(["a", "c", "d"]).index) == ["a", "c"]
+
+
+def test_persistent(tmp_path):
+    TransferJournal(tmp_path / "journal.sqlite").update("a", "downloaded")
+    assert TransferJournal(tmp_path / "journal.sqlite").state("a") == "downloaded"
@@ -0,0 +1,81 @@
+import pytest
+
+from gacos.ledger import SubmissionLedger, match_time_tolerance, time_to_hours
+
+BOUNDS = (100.0, 30.0, 102.0, 32.0)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SubmissionLedger(tmp_path / "ledger.sqlite")
+    ledger.record(BOUNDS, "10:30", ["20200101", "20200113"], "submitted")
+    return ledger
+
+
+def states(ledger):
+    return ledger.states().set_index("date")["state"].to_dict()
+
+
+def test_time_to_hours():
+    assert time_to_hours("10:30") == pytest.approx(10.5)
+    assert time_to_hours("10:30:59") == pytest.approx(10.5)
+    assert time_to_hours(10.5) == 10.5
+
+
+def test_mark_within_time_tolerance(ledger):
+    # the time in emails may differ from the submitted one by a few minutes
+    assert match_time_tolerance == pytest.approx(10 / 60)
+    assert ledger.mark(BOUNDS, "10:39", ["20200101"], "received") == 1
+    assert states(ledger) == {"20200101": "received", "20200113": "submitted"}
+
+
+def test_mark_beyond_time_tolerance(ledger):
+    assert ledger.mark(BOUNDS, "10:41", ["20200101"], "received") == 0
+    assert ledger.mark(BOUNDS, 10.5 - 11 / 60, ["20200101"], "received") == 0
+    assert ledger.mark(BOUNDS, "10:41", ["20200101"], "received", time_tolerance=0.2)
+    assert states(ledger)["20200101"] == "received"
+
+
+def test_mark_bbox_tolerance(ledger):
+    rounded = (100.0004, 29.9996, 102.0, 32.0)
+    assert ledger.mark(rounded, "10:30", ["20200101"], "received") == 1
+    shifted = (100.01, 30.0, 102.0, 32.0)
+    assert ledger.mark(shifted, "10:30", ["20200113"], "received") == 0
+
+
+def test_mark_never_moves_back(ledger):
+    ledger.mark(BOUNDS, "10:30", ["20200101"], "downloaded", url="http://a.tar.gz")
+    assert ledger.mark(BOUNDS, "10:35", ["20200101"], "received") == 0
+    row = ledger.states().set_index("date").loc["20200101"]
+    assert (row["state"], row["url"]) == ("downloaded", "http://a.tar.gz")
+
+
+def test_mark_insert(ledger):
+    assert ledger.mark(BOUNDS, "10:30", ["20200125"], "received") == 0
+    assert ledger.mark(BOUNDS, "10:30", ["20200125"], "received", insert=True) == 1
+    assert states(ledger)["20200125"] == "received"
+    # matched dates are not inserted again
+    assert ledger.mark(BOUNDS, "10:31", ["20200125"], "received", insert=True) == 0
+    assert len(ledger.states()) == 3
+
+
+def test_pending_time_tolerance(ledger):
+    assert list(ledger.pending(BOUNDS, "10:30")) == ["20200101", "20200113"]
+    # pending dates are matched exactly unless a tolerance is given
+    assert list(ledger.pending(BOUNDS, "10:35")) == []
+    assert list(ledger.pending(BOUNDS, "10:35", time_tolerance=5 / 60)) == [
+        "20200101",
+        "20200113",
+    ]
+    assert list(ledger.pending(BOUNDS, "10:36", time_tolerance=5 / 60)) == []
+
+
+def test_pending_states_and_timeout(ledger):
+    ledger.mark(BOUNDS, "10:30", ["20200101"], "downloaded")
+    assert list(ledger.pending(BOUNDS, "10:30")) == ["20200113"]
+    ledger.record(BOUNDS, "10:30", ["20200113"], "failed")
+    assert list(ledger.pending(BOUNDS, "10:30")) == []
+
+    ledger.record(BOUNDS, "10:30", ["20200125"], "acknowledged")
+    assert list(ledger.pending(BOUNDS, "10:30", timeout=3600)) == ["20200125"]
+    assert list(ledger.pending(BOUNDS, "10:30", timeout=-1)) == []
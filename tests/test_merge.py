@@ -0,0 +1,71 @@
+import pandas as pd
+
+from gacos.datasets import SarDataset
+from gacos.merge import MergedDataset, merge_datasets
+
+
+def make_dataset(bounds, date_times):
+    return SarDataset(bounds, pd.DatetimeIndex(date_times))
+
+
+def overlapping_frames():
+    # adjacent frames of a track, acquired seconds apart on the shared dates
+    frame1 = make_dataset(
+        (100, 30, 102, 32),
+        ["2020-01-01 10:05:10", "2020-01-13 10:05:10", "2020-01-25 10:05:10"],
+    )
+    frame2 = make_dataset(
+        (101, 31.5, 103, 33.5),
+        ["2020-01-13 10:05:40", "2020-01-25 10:05:40", "2020-02-06 10:05:40"],
+    )
+    return frame1, frame2
+
+
+def test_merge_overlapping_frames():
+    frame1, frame2 = overlapping_frames()
+    merged = merge_datasets([frame1, frame2], time_tolerance=10)
+    assert len(merged) == 1
+    dataset = merged[0]
+    assert dataset.members == [frame1, frame2]
+    assert dataset.bounds == (100, 30, 103, 33.5)
+    assert list(dataset.dates) == ["20200101", "20200113", "20200125", "20200206"]
+    assert list(dataset.times) == ["10:05", "10:06"]
+
+    plan = dataset.plan_patches(mode="all")
+    assert sorted(d for ds in plan.patches.values() for p in ds for d in p) == list(
+        dataset.dates
+    )
+    # every frame still gets the products of its dates
+    assert len(dataset.frames) == 6
+    assert dataset.serves("20200113") == [frame1, frame2]
+    assert dataset.serves("20200206") == [frame2]
+
+
+def test_merge_identical_acquisitions():
+    frame1, _ = overlapping_frames()
+    frame2 = make_dataset((101, 29, 103, 31), frame1.date_times)
+    dataset = MergedDataset([frame1, frame2])
+    assert dataset.bounds == (100, 29, 103, 32)
+    assert list(dataset.date_times) == list(frame1.date_times)
+
+
+def test_merge_keeps_distinct_times():
+    # acquisitions of a date further apart than the tolerance are both kept
+    frame1, frame2 = overlapping_frames()
+    dataset = MergedDataset([frame1, frame2], time_tolerance=0)
+    assert list(dataset.dates) == [
+        "20200101",
+        "20200113",
+        "20200113",
+        "20200125",
+        "20200125",
+        "20200206",
+    ]
+
+
+def test_merge_separate_frames():
+    frame1, _ = overlapping_frames()
+    far = make_dataset((120, 30, 122, 32), frame1.date_times)
+    late = make_dataset((101, 31, 103, 33), ["2020-01-13 22:30:00"])
+    merged = merge_datasets([frame1, far, late], time_tolerance=10)
+    assert [m.members for m in merged] == [[frame1], [far], [late]]
@@ -0,0 +1,233 @@
+import email
+import imaplib
+import importlib.util
+import mailbox
+import random
+from pathlib import Path
+
+import pytest
+
+from gacos import parse_email
+from gacos.parse_email import (
+    GACOSEmail,
+    LoginError,
+    get_content,
+    imap_fetch,
+    iter_content,
+    mail_archive_spans,
+    parse_gacos_info,
+    parse_gacos_info_fast,
+)
+
+_bench_file = Path(__file__).parents[1] / "benchmarks" / "bench_parse_email.py"
+_spec = importlib.util.spec_from_file_location("bench_parse_email", _bench_file)
+bench = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench)
+
+
+@pytest.fixture(scope="module")
+def messages():
+    # plain text, HTML and multipart/alternative messages in turn
+    return [email.message_from_string(raw) for raw in bench.make_corpus(60)]
+
+
+def test_parsers_agree_on_single_parts(messages):
+    for msg in messages:
+        if msg.is_multipart():
+            continue
+        body = get_content(msg)
+        info = parse_gacos_info(body)
+        assert info is not None
+        assert parse_gacos_info_fast(body) == info
+
+
+def test_parsers_agree_on_multiparts(messages):
+    for msg in messages:
+        if not msg.is_multipart():
+            continue
+        body = get_content(msg)
+        # the fast parser drops the dates repeated by the HTML part
+        assert parse_gacos_info_fast(body) == bench.normalize(parse_gacos_info(body))
+        assert parse_gacos_info_fast(iter_content(msg)) == parse_gacos_info_fast(body)
+
+
+def test_parsers_agree_without_gacos_info():
+    body = ["Dear user,\n\nyour request is in the queue.\n"]
+    assert parse_gacos_info(body) is None
+    assert parse_gacos_info_fast(body) is None
+
+
+class FakeIMAP:
+    """Answer UID FETCH commands with a fixed response."""
+
+    def __init__(self, data):
+        self.data = data
+        self.commands = []
+
+    def uid(self, command, *args):
+        self.commands.append((command, *args))
+        return "OK", self.data
+
+
+def test_imap_fetch_uid_before_literal():
+    server = FakeIMAP(
+        [
+            (b"1 (UID 11 BODY[TEXT] {5}", b"first"),
+            b")",
+            (b"2 (UID 12 BODY[TEXT] {6}", b"second"),
+            b")",
+        ]
+    )
+    contents = imap_fetch(server, [b"12", b"11"], "BODY.PEEK[TEXT]")
+    # in the order of the requested uids
+    assert list(contents.items()) == [("12", "second"), ("11", "first")]
+    assert server.commands == [("FETCH", "12,11", "(BODY.PEEK[TEXT])")]
+
+
+def test_imap_fetch_uid_after_literal():
+    server = FakeIMAP(
+        [
+            (b"1 (BODY[TEXT] {5}", b"first"),
+            b" UID 11)",
+            (b"2 (BODY[TEXT] {6}", b"second"),
+            b" UID 12)",
+        ]
+    )
+    contents = imap_fetch(server, ["11", "12"], "BODY.PEEK[TEXT]")
+    assert contents == {"11": "first", "12": "second"}
+
+
+def test_imap_fetch_without_uid():
+    server = FakeIMAP(
+        [
+            (b"1 (BODY[TEXT] {5}", b"first"),
+            b")",
+            (b"2 (UID 12 BODY[TEXT] {6}", b"second"),
+            b")",
+        ]
+    )
+    with pytest.warns(UserWarning, match="No UID"):
+        contents = imap_fetch(server, ["11", "12"], "BODY.PEEK[TEXT]")
+    assert contents == {"12": "second"}
+
+
+class LoginIMAP:
+    """Accept the login of one user and record the logins."""
+
+    error = imaplib.IMAP4.error
+    abort = imaplib.IMAP4.abort
+    logins = []
+
+    def __init__(self, host, port):
+        self.host = host
+
+    def login(self, username, password):
+        self.logins.append((username, password))
+        if password != "secret":
+            raise imaplib.IMAP4.error("AUTHENTICATIONFAILED")
+
+    def select(self, mailbox, readonly=False):
+        return "OK", [b"1"]
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    answers = []
+    monkeypatch.setattr(LoginIMAP, "logins", [])
+    monkeypatch.setattr(parse_email.imaplib, "IMAP4", LoginIMAP)
+    monkeypatch.setattr("builtins.input", lambda prompt: answers.append(prompt) or "me")
+    monkeypatch.setattr(
+        parse_email.getpass,
+        "getpass",
+        lambda prompt: answers.append(prompt) or "secret",
+    )
+    return answers
+
+
+def test_login_prompts_once(prompts):
+    gacos_email = GACOSEmail(None, None, "imap.example.com", prompt=True)
+    for _ in range(3):
+        gacos_email._login_imap()
+    assert prompts == ["username: ", "password: "]
+    assert LoginIMAP.logins == [("me", "secret")] * 3
+
+
+def test_login_failed(prompts):
+    gacos_email = GACOSEmail("me", "wrong", "imap.example.com")
+    with pytest.raises(LoginError, match="imap.example.com"):
+        gacos_email._login_imap()
+    assert prompts == []
+
+
+@pytest.fixture(scope="module")
+def archive_messages():
+    # the last message has a body line starting with "From ", which is escaped
+    # as ">From " in mbox files
+    body = bench.make_body(random.Random(1), 99) + "From the GACOS Team\n"
+    raw = (
+        f"From: {bench.SENDER}\n"
+        "Subject: GACOS data\n"
+        "Date: Mon, 01 Jan 2024 12:00:00 +0000\n"
+        "Content-Type: text/plain; charset=utf-8\n"
+        "\n" + body
+    )
+    other = "From: someone@example.com\nSubject: hello\n\nFrom me\n"
+    return bench.make_corpus(4) + [other, raw]
+
+
+def expected_gacos(messages):
+    gacos_email = GACOSEmail.from_archive("unused")
+    infos = [gacos_email._parse_raw(raw) for raw in messages]
+    return [info for info in infos if info is not None]
+
+
+def retrieve_archive(path):
+    gacos, sync_state = GACOSEmail.from_archive(path)._retrieve_gacos_urls_file()
+    assert sync_state == {"protocol": "file"}
+    return gacos
+
+
+def test_archive_mbox(tmp_path, archive_messages):
+    mbox_file = tmp_path / "inbox.mbox"
+    mbox = mailbox.mbox(mbox_file)
+    for raw in archive_messages:
+        mbox.add(raw)
+    mbox.flush()
+    assert b"\n>From the GACOS Team" in mbox_file.read_bytes()
+
+    spans = mail_archive_spans(mbox_file)
+    assert len(spans) == len(archive_messages)
+    gacos = retrieve_archive(mbox_file)
+    assert gacos == expected_gacos(archive_messages)
+    assert len(gacos) == len(archive_messages) - 1
+
+
+def test_archive_maildir(tmp_path, archive_messages):
+    maildir = mailbox.Maildir(tmp_path / "Maildir")
+    for n, raw in enumerate(archive_messages):
+        msg = mailbox.MaildirMessage(raw)
+        # both read and unread messages are found
+        msg.set_subdir("cur" if n % 2 else "new")
+        maildir.add(msg)
+
+    spans = mail_archive_spans(tmp_path / "Maildir")
+    assert len(spans) == len(archive_messages)
+    gacos = retrieve_archive(tmp_path / "Maildir")
+    # messages are ordered by file name instead of arrival
+    assert sorted(gacos) == sorted(expected_gacos(archive_messages))
+
+
+def test_archive_eml(tmp_path, archive_messages):
+    (tmp_path / "2024").mkdir()
+    for n, raw in enumerate(archive_messages):
+        folder = tmp_path / "2024" if n % 2 else tmp_path
+        (folder / f"{n:03d}.eml").write_text(raw)
+    (tmp_path / "notes.txt").write_text("not an email")
+
+    spans = mail_archive_spans(tmp_path)
+    assert len(spans) == len(archive_messages)
+    gacos = retrieve_archive(tmp_path)
+    assert sorted(gacos) == sorted(expected_gacos(archive_messages))
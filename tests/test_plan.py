@@ -0,0 +1,45 @@
+import pytest
+
+from gacos.plan import PatchPlanner
+
+
+def test_cluster_times_identical():
+    planner = PatchPlanner(time_tolerance=0)
+    members = planner.cluster_times(["10:05", "10:06", "10:05"])
+    assert members == {"10:05": ["10:05"], "10:06": ["10:06"]}
+
+
+def test_cluster_times_tolerance():
+    planner = PatchPlanner(time_tolerance=5)
+    members = planner.cluster_times(["10:05", "10:11", "10:15", "10:30"])
+    # a cluster spans at most 2 * tolerance, centered on its representative
+    assert members == {
+        "10:10": ["10:05", "10:11", "10:15"],
+        "10:30": ["10:30"],
+    }
+
+
+def test_cluster_times_within_tolerance():
+    planner = PatchPlanner(time_tolerance=3)
+    times = [f"10:{m:02d}" for m in range(0, 30, 2)]
+    members = planner.cluster_times(times)
+    assert sorted(t for ts in members.values() for t in ts) == sorted(times)
+    for _time, ts in members.items():
+        h, m = map(int, _time.split(":"))
+        for t in ts:
+            th, tm = map(int, t.split(":"))
+            assert abs((th * 60 + tm) - (h * 60 + m)) <= 3
+
+
+def test_plan_splits_evenly():
+    planner = PatchPlanner(capacity=4)
+    dates = [f"202001{d:02d}" for d in range(1, 11)]
+    plan = planner.plan(dates, ["10:05"] * len(dates))
+    assert [len(p) for p in plan.patches["10:05"]] == [4, 3, 3]
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        PatchPlanner(capacity=0)
+    with pytest.raises(ValueError):
+        PatchPlanner(time_tolerance=-1)
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from gacos.rate import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveRateLimiter(
+        rate=10.0,
+        max_rate=20.0,
+        min_rate=2.5,
+        increase=2.5,
+        decrease=0.5,
+        backoff=0.05,
+        max_backoff=0.15,
+    )
+
+
+def test_additive_increase(limiter):
+    limiter.success()
+    assert limiter.rate == pytest.approx(12.5)
+    limiter.success()
+    assert limiter.rate == pytest.approx(15)
+    # the rate stops at max_rate
+    for _ in range(10):
+        limiter.success()
+    assert limiter.rate == pytest.approx(20)
+
+
+def test_multiplicative_decrease(limiter):
+    limiter.failure()
+    assert limiter.rate == pytest.approx(5)
+    limiter.failure()
+    assert limiter.rate == pytest.approx(2.5)
+    # the rate stops at min_rate
+    limiter.failure()
+    assert limiter.rate == pytest.approx(2.5)
+    # and increases additively again after a success
+    limiter.success()
+    assert limiter.rate == pytest.approx(5)
+
+
+def test_failure_backoff(limiter):
+    limiter.failure()
+    assert 0 < limiter.paused <= 0.05
+    # the backoff doubles with consecutive failures, up to max_backoff
+    limiter.failure()
+    assert 0.05 < limiter.paused <= 0.1
+    limiter.failure()
+    assert 0.1 < limiter.paused <= 0.15
+    # unless the server asks to wait longer
+    limiter.failure(retry_after=0.3)
+    assert 0.15 < limiter.paused <= 0.3
+    # no request is allowed before the pause ends
+    assert limiter.acquire() >= 0.15
+
+
+def test_success_resets_backoff(limiter):
+    limiter.failure()
+    limiter.failure()
+    limiter.success()
+    time.sleep(limiter.paused)
+    limiter.failure()
+    assert limiter.paused <= 0.05
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        AdaptiveRateLimiter(min_rate=1, max_rate=0.5)
+    with pytest.raises(ValueError):
+        AdaptiveRateLimiter(decrease=1)
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from gacos.retry import RetryQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return RetryQueue(tmp_path / "retry.sqlite", max_attempts=3, backoff=0.01)
+
+
+def test_next_claims(queue):
+    queue.put([{"n": 1}, {"n": 2}])
+    assert len(queue) == 2
+    first = queue.next()
+    second = queue.next()
+    assert {first[1]["n"], second[1]["n"]} == {1, 2}
+    # claimed posts are not returned again
+    assert queue.next() is None
+    assert len(queue) == 0
+    assert len(queue.items("running")) == 2
+
+
+def test_put_keeps_queued_posts(queue):
+    queue.put([{"n": 1}])
+    item_id, _, _ = queue.next()
+    queue.put([{"n": 1}])
+    assert queue.next() is None
+    queue.done(item_id)
+    # finished posts are queued again
+    queue.put([{"n": 1}])
+    assert queue.next()[0] == item_id
+
+
+def test_release(queue):
+    queue.put([{"n": 1}])
+    item_id, _, _ = queue.next()
+    queue.release(item_id)
+    assert queue.next()[0] == item_id
+    assert queue.items().loc[item_id, "attempts"] == 0
+
+
+def test_recover(queue, tmp_path):
+    queue.put([{"n": 1}, {"n": 2}])
+    queue.next()
+    queue.next()
+    # a new process finds the posts left running
+    queue = RetryQueue(tmp_path / "retry.sqlite")
+    assert queue.recover() == 2
+    assert len(queue) == 2
+    assert queue.recover() == 0
+
+
+def test_fail_backoff(queue):
+    queue.put([{"n": 1}])
+    item_id, _, _ = queue.next()
+    now = time.time()
+    assert queue.fail(item_id, "timeout")
+    item = queue.items().loc[item_id]
+    assert item["state"] == "queued"
+    assert item["attempts"] == 1
+    assert item["error"] == "timeout"
+    assert now <= item["next_attempt"] <= time.time() + 0.01
+
+
+def test_fail_max_attempts(queue):
+    queue.put([{"n": 1}])
+    for _ in range(2):
+        item_id, _, _ = queue.next()
+        assert queue.fail(item_id, "timeout")
+    item_id, _, _ = queue.next()
+    assert not queue.fail(item_id, "timeout")
+    assert queue.next() is None
+    assert queue.items("permanent").loc[item_id, "attempts"] == 3
+
+
+def test_fail_permanent(queue):
+    queue.put([{"n": 1}])
+    item_id, _, _ = queue.next()
+    assert not queue.fail(item_id, "not found", transient=False)
+    assert len(queue.items("permanent")) == 1
+    assert queue.next() is None
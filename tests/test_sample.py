@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gacos.cube import ZTDCube
+from gacos.index import ProductIndex
+from gacos.sample import PointSampler, bilinear_weights
+
+BOUNDS = (100.0, 28.0, 102.0, 30.0)
+TRANSFORM = from_origin(100, 30, 0.5, 0.5)
+SHAPE = (4, 4)
+
+
+def field(offset=0.0):
+    """A grid linear in rows and columns, which bilinear interpolation
+    reproduces exactly."""
+    rows, cols = np.mgrid[: SHAPE[0], : SHAPE[1]]
+    return (offset + 10 * rows + cols).astype("float32")
+
+
+def value_at(lon, lat, offset=0.0):
+    # the positions relative to the pixel centers
+    col = (lon - 100) / 0.5 - 0.5
+    row = (30 - lat) / 0.5 - 0.5
+    return offset + 10 * row + col
+
+
+def write_product(file, arr):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(
+        file,
+        "w",
+        driver="GTiff",
+        height=SHAPE[0],
+        width=SHAPE[1],
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=TRANSFORM,
+    ) as dst:
+        dst.write(arr[None])
+
+
+# pixel center, between centers, and an arbitrary interior point
+INTERIOR = ([100.25, 100.5, 101.1], [29.75, 29.25, 28.6])
+# within half a pixel of the west, north, east and south edges
+EDGE = ([100.1, 100.75, 101.95, 101.3], [29.0, 29.9, 29.0, 28.05])
+# clamped to the nearest row or column of pixel centers
+EDGE_CLAMPED = ([100.25, 100.75, 101.75, 101.3], [29.0, 29.75, 29.0, 28.25])
+OUTSIDE = ([99.9, 101.0, 102.1], [29.0, 30.1, 29.0])
+
+
+def interpolate(lons, lats):
+    rows, cols, weights, valid = bilinear_weights(TRANSFORM, SHAPE, lons, lats)
+    return (field()[rows, cols] * weights).sum(axis=1), valid
+
+
+def test_bilinear_weights_interior():
+    rows, cols, weights, valid = bilinear_weights(TRANSFORM, SHAPE, *INTERIOR)
+    assert valid.all()
+    np.testing.assert_allclose(weights.sum(axis=1), 1)
+    # a pixel center takes all the weight of its pixel
+    assert weights[0][(rows[0] == 0) & (cols[0] == 0)].item() == pytest.approx(1)
+    values, _ = interpolate(*INTERIOR)
+    np.testing.assert_allclose(values, value_at(*map(np.array, INTERIOR)))
+
+
+def test_bilinear_weights_edges():
+    values, valid = interpolate(*EDGE)
+    assert valid.all()
+    np.testing.assert_allclose(values, value_at(*map(np.array, EDGE_CLAMPED)))
+    _, valid = interpolate(*OUTSIDE)
+    assert not valid.any()
+
+
+def test_sample_cube(tmp_path):
+    dates = ["20200101", "20200113", "20200125"]
+    files = {}
+    for n, date in enumerate(dates):
+        files[date] = [tmp_path / "gacos" / f"{date}.ztd.tif"]
+        write_product(files[date][0], field(100 * n))
+    # the dates are split into two chunks
+    cube = ZTDCube(tmp_path / "cube", BOUNDS, chunk_size=2)
+    cube.ingest(files)
+
+    lons = INTERIOR[0] + EDGE[0] + OUTSIDE[0][:1]
+    lats = INTERIOR[1] + EDGE[1] + OUTSIDE[1][:1]
+    sampler = PointSampler(lons, lats)
+    values = sampler.sample_cube(cube, ["20200125", "20200201", "20200101"])
+    assert values.shape == (len(sampler), 3)
+
+    expected = value_at(
+        np.array(INTERIOR[0] + EDGE_CLAMPED[0]),
+        np.array(INTERIOR[1] + EDGE_CLAMPED[1]),
+    )
+    np.testing.assert_allclose(values[:-1, 0], expected + 200, rtol=1e-6)
+    np.testing.assert_allclose(values[:-1, 2], expected, atol=1e-4)
+    # dates not in the cube and points outside the grid are NaN
+    assert np.isnan(values[:, 1]).all()
+    assert np.isnan(values[-1]).all()
+
+    # the products give the same values
+    index = ProductIndex(tmp_path / "gacos")
+    from_products = sampler.sample_products(index, ["20200125", "20200201", "20200101"])
+    np.testing.assert_allclose(from_products, values, atol=1e-4)